@@ -3,6 +3,9 @@ import os
 sys.path.insert(0, os.path.dirname(__file__))
 
 try:
+    from .file_finder import *
+    from .parsing import *
+    from .readers import *
     from .static_plotter import *
     from .statistical_analyzer import *
     from .utils import *
@@ -0,0 +1,274 @@
+""" Module containing vectorized versions of the statistics of the class StatisticalAnalyzer. The functions work on
+arrays holding one sample per row (class weights of shape (n_samples, n_sieves)), so that whole batches of samples
+(or thousands of perturbed realizations of one sample) are evaluated without creating dataframes.
+
+Author: Beatriz Negreiros
+
+"""
+from sedimentanalyst.analyzer.config import *
+from sedimentanalyst.analyzer import hydraulics
+
+# characteristic grain sizes computed by default
+DEFAULT_PERCENTILES = [10, 16, 25, 30, 50, 60, 75, 84, 90]
+
+# characteristic grain sizes needed by the other statistics (dg, sorting index, Cu, Cc and porosity estimators),
+# always computed in addition to the user-defined percentiles
+REQUIRED_PERCENTILES = [10, 16, 30, 50, 60, 84]
+
+# statistics computed after the characteristic grain sizes, in the order of StatisticalAnalyzer.statistics_df
+STATISTIC_NAMES = ["Mean Grain Size dm [mm]", "Geometrical mean dg [mm]", "Sorting Index 1 ds", "Fredle - Index",
+                   "Grain Size std", "Geometric Standard Deviation", "Skewness", "Kurtosis",
+                   "Coefficient of uniformity - Cu", "Curvature coefficient - Cc"]
+
+# cumulative percentages on which the grain sizes are interpolated for the moments (every 0.25%)
+INTERPOLATION_GRID = np.linspace(0, 100, 401)
+
+# grain size [mm] of the sieve passing fraction in the porosity estimator of Frings et al. (2011), i.e., the sieve
+# of row 9 in the template sieve set
+FRINGS_SIEVE = 0.5
+
+
+def percentile_name(percent=None):
+    """
+    Name of a characteristic grain size, e.g., "d50" for 50 % or "d2.5" for 2.5 %.
+
+    Args:
+        percent (float): cumulative percentage [%]
+
+    Returns:
+        str: statistic name
+    """
+    return "d{0:g}".format(float(percent))
+
+
+def characteristic_percentiles(percentiles=DEFAULT_PERCENTILES):
+    """
+    Completes a set of user-defined percentiles with the REQUIRED_PERCENTILES.
+
+    Args:
+        percentiles (list): cumulative percentages [%] of the characteristic grain sizes (e.g., [5, 35, 65, 95])
+
+    Returns:
+        np.array: sorted unique cumulative percentages [%]
+    """
+    percents = np.union1d(np.asarray(percentiles, dtype=float), REQUIRED_PERCENTILES)
+    if np.isnan(percents).any() or percents.min() < 0 or percents.max() > 100:
+        raise ValueError("Percentiles must lie between 0 and 100, got {0}.".format(list(percentiles)))
+    return percents
+
+
+def percentile_columns(df=None):
+    """
+    Lists the characteristic grain size columns (d10, d50, d84, ...) of the global summary, in their order.
+
+    Args:
+        df (df): global summary (see utils.append_global)
+
+    Returns:
+        list: column names
+    """
+    return [c for c in df.columns if isinstance(c, str) and re.fullmatch(r"d\d+(\.\d+)?", c)]
+
+
+def batch_interp(x=None, xp=None, fp=None):
+    """
+    Row-wise linear interpolation with the same semantics as np.interp (values outside of xp are clipped to the
+    first or last value of fp).
+
+    Args:
+        x (np.array): points to evaluate, shape (k,) or (n, k)
+        xp (np.array): increasing x coordinates of each row, shape (n, m)
+        fp (np.array): y coordinates of each row, shape (n, m)
+
+    Returns:
+        np.array: interpolated values, shape (n, k). Rows of xp or fp containing NaN give NaN.
+    """
+    xp = np.atleast_2d(np.asarray(xp, dtype=float))
+    fp = np.atleast_2d(np.asarray(fp, dtype=float))
+    x = np.broadcast_to(np.asarray(x, dtype=float), (xp.shape[0],) + np.shape(x)[-1:])
+    m = xp.shape[1]
+
+    # index of the last xp smaller or equal to x (as np.searchsorted(side="right") - 1 for each row), counted
+    # column by column to avoid a (n, k, m) temporary array
+    j = np.full(x.shape, -1, dtype=np.intp)
+    for c in range(m):
+        j += xp[:, c:c + 1] <= x
+    j = np.clip(j, 0, m - 2)
+    rows = np.arange(xp.shape[0])[:, None]
+    x0, x1 = xp[rows, j], xp[rows, j + 1]
+    y0, y1 = fp[rows, j], fp[rows, j + 1]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (y1 - y0) / (x1 - x0)
+        result = slope * (x - x0) + y0
+        # repeated xp (np.interp evaluates the upper end of the interval then)
+        result = np.where(np.isnan(result), slope * (x - x1) + y1, result)
+        result = np.where(np.isnan(result) & (y0 == y1), y0, result)
+
+    # clip to the bounds of xp
+    result = np.where(x < xp[:, :1], fp[:, :1], result)
+    result = np.where(x >= xp[:, -1:], fp[:, -1:], result)
+    invalid = np.isnan(xp).any(axis=1) | np.isnan(fp).any(axis=1)
+    result[invalid] = np.nan
+    return result
+
+
+def percentage_fractions(weights=None):
+    """
+    Computes the percentage fraction [%] of each class weight.
+
+    Args:
+        weights (np.array): class weights [g] ordered from the largest to the smallest sieve, shape (n, n_sieves)
+
+    Returns:
+        np.array: percentage fractions [%], shape (n, n_sieves)
+    """
+    weights = np.atleast_2d(np.asarray(weights, dtype=float))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return 100 * weights / weights.sum(axis=-1, keepdims=True)
+
+
+def cumulative_percentages(fractions=None):
+    """
+    Computes the cumulative percentage [%] of each sieve (sum of the fractions of the sieve and all smaller sieves),
+    as in StatisticalAnalyzer.compute_cumulative_df.
+
+    Args:
+        fractions (np.array): percentage fractions [%] ordered from the largest to the smallest sieve
+
+    Returns:
+        np.array: cumulative percentages [%], same shape as fractions
+    """
+    return np.cumsum(fractions[..., ::-1], axis=-1)[..., ::-1]
+
+
+def grain_sizes_at(grain_sizes=None, cumulative=None, percents=DEFAULT_PERCENTILES):
+    """
+    Inverts the cumulative grain size distribution, i.e., computes the grain sizes for given cumulative
+    percentages (e.g., percents=[50] gives d50) for all samples at once.
+
+    Args:
+        grain_sizes (np.array): sieve diameters [mm] ordered from the largest to the smallest sieve, shape
+            (n_sieves,) or (n, n_sieves)
+        cumulative (np.array): cumulative percentages [%], shape (n, n_sieves)
+        percents (list): cumulative percentages to invert
+
+    Returns:
+        np.array: grain sizes [mm], shape (n, len(percents))
+    """
+    cumulative = np.atleast_2d(cumulative)
+    grain_sizes = np.broadcast_to(np.asarray(grain_sizes, dtype=float), cumulative.shape)
+    return batch_interp(x=np.asarray(percents, dtype=float), xp=cumulative[:, ::-1], fp=grain_sizes[:, ::-1])
+
+
+def passing_at(grain_sizes=None, cumulative=None, size=FRINGS_SIEVE):
+    """
+    Cumulative percentage [%] at a given grain size, interpolated log-linearly between sieves.
+
+    Args:
+        grain_sizes (np.array): sieve diameters [mm] ordered from the largest to the smallest sieve
+        cumulative (np.array): cumulative percentages [%], shape (n, n_sieves)
+        size (float): grain size [mm]
+
+    Returns:
+        np.array: cumulative percentages [%], shape (n,)
+    """
+    cumulative = np.atleast_2d(cumulative)
+    grain_sizes = np.broadcast_to(np.asarray(grain_sizes, dtype=float), cumulative.shape)
+    return batch_interp(x=[np.log(size)], xp=np.log(grain_sizes[:, ::-1]), fp=cumulative[:, ::-1])[:, 0]
+
+
+def geometric_standard_deviation(grain_sizes=None, fractions=None):
+    """
+    Computes the geometric standard deviation by Frings et al. (2011) for all samples at once.
+
+    Args:
+        grain_sizes (np.array): sieve diameters [mm] ordered from the largest to the smallest sieve
+        fractions (np.array): percentage fractions [%], shape (n, n_sieves)
+
+    Returns:
+        np.array: geometric standard deviations, shape (n,)
+    """
+    fractions = np.atleast_2d(fractions)
+    grain_sizes = np.broadcast_to(np.asarray(grain_sizes, dtype=float), fractions.shape)
+
+    # fractions retained between each sieve and the next larger one, with the mean phi of both sieves
+    shifted = np.concatenate([np.zeros((fractions.shape[0], 1)), fractions[:, :-1]], axis=1) / 100
+    teta = -np.log2(grain_sizes)
+    teta_i = np.concatenate([np.full((fractions.shape[0], 1), np.nan), (teta[:, 1:] + teta[:, :-1]) / 2], axis=1)
+    mean_teta = np.nansum(teta_i * shifted, axis=1, keepdims=True)
+    return np.sqrt(np.nansum(shifted * (teta_i - mean_teta) ** 2, axis=1))
+
+
+def compute_statistics(grain_sizes=None, weights=None, percentiles=DEFAULT_PERCENTILES):
+    """
+    Computes the statistics of StatisticalAnalyzer.compute_statistics_df for a batch of samples.
+
+    Args:
+        grain_sizes (np.array): sieve diameters [mm] ordered from the largest to the smallest sieve, shape
+            (n_sieves,) if shared by all samples or (n, n_sieves)
+        weights (np.array): class weights [g], shape (n, n_sieves)
+        percentiles (list): characteristic grain sizes to compute (completed with the REQUIRED_PERCENTILES)
+
+    Returns:
+        dict: arrays of shape (n,) keyed by the statistic names used in StatisticalAnalyzer.statistics_df, plus
+            "fractions" and "cumulative" arrays of shape (n, n_sieves)
+    """
+    fractions = percentage_fractions(weights)
+    cumulative = cumulative_percentages(fractions)
+
+    # characteristic grain sizes and grain sizes every 0.25% of cumulative percentage (for the moments of the
+    # distribution) in a single inversion of the curves
+    percents = characteristic_percentiles(percentiles)
+    inverted = grain_sizes_at(grain_sizes, cumulative, percents=np.concatenate([percents, INTERPOLATION_GRID]))
+    ds, interpolated = inverted[:, :len(percents)], inverted[:, len(percents):]
+
+    results = {}
+    for k, s in enumerate(percents):
+        results[percentile_name(s)] = ds[:, k]
+
+    d10, d16, d30, d60, d84 = (results[name] for name in ["d10", "d16", "d30", "d60", "d84"])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        results["Mean Grain Size dm [mm]"] = 0.0025 * interpolated.sum(axis=1)
+        results["Geometrical mean dg [mm]"] = np.sqrt(d16 * d84)
+        results["Sorting Index 1 ds"] = np.sqrt(d84 / d16)
+        results["Fredle - Index"] = results["Geometrical mean dg [mm]"] / results["Sorting Index 1 ds"]
+        results["Grain Size std"] = np.nanstd(interpolated, axis=1)
+        results["Geometric Standard Deviation"] = geometric_standard_deviation(grain_sizes, fractions)
+        results["Skewness"] = stats.skew(interpolated, axis=1)
+        results["Kurtosis"] = stats.kurtosis(interpolated, axis=1)
+        results["Coefficient of uniformity - Cu"] = d60 / d10
+        results["Curvature coefficient - Cc"] = d30 ** 2 / (d60 * d10)
+
+    results["fractions"] = fractions
+    results["cumulative"] = cumulative
+    return results
+
+
+def compute_porosity_conductivity(grain_sizes=None, statistics=None, user_porosity=np.nan, sf=6.1):
+    """
+    Computes the porosity estimators and corresponding kf of StatisticalAnalyzer.porosity_conductivity_df for a
+    batch of samples.
+
+    Args:
+        grain_sizes (np.array): sieve diameters [mm] ordered from the largest to the smallest sieve
+        statistics (dict): output of compute_statistics
+        user_porosity (np.array): porosity given by the user for each sample (np.nan if not available)
+        sf (np.array): sphericity index of each sample or scalar
+
+    Returns:
+        dict: arrays of shape (n,) keyed by "<estimator> [Porosity]" and "<estimator> [Estimated kf]", as in the
+            columns of the global summary (see utils.append_global)
+    """
+    deff_cm = hydraulics.effective_diameter(grain_sizes=grain_sizes, fractions=statistics["fractions"])
+    cumulative_5mm = passing_at(grain_sizes, statistics["cumulative"], size=FRINGS_SIEVE) / 100
+    porosity, kf = hydraulics.porosity_conductivity(d50=statistics["d50"],
+                                                    geometric_std=statistics["Geometric Standard Deviation"],
+                                                    cumulative_5mm=cumulative_5mm, deff_cm=deff_cm,
+                                                    user_porosity=user_porosity, sf=sf)
+    results = {}
+    for k, name in enumerate(hydraulics.POROSITY_AUTHORS + ["User input"]):
+        results["{} [Porosity]".format(name)] = porosity[:, k]
+    for k, name in enumerate(hydraulics.POROSITY_AUTHORS + ["User input"]):
+        results["{} [Estimated kf]".format(name)] = kf[:, k]
+    return results
@@ -0,0 +1,223 @@
+""" Module containing the paired comparison of sampling campaigns (e.g., before and after flushing) with vectorized
+bootstrap confidence intervals and sign-flip permutation tests
+
+Author: Beatriz Negreiros
+
+"""
+from sedimentanalyst.analyzer.config import *
+from sedimentanalyst.analyzer.file_finder import CAMPAIGN_KEYWORDS
+
+# columns of the global summary that are not statistics
+METADATA_COLUMNS = ["sample name", "date", "lat", "lon", "facies"]
+
+# name tokens of repeated sievings of the same sample (averaged with the original sample)
+REPLICATE_TOKENS = ["rep"]
+
+
+def location_key(name=None):
+    """
+    Derives the sampling location of a sample from its (file) name by removing the campaign keywords, e.g.,
+    "MS3_FC1-1_vorspü" and "MS3_FC1-1_nachspü" both give "MS3_FC1-1".
+
+    Args:
+        name (str): sample or file name (without extension)
+
+    Returns:
+        str: location key
+    """
+    drop = [keyword for keywords in CAMPAIGN_KEYWORDS.values() for keyword in keywords] + REPLICATE_TOKENS
+    tokens = re.split(r"[_\s]+", unicodedata.normalize("NFC", str(name)))
+    return "_".join(token for token in tokens if token and token.lower() not in drop)
+
+
+def statistic_columns(df=None):
+    """
+    Lists the numeric statistic columns of the global summary (metadata and cumulative percentage columns, which
+    are named after the sieve diameters, are excluded).
+
+    Args:
+        df (df): global summary (see utils.append_global)
+
+    Returns:
+        list: column names
+    """
+    return [c for c in df.columns if isinstance(c, str) and c not in METADATA_COLUMNS]
+
+
+def paired_differences(df=None, campaigns=None, locations=None, pre="pre-flush", post="post-flush", columns=None):
+    """
+    Pairs the samples of two campaigns by location and computes the differences (post - pre) of all statistics.
+    Several samples of the same location and campaign (e.g., repetitions) are averaged.
+
+    Args:
+        df (df): global summary (see utils.append_global)
+        campaigns (list): campaign of each row of df (e.g., from file_finder.infer_campaign)
+        locations (list): location key of each row of df (e.g., from location_key)
+        pre (str): name of the reference campaign
+        post (str): name of the compared campaign
+        columns (list): statistics to compare (default: statistic_columns(df))
+
+    Returns:
+        tuple: list of paired locations, array of pre values, array of post values (both with shape
+            (n_pairs, n_columns)) and list of columns
+    """
+    columns = statistic_columns(df) if columns is None else columns
+    values = df[columns].apply(pd.to_numeric, errors="coerce")
+    values["campaign"] = list(campaigns)
+    values["location"] = list(locations)
+
+    means = values.groupby(["campaign", "location"])[columns].mean()
+    if pre not in means.index.get_level_values(0) or post not in means.index.get_level_values(0):
+        return [], np.empty((0, len(columns))), np.empty((0, len(columns))), columns
+    pre_values = means.loc[pre]
+    post_values = means.loc[post]
+    paired = pre_values.index.intersection(post_values.index)
+    return list(paired), pre_values.loc[paired].to_numpy(), post_values.loc[paired].to_numpy(), columns
+
+
+def bootstrap_mean(diffs=None, n_resamples=10000, confidence=0.95, seed=None):
+    """
+    Bootstrap confidence intervals of the mean paired difference of all statistics at once.
+
+    Args:
+        diffs (np.array): paired differences, shape (n_pairs, n_columns); NaN values are ignored
+        n_resamples (int): number of bootstrap resamples
+        confidence (float): confidence level of the interval
+        seed (int): seed of the random generator
+
+    Returns:
+        tuple: arrays of the lower and upper bounds of the interval, shape (n_columns,)
+    """
+    return _percentile_interval(_bootstrap_means(diffs, n_resamples=n_resamples, seed=seed), confidence)
+
+
+def permutation_test(diffs=None, n_resamples=10000, seed=None):
+    """
+    Two-sided sign-flip permutation test of a zero mean paired difference, for all statistics at once.
+
+    Args:
+        diffs (np.array): paired differences, shape (n_pairs, n_columns); NaN values are ignored
+        n_resamples (int): number of random sign flips
+        seed (int): seed of the random generator
+
+    Returns:
+        np.array: p-values, shape (n_columns,)
+    """
+    return _p_values(diffs, _permutation_exceedances(diffs, n_resamples=n_resamples, seed=seed), n_resamples)
+
+
+def _bootstrap_means(diffs=None, n_resamples=10000, seed=None, chunk_size=5000):
+    """
+    Resampled means of the paired differences. Each resample is represented by multinomial counts of the pairs,
+    so that the means of all statistics are obtained with one matrix product per chunk of resamples.
+
+    Returns:
+        np.array: resampled means, shape (n_resamples, n_columns)
+    """
+    rng = np.random.default_rng(seed)
+    n_pairs = diffs.shape[0]
+    valid = ~np.isnan(diffs)
+    filled = np.where(valid, diffs, 0.0)
+
+    means = []
+    for start in range(0, n_resamples, chunk_size):
+        counts = rng.multinomial(n_pairs, np.full(n_pairs, 1 / n_pairs), size=min(chunk_size, n_resamples - start))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            means.append((counts @ filled) / (counts @ valid))
+    return np.concatenate(means)
+
+
+def _permutation_exceedances(diffs=None, n_resamples=10000, seed=None, chunk_size=5000):
+    """
+    Number of random sign flips whose absolute mean difference is at least the observed one.
+
+    Returns:
+        np.array: counts, shape (n_columns,)
+    """
+    rng = np.random.default_rng(seed)
+    valid = ~np.isnan(diffs)
+    filled = np.where(valid, diffs, 0.0)
+    n_valid = valid.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        observed = np.abs(filled.sum(axis=0) / n_valid)
+
+    exceed = np.zeros(diffs.shape[1])
+    for start in range(0, n_resamples, chunk_size):
+        signs = rng.choice([-1.0, 1.0], size=(min(chunk_size, n_resamples - start), diffs.shape[0]))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            permuted = np.abs((signs @ filled) / n_valid)
+        # tolerance for flips that reproduce the observed mean up to rounding errors
+        exceed += (permuted >= observed * (1 - 1e-12)).sum(axis=0)
+    return exceed
+
+
+def _percentile_interval(means, confidence):
+    alpha = (1 - confidence) / 2
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        return np.nanquantile(means, alpha, axis=0), np.nanquantile(means, 1 - alpha, axis=0)
+
+
+def _p_values(diffs, exceed, n_resamples):
+    p_values = (exceed + 1) / (n_resamples + 1)
+    p_values[(~np.isnan(diffs)).sum(axis=0) == 0] = np.nan
+    return p_values
+
+
+def compare_campaigns(df=None, campaigns=None, locations=None, pre="pre-flush", post="post-flush", columns=None,
+                      n_resamples=10000, confidence=0.95, seed=None, n_jobs=1):
+    """
+    Compares two sampling campaigns: pairs the samples by location, and computes the mean paired difference of all
+    statistics with bootstrap confidence intervals and permutation p-values.
+
+    Args:
+        df (df): global summary (see utils.append_global)
+        campaigns (list): campaign of each row of df
+        locations (list): location key of each row of df
+        pre (str): name of the reference campaign
+        post (str): name of the compared campaign
+        columns (list): statistics to compare (default: statistic_columns(df))
+        n_resamples (int): number of bootstrap resamples and of permutations
+        confidence (float): confidence level of the bootstrap intervals
+        seed (int): seed of the random generators
+        n_jobs (int): number of worker processes (the resamples are split among them)
+
+    Returns:
+        df: one row per statistic with the columns "Name", "Pairs", "Mean pre", "Mean post", "Mean difference",
+            "CI low", "CI high" and "p-value"
+    """
+    paired, pre_values, post_values, columns = paired_differences(df=df, campaigns=campaigns, locations=locations,
+                                                                  pre=pre, post=post, columns=columns)
+    if len(paired) < 2:
+        logging.warning("Less than two locations sampled in both campaigns {0} and {1}.".format(pre, post))
+        return pd.DataFrame(columns=["Name", "Pairs", "Mean pre", "Mean post", "Mean difference", "CI low",
+                                     "CI high", "p-value"])
+    diffs = post_values - pre_values
+
+    # independent random streams for the permutation test and the bootstrap
+    permutation_seed, bootstrap_seed = np.random.SeedSequence(seed).spawn(2)
+    if n_jobs > 1:
+        # split the resamples among the workers, with independent random streams
+        from concurrent.futures import ProcessPoolExecutor
+        shares = [len(share) for share in np.array_split(np.arange(n_resamples), n_jobs)]
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            exceed = sum(executor.map(_permutation_exceedances, [diffs] * n_jobs, shares,
+                                      permutation_seed.spawn(n_jobs)))
+            means = np.concatenate(list(executor.map(_bootstrap_means, [diffs] * n_jobs, shares,
+                                                     bootstrap_seed.spawn(n_jobs))))
+    else:
+        exceed = _permutation_exceedances(diffs, n_resamples=n_resamples, seed=permutation_seed)
+        means = _bootstrap_means(diffs, n_resamples=n_resamples, seed=bootstrap_seed)
+    p_values = _p_values(diffs, exceed, n_resamples)
+    ci_low, ci_high = _percentile_interval(means, confidence)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        return pd.DataFrame({"Name": columns,
+                             "Pairs": (~np.isnan(diffs)).sum(axis=0),
+                             "Mean pre": np.nanmean(pre_values, axis=0),
+                             "Mean post": np.nanmean(post_values, axis=0),
+                             "Mean difference": np.nanmean(diffs, axis=0),
+                             "CI low": ci_low,
+                             "CI high": ci_high,
+                             "p-value": p_values})
@@ -0,0 +1,212 @@
+""" Module containing the clustering of large sample collections into sediment facies (mini-batch k-means and
+hierarchical clustering with bounded memory)
+
+Author: Beatriz Negreiros
+
+"""
+from sedimentanalyst.analyzer.config import *
+from sedimentanalyst.analyzer.harmonization import DEFAULT_GRID, resample_curves
+from sedimentanalyst.analyzer.similarity_index import DEFAULT_FEATURES
+from scipy.cluster import hierarchy
+
+# name of the facies column added to the global summary
+FACIES_COLUMN = "facies"
+
+
+def feature_matrix(df=None, mode="features", grid=DEFAULT_GRID, features=DEFAULT_FEATURES):
+    """
+    Builds the vectors describing each sample of the global summary for the clustering.
+
+    Args:
+        df (df): global summary (see utils.append_global)
+        mode (str): "features" for the log transformed and standardized statistics, "curve" for the cumulative
+            curves resampled onto a common sieve grid
+        grid (np.array): common sieve grid [mm] (curve mode)
+        features (list): names of the statistic columns (features mode)
+
+    Returns:
+        np.array: vectors with shape (n_samples, n_dimensions); rows that cannot be represented contain NaN
+    """
+    if mode == "curve":
+        return resample_curves(df, grid=grid)
+    if mode != "features":
+        raise ValueError("Unknown clustering mode {0}, use 'features' or 'curve'.".format(mode))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = np.log(df[list(features)].to_numpy(dtype=float))
+    values[~np.isfinite(values)] = np.nan
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        std = np.nanstd(values, axis=0)
+        std[~(std > 0)] = 1
+        return (values - np.nanmean(values, axis=0)) / std
+
+
+def assign_labels(vectors=None, centers=None, chunk_size=2000000):
+    """
+    Assigns each vector to its nearest center. The vectors are processed in chunks, so that the distance matrix
+    never exceeds chunk_size entries.
+
+    Args:
+        vectors (np.array): shape (n_samples, n_dimensions)
+        centers (np.array): shape (n_centers, n_dimensions)
+        chunk_size (int): maximum number of vector-center distances computed at once
+
+    Returns:
+        np.array: index of the nearest center of each vector, shape (n_samples,)
+    """
+    labels = np.empty(vectors.shape[0], dtype=np.intp)
+    center_norms = (centers ** 2).sum(axis=1)
+    n_rows = max(1, chunk_size // centers.shape[0])
+    for start in range(0, vectors.shape[0], n_rows):
+        chunk = vectors[start:start + n_rows]
+        # squared distances up to the (constant) norm of each vector
+        labels[start:start + n_rows] = np.argmin(center_norms - 2 * chunk @ centers.T, axis=1)
+    return labels
+
+
+def minibatch_kmeans(vectors=None, n_clusters=5, batch_size=1024, max_iter=200, tol=1e-4, seed=None,
+                     chunk_size=2000000):
+    """
+    Mini-batch k-means (Sculley, 2010). The centers are initialized with k-means++ on a random subsample and then
+    updated with random batches of batch_size vectors, each center moving towards the mean of its batch members
+    with a learning rate given by the inverse of the number of vectors it received so far.
+
+    Args:
+        vectors (np.array): shape (n_samples, n_dimensions), without NaN
+        n_clusters (int): number of clusters
+        batch_size (int): number of vectors per iteration
+        max_iter (int): maximum number of iterations
+        tol (float): the iterations stop when no center moves more than tol
+        seed (int): seed of the random generator
+        chunk_size (int): maximum number of vector-center distances computed at once (see assign_labels)
+
+    Returns:
+        tuple: centers with shape (n_clusters, n_dimensions) and label of each vector, shape (n_samples,)
+    """
+    rng = np.random.default_rng(seed)
+    n_samples = vectors.shape[0]
+    n_clusters = min(n_clusters, n_samples)
+    subsample = vectors[rng.choice(n_samples, size=min(n_samples, 10 * batch_size), replace=False)]
+    centers = _kmeans_plus_plus(subsample, n_clusters, rng)
+
+    counts = np.zeros(n_clusters)
+    for _ in range(max_iter):
+        batch = vectors[rng.integers(0, n_samples, size=min(batch_size, n_samples))]
+        labels = assign_labels(batch, centers, chunk_size=chunk_size)
+        n_batch = np.bincount(labels, minlength=n_clusters)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, batch)
+        counts += n_batch
+        hit = n_batch > 0
+        rate = n_batch[hit] / counts[hit]
+        new_centers = centers.copy()
+        new_centers[hit] += rate[:, None] * (sums[hit] / n_batch[hit, None] - centers[hit])
+        shift = np.abs(new_centers - centers).max()
+        centers = new_centers
+        if shift < tol:
+            break
+    return centers, assign_labels(vectors, centers, chunk_size=chunk_size)
+
+
+def hierarchical_clustering(vectors=None, n_clusters=5, method="ward", max_leaves=1000, seed=None):
+    """
+    Agglomerative clustering cut into n_clusters. Since the linkage needs memory quadratic in the number of leaves,
+    large collections are first reduced to max_leaves mini-batch k-means centers, which are then linked (unweighted)
+    and their labels passed on to their members.
+
+    Args:
+        vectors (np.array): shape (n_samples, n_dimensions), without NaN
+        n_clusters (int): number of clusters
+        method (str): linkage method of scipy.cluster.hierarchy.linkage (e.g., "ward", "average", "complete")
+        max_leaves (int): maximum number of leaves of the dendrogram
+        seed (int): seed of the random generator of the mini-batch k-means
+
+    Returns:
+        np.array: label of each vector, shape (n_samples,)
+    """
+    if vectors.shape[0] <= max_leaves:
+        leaves, members = vectors, np.arange(vectors.shape[0])
+    else:
+        leaves, members = minibatch_kmeans(vectors, n_clusters=max_leaves, batch_size=4 * max_leaves, seed=seed)
+    if leaves.shape[0] < 2:
+        return np.zeros(vectors.shape[0], dtype=np.intp)
+    tree = hierarchy.linkage(leaves, method=method)
+    leaf_labels = hierarchy.fcluster(tree, t=n_clusters, criterion="maxclust") - 1
+    return leaf_labels[members]
+
+
+def classify_facies(df=None, n_facies=5, method="kmeans", mode="features", grid=DEFAULT_GRID,
+                    features=DEFAULT_FEATURES, seed=None, **kwargs):
+    """
+    Groups the samples of the global summary into sediment facies. The facies are numbered from 1 (finest) by
+    increasing median d50 of their samples, so that the labels do not depend on the random initialization.
+
+    Args:
+        df (df): global summary (see utils.append_global)
+        n_facies (int): number of facies
+        method (str): "kmeans" (mini-batch k-means) or "hierarchical"
+        mode (str): "features" or "curve" (see feature_matrix)
+        grid (np.array): common sieve grid [mm] (curve mode)
+        features (list): names of the statistic columns (features mode)
+        seed (int): seed of the random generator
+        kwargs: further arguments of minibatch_kmeans or hierarchical_clustering
+
+    Returns:
+        pd.Series: facies of each sample (nullable integers, missing for samples that could not be represented),
+            with the index of df
+    """
+    vectors = feature_matrix(df, mode=mode, grid=grid, features=features)
+    valid = ~np.isnan(vectors).any(axis=1)
+    if not valid.all():
+        logging.warning("{0} samples could not be classified.".format(int((~valid).sum())))
+    facies = pd.Series(pd.NA, index=df.index, dtype="Int64", name=FACIES_COLUMN)
+    if not valid.any():
+        return facies
+
+    if method == "kmeans":
+        labels = minibatch_kmeans(vectors[valid], n_clusters=n_facies, seed=seed, **kwargs)[1]
+    elif method == "hierarchical":
+        labels = hierarchical_clustering(vectors[valid], n_clusters=n_facies, seed=seed, **kwargs)
+    else:
+        raise ValueError("Unknown clustering method {0}, use 'kmeans' or 'hierarchical'.".format(method))
+
+    # number the facies by increasing median d50
+    d50 = df["d50"].to_numpy(dtype=float)[valid] if "d50" in df else vectors[valid, 0]
+    medians = pd.Series(d50).groupby(labels).median().sort_values()
+    order = np.zeros(labels.max() + 1, dtype=np.int64)
+    order[medians.index.to_numpy()] = np.arange(1, len(medians) + 1)
+    facies.iloc[np.flatnonzero(valid)] = order[labels]
+    return facies
+
+
+def add_facies(df=None, **kwargs):
+    """
+    Appends (or replaces) the facies column of the global summary.
+
+    Args:
+        df (df): global summary (see utils.append_global)
+        kwargs: arguments of classify_facies
+
+    Returns:
+        df: global summary with the column FACIES_COLUMN
+    """
+    df = df.copy()
+    df[FACIES_COLUMN] = classify_facies(df, **kwargs)
+    return df
+
+
+def _kmeans_plus_plus(vectors, n_clusters, rng):
+    """
+    Chooses initial centers spread over the vectors (Arthur and Vassilvitskii, 2007).
+
+    """
+    centers = [vectors[rng.integers(vectors.shape[0])]]
+    distances = ((vectors - centers[0]) ** 2).sum(axis=1)
+    for _ in range(1, n_clusters):
+        total = distances.sum()
+        if total == 0:
+            centers.append(vectors[rng.integers(vectors.shape[0])])
+            continue
+        centers.append(vectors[rng.choice(vectors.shape[0], p=distances / total)])
+        distances = np.minimum(distances, ((vectors - centers[-1]) ** 2).sum(axis=1))
+    return np.array(centers)
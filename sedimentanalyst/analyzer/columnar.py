@@ -0,0 +1,173 @@
+""" Module containing the typed columnar storage of the global summary: the summary is normalized to a stable schema
+(text metadata and float statistics) and written as Arrow IPC or Parquet file, which is read back memory-mapped and
+only for the required columns.
+
+Author: Beatriz Negreiros
+
+"""
+import threading
+import time
+
+import pyarrow as pa
+import pyarrow.ipc
+import pyarrow.parquet
+
+from sedimentanalyst.analyzer.config import *
+
+# text columns of the global summary, all other columns are stored as floats
+TEXT_COLUMNS = ["sample name", "date"]
+
+# key of the original column names (e.g., the float sieve diameters) in the metadata of the Arrow schema
+COLUMNS_KEY = b"sedimentanalyst.columns"
+
+# file formats and extensions of the stored summaries
+FORMATS = {"arrow": ".arrow",
+           "parquet": ".parquet",
+           }
+
+
+def normalize_summary(df=None, text_columns=TEXT_COLUMNS):
+    """
+    Casts the global summary to a stable schema: the text columns become strings (None if empty) and all other
+    columns become floats (NaN if not numeric), independently of the dtypes resulting from the parsing.
+
+    Args:
+        df (pandas.core.frame.DataFrame): global summary (see utils.append_global)
+        text_columns (list): names of the text columns
+
+    Returns:
+        pandas.core.frame.DataFrame: normalized copy of the summary
+    """
+    columns = {}
+    for c in df.columns:
+        if c in text_columns:
+            columns[c] = pd.Series([None if pd.isna(v) else str(v) for v in df[c]], index=df.index, dtype=object)
+        else:
+            columns[c] = pd.to_numeric(df[c], errors="coerce").astype(float)
+    normalized = pd.DataFrame(columns, index=df.index)
+    normalized.columns = df.columns
+    return normalized.reset_index(drop=True)
+
+
+def to_arrow(df=None, text_columns=TEXT_COLUMNS):
+    """
+    Converts the global summary into an Arrow table. Arrow only accepts string column names, thus the original
+    names are kept in the schema metadata.
+
+    Args:
+        df (pandas.core.frame.DataFrame): global summary
+        text_columns (list): names of the text columns (see normalize_summary)
+
+    Returns:
+        pyarrow.Table: table with the normalized summary
+    """
+    df = normalize_summary(df, text_columns=text_columns)
+    names = [c.item() if isinstance(c, np.generic) else c for c in df.columns]
+    arrays = [pa.array(df[c].to_numpy(), type=pa.string() if c in text_columns else pa.float64())
+              for c in df.columns]
+    schema = pa.schema([pa.field(str(name), array.type) for name, array in zip(names, arrays)],
+                       metadata={COLUMNS_KEY: json.dumps(names).encode()})
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def from_arrow(table=None):
+    """
+    Converts an Arrow table written by to_arrow back into the global summary, restoring the original column names.
+
+    Args:
+        table (pyarrow.Table): table (or a selection of its columns)
+
+    Returns:
+        pandas.core.frame.DataFrame: global summary
+    """
+    metadata = table.schema.metadata or {}
+    names = json.loads(metadata[COLUMNS_KEY]) if COLUMNS_KEY in metadata else table.column_names
+    original = {str(name): name for name in names}
+    df = table.to_pandas()
+    df.columns = [original.get(c, c) for c in table.column_names]
+    return df
+
+
+def write_summary(df=None, path=None, file_format="arrow"):
+    """
+    Writes the global summary in a columnar file (the extension of FORMATS is appended to the path).
+
+    Args:
+        df (pandas.core.frame.DataFrame): global summary
+        path (str): path of the file without extension
+        file_format (str): "arrow" (uncompressed Arrow IPC, memory mapped when read) or "parquet"
+
+    Returns:
+        str: path of the written file
+    """
+    if file_format not in FORMATS:
+        raise ValueError("Unknown summary format {0}, use one of {1}.".format(file_format, ", ".join(FORMATS)))
+    path = str(path) + FORMATS[file_format]
+    # temporary file per writer, since threads and processes may write the same summary at once
+    tmp_path = "{0}.{1}-{2}.tmp".format(path, os.getpid(), threading.get_ident())
+    if file_format == "parquet":
+        pa.parquet.write_table(to_arrow(df), tmp_path)
+    else:
+        table = to_arrow(df)
+        with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    # replace atomically for readers in other processes
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_summary(path=None, columns=None):
+    """
+    Reads a global summary written by write_summary, optionally only some of its columns.
+
+    Args:
+        path (str): path of the file (with extension)
+        columns (list): column names to read (None: all columns)
+
+    Returns:
+        pandas.core.frame.DataFrame: global summary
+    """
+    path = str(path)
+    names = None if columns is None else [str(c.item() if isinstance(c, np.generic) else c) for c in columns]
+    if path.endswith(FORMATS["parquet"]):
+        return from_arrow(pa.parquet.read_table(path, columns=names))
+    # the columns are read from the memory map without copying, only the selected columns are converted
+    with pa.memory_map(path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+        return from_arrow(table if names is None else table.select(names))
+
+
+def prune_summaries(folder=None, keep=256, min_age=0):
+    """
+    Deletes the least recently used summaries of a folder beyond the given number of files. Summaries used (written or
+    read) within the last min_age seconds are kept anyway, so that the summaries of live sessions are not deleted by
+    bursts of new summaries.
+
+    Args:
+        folder (str): folder of the summaries written by write_summary
+        keep (int): number of summaries kept
+        min_age (float): seconds since the last use before a summary can be deleted
+
+    Returns:
+        int: number of deleted files
+    """
+    summaries = []
+    try:
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith(tuple(FORMATS.values())):
+                    summaries.append((entry.stat().st_mtime_ns, entry.path))
+    except OSError:
+        return 0
+    cutoff = (time.time() - min_age) * 1e9
+    deleted = 0
+    for used, path in sorted(summaries, reverse=True)[keep:]:
+        if used > cutoff:
+            continue
+        try:
+            os.remove(path)
+            deleted += 1
+        except OSError:
+            # removed by another worker process
+            pass
+    return deleted
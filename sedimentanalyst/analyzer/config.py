@@ -20,6 +20,12 @@ try:
     import sys
     import os
     import math
+    import fnmatch
+    import csv
+    import itertools
+    import warnings
+    import json
+    import unicodedata
 except ImportError:
     print(
         "Error importing necessary packages")
@@ -42,8 +48,32 @@ def get_input():
              "index_lat": [5, 2],  # coordinates of the sample (tuple variable)
              "index_long": [5, 3],
              "folder_path": "datasets",
+             "file_patterns": ["*.xlsx", "*.ods", "*.csv", "*.tsv"],  # file name patterns to look for in folder_path
+             "exclude_patterns": ["~$*", ".*"],  # skip lock files of open workbooks and hidden files
+             "recursive": True,  # look for files in the subfolders of folder_path as well
+             "file_index": None,  # path of a json file to persist the file index between runs (None: no index)
              "index_sample_name": [6, 2],  # index of excel sheet that contains the name of the sample
              "index_sample_date": [3, 2],  # index of excel sheet that contains date that the sample was collected
              "projection": "epsg:3857",  # add projection
+             "percentiles": [10, 16, 25, 30, 50, 60, 75, 84, 90],  # characteristic grain sizes dxx (e.g., add 5, 35,
+             # 65 and 95 for transport formulas); d10, d16, d30, d50, d60 and d84 are always computed
+             "size_scale": "iso",  # grain size classes of the summary: "iso" (ISO 14688) or "wentworth"
+             "sheets": None,  # None (first sheet), "all" or list of sheet names containing one sample each
+             "block_offset": None,  # columns between samples placed side by side in a sheet (None: one sample)
+             "n_blocks": None,  # number of side by side samples per sheet (None: detected from the sheet)
+             "n_realizations": 0,  # Monte Carlo realizations for uncertainty intervals (0: no uncertainty analysis)
+             "weight_relative_error": 0.01,  # relative standard deviation of the class weights (scalar or per sieve)
+             "weight_absolute_error": 0.1,  # absolute standard deviation of the class weights in grams (scale)
+             "n_resamples": 10000,  # bootstrap/permutation resamples for comparing pre- and post-flush campaigns
+             "sieve_grid": None,  # None (sieves of each sample), "phi", "half-phi", "quarter-phi" or sizes in mm
+             "raster_columns": [],  # statistics to interpolate into raster grids (e.g., ["d50"]), saved in outputs
+             "raster_method": "idw",  # "idw" (inverse distance weighting) or "kriging"
+             "raster_resolution": 500,  # number of cells along the longest side of the rasters
+             "shear_stresses": [],  # bed shear stress scenarios [Pa] for incipient motion and bedload transport
+             "fit_models": [],  # "lognormal", "rosin-rammler", "bimodal" and/or "fredlund" fits of the curves
+             "layer_pattern": None,  # regex of the layer suffix of the sample names (e.g., r"[-_\s]+(?:\d+|OS|US)$")
+             # to combine the layers of each core into one mixture (None: no combination)
+             "n_facies": 0,  # number of sediment facies to classify the samples into (0: no classification)
+             "facies_method": "kmeans",  # "kmeans" (mini-batch k-means) or "hierarchical"
              }
     return input
@@ -0,0 +1,377 @@
+""" Module containing the fitting of parametric grain size distributions (log-normal, Rosin-Rammler, bimodal
+log-normal and Fredlund) to the cumulative curves of many samples at once, with a batched Levenberg-Marquardt
+least-squares solver
+
+Author: Beatriz Negreiros
+
+"""
+from sedimentanalyst.analyzer.config import *
+from sedimentanalyst.analyzer.harmonization import curve_columns
+from scipy.special import ndtr, ndtri, expit
+
+# residual and smallest particle diameter [mm] of the Fredlund et al. (2000) unimodal equation
+FREDLUND_DR = 0.001
+FREDLUND_DM = 1e-7
+
+# cumulative fractions outside of these limits are not used for the linearized initial guesses
+LINEARIZATION_LIMITS = (0.005, 0.995)
+
+
+def _normal_pdf(z):
+    return np.exp(-0.5 * z ** 2) / np.sqrt(2 * np.pi)
+
+
+def _line_fit(x, u, valid):
+    """
+    Row-wise least-squares line u = slope * x + intercept over the valid points.
+
+    """
+    n = valid.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_mean = np.where(valid, x, 0).sum(axis=1) / n
+        u_mean = np.where(valid, u, 0).sum(axis=1) / n
+        dx = np.where(valid, x - x_mean[:, None], 0)
+        slope = (dx * np.where(valid, u - u_mean[:, None], 0)).sum(axis=1) / (dx ** 2).sum(axis=1)
+    return slope, u_mean - slope * x_mean
+
+
+class DistributionModel:
+    """
+    A class describing a parametric cumulative grain size distribution F(d) (fraction finer, 0 to 1) for the batched
+    fitting. The fit works on unconstrained parameters (theta), which are converted to the reported (physical)
+    parameters with to_physical.
+
+    Attributes:
+        name (str): name of the model, used as prefix of the result columns
+        parameters (list): names of the physical parameters
+        function (callable): F(x, theta) with x = ln(d [mm]) of shape (n, m) and theta of shape (n, p)
+        jacobian (callable): dF/dtheta of shape (n, m, p), or None for forward differences
+        initial (callable): initial theta of shape (n, p) from x, the cumulative fractions y and the valid mask
+        to_physical (callable): physical parameters of shape (n, p) from theta
+        bounds (tuple): lower and upper limits of theta (avoids degenerate fits), or None
+    """
+
+    def __init__(self, name, parameters, function, initial, to_physical, jacobian=None, bounds=None):
+        self.name = name
+        self.parameters = parameters
+        self.function = function
+        self.jacobian = jacobian
+        self.initial = initial
+        self.to_physical = to_physical
+        self.bounds = bounds
+
+    def __repr__(self):
+        return "DistributionModel({0})".format(self.name)
+
+    def evaluate_jacobian(self, x, theta, step=1e-6):
+        """
+        Jacobian of the model with respect to theta, analytical if available, otherwise by forward differences
+        (one additional batched model evaluation per parameter).
+
+        """
+        if self.jacobian is not None:
+            return self.jacobian(x, theta)
+        f0 = self.function(x, theta)
+        columns = []
+        for j in range(theta.shape[1]):
+            shifted = theta.copy()
+            shifted[:, j] += step
+            columns.append((self.function(x, shifted) - f0) / step)
+        return np.stack(columns, axis=-1)
+
+
+# log-normal: F = Phi((ln d - mu) / sigma), theta = (mu, ln sigma)
+def _lognormal(x, theta):
+    return ndtr((x - theta[:, :1]) / np.exp(theta[:, 1:2]))
+
+
+def _lognormal_jacobian(x, theta):
+    sigma = np.exp(theta[:, 1:2])
+    z = (x - theta[:, :1]) / sigma
+    pdf = _normal_pdf(z)
+    return np.stack([-pdf / sigma, -pdf * z], axis=-1)
+
+
+def _lognormal_initial(x, y, valid):
+    low, high = LINEARIZATION_LIMITS
+    inside = valid & (y > low) & (y < high)
+    slope, intercept = _line_fit(x, ndtri(np.clip(y, low, high)), inside)
+    fallback_mu = np.nanmean(np.where(valid, x, np.nan), axis=1)
+    good = np.isfinite(slope) & (slope > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mu = np.where(good, -intercept / slope, fallback_mu)
+        log_sigma = np.where(good, -np.log(slope), 0.0)
+    return np.column_stack([mu, log_sigma])
+
+
+# Rosin-Rammler (Weibull): F = 1 - exp(-(d / d63) ** n), theta = (ln d63, ln n)
+def _rosin_rammler(x, theta):
+    return -np.expm1(-np.exp(np.exp(theta[:, 1:2]) * (x - theta[:, :1])))
+
+
+def _rosin_rammler_jacobian(x, theta):
+    n = np.exp(theta[:, 1:2])
+    t = np.exp(n * (x - theta[:, :1]))
+    d_t = np.exp(-t) * t
+    return np.stack([-d_t * n, d_t * n * (x - theta[:, :1])], axis=-1)
+
+
+def _rosin_rammler_initial(x, y, valid):
+    low, high = LINEARIZATION_LIMITS
+    inside = valid & (y > low) & (y < high)
+    slope, intercept = _line_fit(x, np.log(-np.log1p(-np.clip(y, low, high))), inside)
+    fallback = np.nanmean(np.where(valid, x, np.nan), axis=1)
+    good = np.isfinite(slope) & (slope > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_d63 = np.where(good, -intercept / slope, fallback)
+        log_n = np.where(good, np.log(slope), 0.0)
+    return np.column_stack([log_d63, log_n])
+
+
+# bimodal log-normal: F = w Phi((ln d - mu1) / s1) + (1 - w) Phi((ln d - mu2) / s2),
+# theta = (mu1, ln s1, mu2, ln s2, logit w)
+def _bimodal(x, theta):
+    w = expit(theta[:, 4:5])
+    return w * _lognormal(x, theta[:, 0:2]) + (1 - w) * _lognormal(x, theta[:, 2:4])
+
+
+def _bimodal_jacobian(x, theta):
+    w = expit(theta[:, 4:5])
+    first, second = _lognormal(x, theta[:, 0:2]), _lognormal(x, theta[:, 2:4])
+    return np.concatenate([w[..., None] * _lognormal_jacobian(x, theta[:, 0:2]),
+                           (1 - w)[..., None] * _lognormal_jacobian(x, theta[:, 2:4]),
+                           (w * (1 - w) * (first - second))[..., None]], axis=-1)
+
+
+def _bimodal_initial(x, y, valid):
+    # two modes placed around the unimodal log-normal fit
+    mu, log_sigma = _lognormal_initial(x, y, valid).T
+    spread = 0.5 * np.exp(log_sigma)
+    return np.column_stack([mu - spread, log_sigma - np.log(2), mu + spread, log_sigma - np.log(2),
+                            np.zeros_like(mu)])
+
+
+def _bimodal_physical(theta):
+    physical = np.column_stack([np.exp(theta[:, 0]), np.exp(theta[:, 1]), np.exp(theta[:, 2]), np.exp(theta[:, 3]),
+                                expit(theta[:, 4])])
+    # report the finer mode first
+    swap = physical[:, 0] > physical[:, 2]
+    physical[swap] = physical[swap][:, [2, 3, 0, 1, 4]]
+    physical[swap, 4] = 1 - physical[swap, 4]
+    return physical
+
+
+# Fredlund et al. (2000) unimodal: F = [1 - (ln(1 + dr / d) / ln(1 + dr / dm)) ** 7] / ln(e + (a / d) ** n) ** m,
+# theta = (ln a, ln n, ln m)
+def _fredlund(x, theta):
+    d = np.exp(x)
+    correction = 1 - (np.log1p(FREDLUND_DR / d) / np.log1p(FREDLUND_DR / FREDLUND_DM)) ** 7
+    with np.errstate(over="ignore"):
+        ratio = np.exp(np.exp(theta[:, 1:2]) * (theta[:, :1] - x))
+        return correction / np.log(np.e + ratio) ** np.exp(theta[:, 2:3])
+
+
+def _fredlund_initial(x, y, valid):
+    mu, log_sigma = _lognormal_initial(x, y, valid).T
+    return np.column_stack([mu, np.log(1.6) - log_sigma, np.zeros_like(mu)])
+
+
+# limits of the ln of grain sizes [mm] and of the ln of the log-normal spreads
+LOG_SIZE_LIMITS = (np.log(1e-4), np.log(1e4))
+LOG_SIGMA_LIMITS = (np.log(0.02), np.log(5.0))
+
+# fraction of the range of a parameter within which a fitted parameter counts as lying on its limit
+BOUND_TOLERANCE = 1e-6
+
+# available models, selectable by name
+MODELS = {
+    "lognormal": DistributionModel(
+        name="Log-normal", parameters=["dg [mm]", "sigma"], function=_lognormal, jacobian=_lognormal_jacobian,
+        initial=_lognormal_initial, to_physical=np.exp,
+        bounds=([LOG_SIZE_LIMITS[0], LOG_SIGMA_LIMITS[0]], [LOG_SIZE_LIMITS[1], LOG_SIGMA_LIMITS[1]])),
+    "rosin-rammler": DistributionModel(
+        name="Rosin-Rammler", parameters=["d63 [mm]", "n"], function=_rosin_rammler,
+        jacobian=_rosin_rammler_jacobian, initial=_rosin_rammler_initial, to_physical=np.exp,
+        bounds=([LOG_SIZE_LIMITS[0], np.log(0.05)], [LOG_SIZE_LIMITS[1], np.log(50.0)])),
+    "bimodal": DistributionModel(
+        name="Bimodal", parameters=["dg1 [mm]", "sigma1", "dg2 [mm]", "sigma2", "fraction 1"], function=_bimodal,
+        jacobian=_bimodal_jacobian, initial=_bimodal_initial, to_physical=_bimodal_physical,
+        bounds=([LOG_SIZE_LIMITS[0], LOG_SIGMA_LIMITS[0], LOG_SIZE_LIMITS[0], LOG_SIGMA_LIMITS[0], -10.0],
+                [LOG_SIZE_LIMITS[1], LOG_SIGMA_LIMITS[1], LOG_SIZE_LIMITS[1], LOG_SIGMA_LIMITS[1], 10.0])),
+    "fredlund": DistributionModel(
+        name="Fredlund", parameters=["a [mm]", "n", "m"], function=_fredlund, initial=_fredlund_initial,
+        to_physical=np.exp,
+        bounds=([LOG_SIZE_LIMITS[0], np.log(0.05), np.log(0.01)], [LOG_SIZE_LIMITS[1], np.log(50.0), np.log(50.0)])),
+}
+
+
+def levenberg_marquardt(model=None, x=None, y=None, valid=None, theta=None, max_iter=100, tol=1e-7,
+                        chunk_size=20000):
+    """
+    Batched Levenberg-Marquardt least squares: all samples are iterated together, each with its own damping, and
+    samples leave the iteration once converged. The normal equations of all samples are built with batched matrix
+    products and solved as a stack of p x p systems.
+
+    Args:
+        model (DistributionModel): model to fit
+        x (np.array): ln of the sieve diameters [mm], shape (n, m)
+        y (np.array): cumulative fractions (0 to 1), shape (n, m)
+        valid (np.array): boolean mask of the points to fit, shape (n, m)
+        theta (np.array): initial unconstrained parameters (warm start), shape (n, p)
+        max_iter (int): maximum number of iterations
+        tol (float): relative decrease of the cost below which a sample is converged
+        chunk_size (int): number of samples iterated together (bounds the memory of the Jacobians)
+
+    Returns:
+        tuple: fitted theta of shape (n, p) and final sum of squared residuals of shape (n,)
+    """
+    theta = np.array(theta, dtype=float)
+    if model.bounds is not None:
+        theta = np.clip(theta, *model.bounds)
+    cost = np.empty(len(theta))
+    for start in range(0, len(theta), chunk_size):
+        rows = slice(start, start + chunk_size)
+        theta[rows], cost[rows] = _levenberg_marquardt(model, x[rows], y[rows], valid[rows], theta[rows], max_iter,
+                                                       tol)
+    return theta, cost
+
+
+def _levenberg_marquardt(model, x, y, valid, theta, max_iter, tol):
+    weights = valid.astype(float)
+    x = np.where(valid, x, 0.0)
+    y = np.where(valid, y, 0.0)
+
+    def residuals(rows, parameters):
+        with np.errstate(invalid="ignore", over="ignore"):
+            return np.nan_to_num((model.function(x[rows], parameters) - y[rows]) * weights[rows], nan=1e3)
+
+    cost = (residuals(slice(None), theta) ** 2).sum(axis=1)
+    damping = np.full(len(theta), 1e-3)
+    active = np.flatnonzero(np.isfinite(theta).all(axis=1))
+    identity = np.eye(theta.shape[1])
+
+    for _ in range(max_iter):
+        if active.size == 0:
+            break
+        parameters = theta[active]
+        r = residuals(active, parameters)
+        with np.errstate(invalid="ignore", over="ignore"):
+            jacobian = np.nan_to_num(model.evaluate_jacobian(x[active], parameters) * weights[active][..., None])
+        transposed = jacobian.transpose(0, 2, 1)
+        gradient = (transposed @ r[..., None])[..., 0]
+        hessian = transposed @ jacobian
+        diagonal = np.einsum("npp->np", hessian)[:, :, None] * identity + 1e-12 * identity
+        try:
+            step = np.linalg.solve(hessian + damping[active, None, None] * diagonal, -gradient[..., None])[..., 0]
+        except np.linalg.LinAlgError:
+            step = (np.linalg.pinv(hessian + damping[active, None, None] * diagonal) @ -gradient[..., None])[..., 0]
+
+        candidate = parameters + step
+        if model.bounds is not None:
+            candidate = np.clip(candidate, *model.bounds)
+        new_cost = (residuals(active, candidate) ** 2).sum(axis=1)
+        better = new_cost < cost[active]
+        improvement = cost[active] - new_cost
+        theta[active[better]] = candidate[better]
+        converged = better & (improvement <= tol * np.maximum(cost[active], 1e-30))
+        cost[active[better]] = new_cost[better]
+        damping[active] = np.where(better, damping[active] / 3, damping[active] * 2)
+        converged |= damping[active] > 1e10
+        active = active[~converged]
+    return theta, cost
+
+
+def fit_curves(grain_sizes=None, cumulative=None, models=("lognormal", "rosin-rammler", "bimodal", "fredlund"),
+               initial=None, **kwargs):
+    """
+    Fits parametric distributions to cumulative curves.
+
+    Args:
+        grain_sizes (np.array): sieve diameters [mm], shape (m,) if shared by all samples or (n, m)
+        cumulative (np.array): cumulative percentages [%], shape (n, m), NaN where a sample has no sieve
+        models (list): names of the models to fit (see MODELS)
+        initial (dict): unconstrained initial parameters per model name (warm start, e.g., from a previous fit),
+            overriding the linearized initial guesses
+        kwargs: further arguments of levenberg_marquardt
+
+    Returns:
+        dict: per model name, a dict with the unconstrained "theta", the physical "parameters" (n, p), the "rmse"
+            [%] and "r2" of the fit (n,), and "at_bound" (n,), True where a parameter ended on its limit (the
+            parameters, rmse and r2 of these fits are NaN)
+    """
+    y = np.atleast_2d(np.asarray(cumulative, dtype=float)) / 100
+    sizes = np.broadcast_to(np.asarray(grain_sizes, dtype=float), y.shape)
+    valid = ~np.isnan(y) & (sizes > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = np.where(valid, np.log(np.where(sizes > 0, sizes, 1.0)), 0.0)
+    y = np.where(valid, y, 0.0)
+    n_points = valid.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = y.sum(axis=1) / n_points
+        total = (np.where(valid, y - mean[:, None], 0) ** 2).sum(axis=1)
+
+    results = {}
+    initial = {} if initial is None else initial
+    for name in models:
+        model = MODELS[name]
+        start = initial.get(name)
+        theta = model.initial(x, y, valid) if start is None else np.array(start, dtype=float)
+        theta, cost = levenberg_marquardt(model, x, y, valid, theta, **kwargs)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rmse = 100 * np.sqrt(cost / n_points)
+            r2 = 1 - cost / total
+        # fits ending on a limit of a parameter are degenerate (e.g., a mode without weight or outside the sieves)
+        at_bound = np.zeros(len(theta), dtype=bool)
+        if model.bounds is not None:
+            lower, upper = (np.asarray(limit, dtype=float) for limit in model.bounds)
+            tolerance = BOUND_TOLERANCE * (upper - lower)
+            at_bound = ((theta <= lower + tolerance) | (theta >= upper - tolerance)).any(axis=1)
+        not_fitted = (n_points < len(model.parameters)) | at_bound
+        parameters = model.to_physical(theta)
+        parameters[not_fitted] = np.nan
+        rmse[not_fitted], r2[not_fitted] = np.nan, np.nan
+        results[name] = {"theta": theta, "parameters": parameters, "rmse": rmse, "r2": r2, "at_bound": at_bound}
+    return results
+
+
+def fit_distributions(df=None, models=("lognormal", "rosin-rammler", "bimodal", "fredlund"), **kwargs):
+    """
+    Fits parametric distributions to the cumulative curves of all samples of the global summary.
+
+    Args:
+        df (df): global summary (see utils.append_global), or harmonized summary (see harmonization.harmonize)
+        models (list): names of the models to fit (see MODELS)
+        kwargs: further arguments of fit_curves
+
+    Returns:
+        df: one row per sample with the columns "<model> [<parameter>]", "<model> [RMSE %]", "<model> [R2]" and
+            "<model> [at bound]" (True if the fit ended on a parameter limit, see fit_curves), with the index of df
+    """
+    columns = curve_columns(df)
+    results = fit_curves(grain_sizes=np.asarray(columns, dtype=float), cumulative=df[columns].to_numpy(dtype=float),
+                         models=models, **kwargs)
+    table = {}
+    for name, result in results.items():
+        model = MODELS[name]
+        for k, parameter in enumerate(model.parameters):
+            table["{0} [{1}]".format(model.name, parameter)] = result["parameters"][:, k]
+        table["{0} [RMSE %]".format(model.name)] = result["rmse"]
+        table["{0} [R2]".format(model.name)] = result["r2"]
+        table["{0} [at bound]".format(model.name)] = result["at_bound"]
+    return pd.DataFrame(table, index=df.index)
+
+
+def add_fits(df=None, **kwargs):
+    """
+    Appends the fitted distribution parameters to the global summary, before the cumulative percentage columns.
+
+    Args:
+        df (df): global summary (see utils.append_global)
+        kwargs: arguments of fit_distributions
+
+    Returns:
+        df: global summary with the fit columns
+    """
+    columns = curve_columns(df)
+    fits = fit_distributions(df, **kwargs)
+    return pd.concat([df.drop(columns=columns), fits, df[columns]], axis=1)
@@ -0,0 +1,213 @@
+""" Module designated for the class FileIndex
+
+Author : Beatriz Negreiros
+
+"""
+
+from sedimentanalyst.analyzer.config import *
+
+# keywords in folder or file names that identify the sampling campaign (before or after flushing)
+CAMPAIGN_KEYWORDS = {"pre-flush": ["vorspü", "vorspu", "vorher", "pre"],
+                     "post-flush": ["nachspü", "nachspu", "nachher", "post"]}
+
+
+def infer_campaign(rel_path):
+    """
+    Infers the sampling campaign of a file from the keywords in its relative path.
+
+    Args:
+        rel_path (str): path of the file relative to the scanned folder
+
+    Returns:
+        str: "pre-flush", "post-flush" or None if no keyword was found
+    """
+    # normalize umlauts (ü may be stored decomposed depending on the file system)
+    parts = re.split(r"[\\/_\-\s.]+", unicodedata.normalize("NFC", rel_path).lower())
+    for campaign, keywords in CAMPAIGN_KEYWORDS.items():
+        if any(part in keywords for part in parts):
+            return campaign
+    return None
+
+
+class FileIndex:
+    """
+    A class for discovering sieving files recursively with os.scandir and keeping a persistent index of the
+    discovered files. Directories whose modification time did not change since the last scan are not listed
+    again, which makes re-listing large folders almost instantaneous.
+
+    Attributes:
+        folder (str): path of the folder to scan
+        patterns (list): file name patterns to include (e.g., ["*.xlsx", "*.csv", "*.ods"])
+        exclude (list): file and folder name patterns to skip (e.g., ["~$*"] for lock files of open workbooks)
+        recursive (bool): if True, subfolders are scanned as well
+        index_path (str): path of the json file where the index is persisted (None: index is kept in memory only)
+        dirs (dict): scanned directories (relative path) with their modification time, subfolders and files
+        files (dict): indexed files (relative path) with their size, modification time, group and campaign
+
+    Methods:
+        scan (dict): updates and returns the index of files
+        list_files (list): returns the paths of the indexed files, optionally filtered by group or campaign
+        save: writes the index into index_path
+        load: reads the index from index_path
+    """
+
+    def __init__(self, folder=None, patterns=("*.xlsx", "*.ods", "*.csv", "*.tsv"), exclude=("~$*", ".*"),
+                 recursive=True, index_path=None):
+        self.folder = str(folder)
+        self.patterns = list(patterns)
+        self.exclude = list(exclude) if exclude else []
+        self.recursive = recursive
+        self.index_path = index_path
+        self.dirs = {}
+        self.files = {}
+
+        if self.index_path is not None:
+            self.load()
+
+    def __repr__(self):
+        return "FileIndex({0}, {1})".format(self.folder, self.patterns)
+
+    def load(self):
+        """
+        Reads the index from index_path. The stored index is discarded if it was created for another folder
+        or with other patterns.
+
+        """
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        if stored.get("settings") != self.__settings():
+            logging.info("File index at {0} was built with other settings, rebuilding it.".format(self.index_path))
+            return
+        self.dirs = stored.get("dirs", {})
+        self.files = stored.get("files", {})
+        pass
+
+    def save(self):
+        """
+        Writes the index into index_path (as json).
+
+        """
+        if self.index_path is None:
+            return
+        tmp_path = str(self.index_path) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"settings": self.__settings(), "dirs": self.dirs, "files": self.files}, f)
+        os.replace(tmp_path, self.index_path)
+        pass
+
+    def scan(self):
+        """
+        Walks the folder tree and updates the index. Only directories whose modification time changed
+        are listed again.
+
+        Note:
+            A file modified in place does not change the modification time of its directory, thus its size and
+            modification time in the index are only refreshed when the directory content changes.
+
+        Returns:
+            dict: indexed files (relative path) with their size, modification time, group and campaign
+        """
+        seen_dirs = set()
+        stack = [""]
+        while stack:
+            rel_dir = stack.pop()
+            abs_dir = os.path.join(self.folder, rel_dir)
+            try:
+                dir_mtime = os.stat(abs_dir).st_mtime_ns
+            except OSError:
+                continue
+            seen_dirs.add(rel_dir)
+
+            # directory unchanged since the last scan: reuse its listing
+            cached = self.dirs.get(rel_dir)
+            if cached is not None and cached["mtime"] == dir_mtime:
+                stack.extend(cached["subdirs"])
+                continue
+
+            subdirs, files = self.__list_dir(rel_dir, abs_dir)
+
+            # forget files that were removed from the directory
+            if cached is not None:
+                for rel_path in set(cached["files"]) - set(files):
+                    self.files.pop(rel_path, None)
+
+            self.dirs[rel_dir] = {"mtime": dir_mtime, "subdirs": subdirs, "files": files}
+            stack.extend(subdirs)
+
+        # forget directories that were removed from the tree
+        for rel_dir in set(self.dirs) - seen_dirs:
+            for rel_path in self.dirs.pop(rel_dir)["files"]:
+                self.files.pop(rel_path, None)
+
+        self.save()
+        return self.files
+
+    def list_files(self, group=None, campaign=None):
+        """
+        Lists the indexed files, optionally filtered by group (first level subfolder) or campaign.
+
+        Args:
+            group (str): name of the first level subfolder (e.g., "FC"), None for all groups
+            campaign (str): "pre-flush" or "post-flush", None for all campaigns
+
+        Returns:
+            list: sorted list of strings from addresses of the files
+        """
+        if not self.dirs:
+            self.scan()
+        file_list = []
+        for rel_path, entry in self.files.items():
+            if group is not None and entry["group"] != group:
+                continue
+            if campaign is not None and entry["campaign"] != campaign:
+                continue
+            file_list.append(os.path.join(self.folder, rel_path))
+        return sorted(file_list)
+
+    def __list_dir(self, rel_dir, abs_dir):
+        """
+        Lists one directory with os.scandir and fills the index with its matching files.
+
+        Args:
+            rel_dir (str): path of the directory relative to the scanned folder
+            abs_dir (str): path of the directory
+
+        Returns:
+            tuple: list of subdirectories and list of files (relative paths)
+        """
+        subdirs, files = [], []
+        try:
+            entries = list(os.scandir(abs_dir))
+        except OSError as e:
+            logging.error("Could not list directory {0}: {1}".format(abs_dir, e))
+            return subdirs, files
+
+        for entry in entries:
+            if self.__is_excluded(entry.name):
+                continue
+            rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                if self.recursive:
+                    subdirs.append(rel_path)
+            elif entry.is_file() and self.__is_included(entry.name):
+                stat = entry.stat()
+                self.files[rel_path] = {"size": stat.st_size,
+                                        "mtime": stat.st_mtime,
+                                        "group": rel_path.split(os.sep)[0] if rel_dir else None,
+                                        "campaign": infer_campaign(rel_path)}
+                files.append(rel_path)
+        return subdirs, files
+
+    def __is_included(self, name):
+        return any(fnmatch.fnmatch(name.lower(), pattern.lower()) for pattern in self.patterns)
+
+    def __is_excluded(self, name):
+        return any(fnmatch.fnmatch(name, pattern) for pattern in self.exclude)
+
+    def __settings(self):
+        return {"folder": os.path.abspath(self.folder), "patterns": self.patterns,
+                "exclude": self.exclude, "recursive": self.recursive}
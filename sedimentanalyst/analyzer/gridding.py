@@ -0,0 +1,324 @@
+""" Module containing the spatial interpolation of sample statistics (e.g., d50, porosity or kf) into raster grids
+with inverse distance weighting or ordinary kriging, both restricted to the nearest samples found with a KD-tree
+
+Author: Beatriz Negreiros
+
+"""
+from sedimentanalyst.analyzer.config import *
+from scipy.spatial import cKDTree
+from scipy.optimize import curve_fit
+from pyproj import CRS, Transformer
+
+# CRS used for gridding samples given in geographic coordinates (degrees)
+METRIC_CRS = "epsg:3857"
+
+# value of the cells without estimate in the ASCII grid files
+NODATA_VALUE = -9999
+
+
+class Raster:
+    """
+    A class holding a regular grid of interpolated values, georeferenced by its lower left corner.
+
+    Attributes:
+        values (np.array): interpolated values, shape (n_rows, n_columns), where the first row is the northern one
+        x0 (float): x coordinate of the western edge of the grid
+        y0 (float): y coordinate of the southern edge of the grid
+        cell_size (float): side length of the cells (in units of the CRS)
+        crs (str): coordinate reference system of the grid
+        name (str): name of the interpolated statistic
+
+    Methods:
+        bounds (tuple): west, south, east and north edges of the grid
+        cell_centers (tuple): x and y coordinates of the cell centers
+        to_ascii (None): writes the grid as ESRI ASCII grid with a .prj file
+    """
+
+    def __init__(self, values=None, x0=0.0, y0=0.0, cell_size=1.0, crs=METRIC_CRS, name=""):
+        self.values = values
+        self.x0 = x0
+        self.y0 = y0
+        self.cell_size = cell_size
+        self.crs = crs
+        self.name = name
+
+    def __repr__(self):
+        return "Raster({0}, {1} x {2} cells of {3:g})".format(self.name, *self.values.shape, self.cell_size)
+
+    def bounds(self):
+        """
+        Edges of the grid.
+
+        Returns:
+            tuple: west, south, east and north edges (in units of the CRS)
+        """
+        n_rows, n_columns = self.values.shape
+        return self.x0, self.y0, self.x0 + n_columns * self.cell_size, self.y0 + n_rows * self.cell_size
+
+    def cell_centers(self):
+        """
+        Coordinates of the cell centers.
+
+        Returns:
+            tuple: x coordinates of the columns, shape (n_columns,), and y coordinates of the rows (from north to
+                south), shape (n_rows,)
+        """
+        n_rows, n_columns = self.values.shape
+        x = self.x0 + (np.arange(n_columns) + 0.5) * self.cell_size
+        y = self.y0 + (np.arange(n_rows)[::-1] + 0.5) * self.cell_size
+        return x, y
+
+    def to_ascii(self, path=None):
+        """
+        Writes the grid as ESRI ASCII grid (.asc), readable by GIS software, and its CRS as WKT in a .prj file of the
+        same name.
+
+        Args:
+            path (str): path of the .asc file
+        """
+        path = Path(path)
+        n_rows, n_columns = self.values.shape
+        header = "ncols {0}\nnrows {1}\nxllcorner {2!r}\nyllcorner {3!r}\ncellsize {4!r}\nNODATA_value {5}".format(
+            n_columns, n_rows, float(self.x0), float(self.y0), float(self.cell_size), NODATA_VALUE)
+        np.savetxt(path, np.where(np.isnan(self.values), NODATA_VALUE, self.values), fmt="%.6g", header=header,
+                   comments="")
+        path.with_suffix(".prj").write_text(CRS.from_user_input(self.crs).to_wkt("WKT1_ESRI"))
+
+
+def sample_points(df=None, column=None, projection="epsg:3857"):
+    """
+    Extracts the coordinates and values of one statistic of the georeferenced samples. Samples given in geographic
+    coordinates are projected to METRIC_CRS so that distances are in meters.
+
+    Args:
+        df (df): global summary (see utils.append_global), with "lat" (northing) and "lon" (easting) in projection
+        column (str): statistic column to interpolate
+        projection (str): projection of the sample coordinates
+
+    Returns:
+        tuple: x, y and value arrays of the samples with coordinates and value, and the CRS of x and y
+    """
+    y = pd.to_numeric(df["lat"], errors="coerce").to_numpy(dtype=float)
+    x = pd.to_numeric(df["lon"], errors="coerce").to_numpy(dtype=float)
+    values = pd.to_numeric(df[column], errors="coerce").to_numpy(dtype=float)
+    valid = ~(np.isnan(x) | np.isnan(y) | np.isnan(values))
+    x, y, values = x[valid], y[valid], values[valid]
+
+    crs = projection
+    if CRS.from_user_input(projection).is_geographic:
+        x, y = Transformer.from_crs(projection, METRIC_CRS, always_xy=True).transform(x, y)
+        crs = METRIC_CRS
+    return x, y, values, crs
+
+
+def variogram_model(h=None, nugget=0.0, sill=1.0, range_=1.0, model="spherical"):
+    """
+    Evaluates a variogram model (zero at lag zero).
+
+    Args:
+        h (np.array): lag distances
+        nugget (float): nugget
+        sill (float): sill (total, including the nugget)
+        range_ (float): range (practical range for the exponential and gaussian models)
+        model (str): "spherical", "exponential" or "gaussian"
+
+    Returns:
+        np.array: semivariances, shape of h
+    """
+    r = np.asarray(h, dtype=float) / range_
+    if model == "spherical":
+        shape = np.where(r < 1, 1.5 * r - 0.5 * r ** 3, 1.0)
+    elif model == "exponential":
+        shape = 1 - np.exp(-3 * r)
+    elif model == "gaussian":
+        shape = 1 - np.exp(-3 * r ** 2)
+    else:
+        raise ValueError("Unknown variogram model {0}, use 'spherical', 'exponential' or 'gaussian'.".format(model))
+    return np.where(r > 0, nugget + (sill - nugget) * shape, 0.0)
+
+
+def fit_variogram(x=None, y=None, values=None, model="spherical", n_lags=15, n_pairs=200000, seed=None):
+    """
+    Fits a variogram model to the empirical semivariogram of the samples. The empirical semivariogram is computed
+    from at most n_pairs random pairs of samples, so that its cost does not grow with the square of the samples.
+
+    Args:
+        x (np.array): x coordinates
+        y (np.array): y coordinates
+        values (np.array): values of the samples
+        model (str): variogram model (see variogram_model)
+        n_lags (int): number of lag classes up to half of the extent of the samples
+        n_pairs (int): maximum number of sample pairs
+        seed (int): seed of the random generator
+
+    Returns:
+        dict: "model", "nugget", "sill" and "range_" (arguments of variogram_model)
+    """
+    rng = np.random.default_rng(seed)
+    n = len(values)
+    if n * (n - 1) // 2 <= n_pairs:
+        i, j = np.triu_indices(n, k=1)
+    else:
+        i, j = rng.integers(0, n, size=(2, n_pairs))
+        i, j = i[i != j], j[i != j]
+    lags = np.hypot(x[i] - x[j], y[i] - y[j])
+    semivariances = 0.5 * (values[i] - values[j]) ** 2
+
+    max_lag = 0.5 * np.hypot(np.ptp(x), np.ptp(y))
+    variance = np.var(values)
+    initial = [0.0, variance, max_lag / 2 or 1.0]
+    edges = np.linspace(0, max_lag, n_lags + 1)
+    classes = np.digitize(lags, edges) - 1
+    inside = (classes >= 0) & (classes < n_lags)
+    counts = np.bincount(classes[inside], minlength=n_lags)
+    means = np.bincount(classes[inside], weights=semivariances[inside], minlength=n_lags) / np.maximum(counts, 1)
+    centers = 0.5 * (edges[1:] + edges[:-1])
+    filled = counts > 0
+
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            parameters, _ = curve_fit(lambda h, nugget, sill, range_: variogram_model(h, nugget, sill, range_, model),
+                                      centers[filled], means[filled], p0=initial, sigma=1 / np.sqrt(counts[filled]),
+                                      bounds=([0, 0, 1e-9], [np.inf, np.inf, np.inf]))
+    except (RuntimeError, ValueError, TypeError):
+        logging.warning("Variogram fit did not converge, using the sample variance as sill.")
+        parameters = initial
+    nugget, sill, range_ = (float(p) for p in parameters)
+    return {"model": model, "nugget": min(nugget, sill), "sill": sill, "range_": range_}
+
+
+def idw(x=None, y=None, values=None, grid_x=None, grid_y=None, power=2.0, k=12, max_distance=np.inf,
+        chunk_size=250000):
+    """
+    Inverse distance weighting with the k nearest samples of each grid point.
+
+    Args:
+        x (np.array): x coordinates of the samples
+        y (np.array): y coordinates of the samples
+        values (np.array): values of the samples
+        grid_x (np.array): x coordinates of the grid points (any shape)
+        grid_y (np.array): y coordinates of the grid points (same shape as grid_x)
+        power (float): power of the inverse distance weights
+        k (int): number of nearest samples used per grid point
+        max_distance (float): samples farther than max_distance are ignored (points without samples give NaN)
+        chunk_size (int): number of grid points processed at once (bounds the memory use)
+
+    Returns:
+        np.array: interpolated values, shape of grid_x
+    """
+    tree = cKDTree(np.column_stack([x, y]))
+    points = np.column_stack([np.ravel(grid_x), np.ravel(grid_y)])
+    k = min(k, len(values))
+    padded = np.append(values, np.nan)  # the tree returns len(values) for missing neighbours
+    result = np.empty(len(points))
+    for start in range(0, len(points), chunk_size):
+        distances, neighbours = tree.query(points[start:start + chunk_size], k=k, distance_upper_bound=max_distance,
+                                           workers=-1)
+        distances, neighbours = distances.reshape(len(distances), k), neighbours.reshape(len(neighbours), k)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weights = np.where(np.isinf(distances), 0.0, 1 / distances ** power)
+            estimate = np.nansum(weights * padded[neighbours], axis=1) / weights.sum(axis=1)
+        # grid points on top of a sample take its value
+        exact = distances[:, 0] == 0
+        estimate[exact] = padded[neighbours[exact, 0]]
+        result[start:start + chunk_size] = estimate
+    return result.reshape(np.shape(grid_x))
+
+
+def ordinary_kriging(x=None, y=None, values=None, grid_x=None, grid_y=None, variogram=None, k=16,
+                     chunk_size=20000, return_variance=False):
+    """
+    Ordinary kriging in a moving neighbourhood of the k nearest samples of each grid point. The kriging systems of a
+    chunk of grid points are solved at once as a stack of (k + 1) x (k + 1) matrices.
+
+    Args:
+        x (np.array): x coordinates of the samples
+        y (np.array): y coordinates of the samples
+        values (np.array): values of the samples
+        grid_x (np.array): x coordinates of the grid points (any shape)
+        grid_y (np.array): y coordinates of the grid points (same shape as grid_x)
+        variogram (dict): arguments of variogram_model (default: fitted with fit_variogram)
+        k (int): number of nearest samples used per grid point
+        chunk_size (int): number of grid points processed at once (bounds the memory use)
+        return_variance (bool): if True, the kriging variance is returned as well
+
+    Returns:
+        np.array: interpolated values, shape of grid_x (and kriging variances if return_variance)
+    """
+    variogram = fit_variogram(x, y, values) if variogram is None else variogram
+    coordinates = np.column_stack([x, y])
+    tree = cKDTree(coordinates)
+    points = np.column_stack([np.ravel(grid_x), np.ravel(grid_y)])
+    k = min(k, len(values))
+    estimate = np.empty(len(points))
+    variance = np.empty(len(points))
+
+    for start in range(0, len(points), chunk_size):
+        chunk = points[start:start + chunk_size]
+        distances, neighbours = tree.query(chunk, k=k, workers=-1)
+        distances, neighbours = distances.reshape(len(chunk), k), neighbours.reshape(len(chunk), k)
+        local = coordinates[neighbours]
+
+        # kriging matrices with the Lagrange multiplier of the unbiasedness constraint
+        matrices = np.ones((len(chunk), k + 1, k + 1))
+        matrices[:, :k, :k] = variogram_model(np.linalg.norm(local[:, :, None] - local[:, None, :], axis=-1),
+                                              **variogram)
+        matrices[:, k, k] = 0.0
+        vectors = np.ones((len(chunk), k + 1, 1))
+        vectors[:, :k, 0] = variogram_model(distances, **variogram)
+        try:
+            weights = np.linalg.solve(matrices, vectors)
+        except np.linalg.LinAlgError:
+            # coincident samples make some systems singular
+            weights = np.linalg.pinv(matrices) @ vectors
+        estimate[start:start + chunk_size] = (weights[:, :k, 0] * values[neighbours]).sum(axis=1)
+        variance[start:start + chunk_size] = (weights[:, :, 0] * vectors[:, :, 0]).sum(axis=1)
+
+    estimate = estimate.reshape(np.shape(grid_x))
+    if return_variance:
+        return estimate, variance.reshape(np.shape(grid_x))
+    return estimate
+
+
+def interpolate_raster(df=None, column="d50", projection="epsg:3857", method="idw", resolution=500,
+                       cell_size=None, margin=0.05, **kwargs):
+    """
+    Interpolates a statistic of the georeferenced samples of the global summary onto a raster grid covering the
+    samples.
+
+    Args:
+        df (df): global summary (see utils.append_global)
+        column (str): statistic column to interpolate (e.g., "d50", "Wooster et al. (2008) [Porosity]")
+        projection (str): projection of the sample coordinates
+        method (str): "idw" or "kriging"
+        resolution (int): number of cells along the longest side of the grid (ignored if cell_size is given)
+        cell_size (float): side length of the cells (in units of the projection, meters for geographic input)
+        margin (float): margin around the samples, relative to their extent
+        kwargs: further arguments of idw or ordinary_kriging
+
+    Returns:
+        Raster: interpolated grid, or None if no sample has coordinates and a value
+    """
+    x, y, values, crs = sample_points(df, column=column, projection=projection)
+    if len(values) == 0:
+        logging.warning("No georeferenced samples with values of {0}.".format(column))
+        return None
+
+    span = max(np.ptp(x), np.ptp(y)) or 1.0
+    west, south = x.min() - margin * span, y.min() - margin * span
+    east, north = x.max() + margin * span, y.max() + margin * span
+    cell_size = cell_size or max(east - west, north - south) / resolution
+    n_columns = max(1, int(np.ceil((east - west) / cell_size)))
+    n_rows = max(1, int(np.ceil((north - south) / cell_size)))
+
+    raster = Raster(values=np.empty((n_rows, n_columns)), x0=west, y0=south, cell_size=cell_size, crs=crs,
+                    name=column)
+    grid_x, grid_y = np.meshgrid(*raster.cell_centers())
+    if method == "idw":
+        raster.values = idw(x, y, values, grid_x, grid_y, **kwargs)
+    elif method == "kriging":
+        raster.values = ordinary_kriging(x, y, values, grid_x, grid_y, **kwargs)
+    else:
+        raise ValueError("Unknown interpolation method {0}, use 'idw' or 'kriging'.".format(method))
+    return raster
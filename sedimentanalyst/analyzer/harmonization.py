@@ -0,0 +1,139 @@
+""" Module containing the harmonization of cumulative grain size distribution curves measured with different sieve
+sets onto a common (standard) sieve grid
+
+Author: Beatriz Negreiros
+
+"""
+from sedimentanalyst.analyzer.config import *
+from sedimentanalyst.analyzer import batch_statistics
+
+
+def phi_grid(d_min=0.0625, d_max=128, step=0.5):
+    """
+    Builds a sieve grid with constant steps in the phi scale (phi = -log2(d)).
+
+    Args:
+        d_min (float): smallest grain size [mm] (a power of two for sieves on the Wentworth class limits)
+        d_max (float): largest grain size [mm]
+        step (float): step in phi units (1 for Wentworth classes, 0.5 for half phi steps)
+
+    Returns:
+        np.array: grain sizes [mm] in increasing order
+    """
+    return 2.0 ** np.arange(np.log2(d_min), np.log2(d_max) + step / 2, step)
+
+
+# standard sieve grids selectable by name
+GRIDS = {"half-phi": phi_grid(),  # 0.0625 to 128 mm in half phi steps
+         "phi": phi_grid(d_min=2.0 ** -8, d_max=2.0 ** 8, step=1.0),  # Wentworth class limits from clay to boulders
+         "quarter-phi": phi_grid(step=0.25),
+         }
+
+# common sieve grid [mm] for comparing curves
+DEFAULT_GRID = GRIDS["half-phi"]
+
+
+def get_grid(grid=None):
+    """
+    Returns a sieve grid given by name (see GRIDS) or by its grain sizes.
+
+    Args:
+        grid (str or list): name of a standard grid or grain sizes [mm]
+
+    Returns:
+        np.array: grain sizes [mm] in increasing order
+    """
+    if isinstance(grid, str):
+        if grid not in GRIDS:
+            raise ValueError("Unknown sieve grid {0}, use one of {1} or a list of grain sizes.".format(
+                grid, ", ".join(GRIDS)))
+        return GRIDS[grid]
+    return np.sort(np.asarray(grid, dtype=float))
+
+
+def curve_columns(df=None):
+    """
+    Lists the cumulative percentage columns of the global summary, i.e., the columns named after sieve diameters.
+
+    Args:
+        df (df): global summary (see utils.append_global)
+
+    Returns:
+        list: column names (grain sizes in mm)
+    """
+    return [c for c in df.columns if isinstance(c, (int, float, np.number))]
+
+
+def harmonize_curves(grain_sizes=None, cumulative=None, grid=DEFAULT_GRID):
+    """
+    Interpolates cumulative curves onto a common sieve grid, linearly in log grain size. Samples sharing the same
+    sieves (non-NaN values) are interpolated together with batch_statistics.batch_interp. Grid sizes above the
+    largest sieve of a sample get its largest cumulative percentage (100 %), sizes below the smallest sieve its
+    smallest one. Sieves of zero size (pan) are ignored.
+
+    Args:
+        grain_sizes (np.array): sieve diameters [mm] in any order, shape (n_sieves,)
+        cumulative (np.array): cumulative percentages [%], shape (n_samples, n_sieves), NaN for sieves that a
+            sample does not have
+        grid (np.array): grain sizes [mm] of the common grid
+
+    Returns:
+        np.array: dense matrix of cumulative percentages [%] with shape (n_samples, n_grid); rows of samples with
+            less than two sieves are NaN
+    """
+    sizes = np.asarray(grain_sizes, dtype=float)
+    values = np.atleast_2d(np.asarray(cumulative, dtype=float))
+    grid = np.asarray(grid, dtype=float)
+    curves = np.full((values.shape[0], len(grid)), np.nan)
+
+    # group the samples by the sieves they have
+    available = ~np.isnan(values) & (sizes > 0)
+    patterns, inverse = np.unique(available, axis=0, return_inverse=True)
+    for k, pattern in enumerate(patterns):
+        rows = np.flatnonzero(inverse.ravel() == k)
+        if pattern.sum() < 2:
+            continue
+        order = np.argsort(sizes[pattern])
+        log_sizes = np.broadcast_to(np.log(sizes[pattern][order]), (len(rows), int(pattern.sum())))
+        curves[rows] = batch_statistics.batch_interp(x=np.log(grid), xp=log_sizes,
+                                                     fp=values[rows][:, pattern][:, order])
+    return curves
+
+
+def resample_curves(df=None, grid=DEFAULT_GRID):
+    """
+    Dense matrix of the cumulative curves of all samples of the global summary on a common sieve grid. Summaries
+    that are already harmonized on the same grid are returned without interpolation.
+
+    Args:
+        df (df): global summary (see utils.append_global) or harmonized summary (see harmonize)
+        grid (np.array): grain sizes [mm] of the common grid
+
+    Returns:
+        np.array: cumulative percentages [%] with shape (n_samples, n_grid)
+    """
+    columns = curve_columns(df)
+    sizes = np.asarray(columns, dtype=float)
+    grid = np.asarray(grid, dtype=float)
+    if sizes.shape == grid.shape and np.allclose(np.sort(sizes), grid):
+        return df[sorted(columns)].to_numpy(dtype=float)
+    return harmonize_curves(sizes, df[columns].to_numpy(dtype=float), grid=grid)
+
+
+def harmonize(df=None, grid=DEFAULT_GRID):
+    """
+    Replaces the cumulative percentage columns of the global summary (one column per sieve found in any sample)
+    by the columns of a common sieve grid, so that all samples share the same dense curve columns.
+
+    Args:
+        df (df): global summary (see utils.append_global)
+        grid (str or np.array): name of a standard grid (see GRIDS) or grain sizes [mm]
+
+    Returns:
+        df: global summary with one cumulative percentage column per grid size, from the largest to the smallest
+            size (as the sieve columns of utils.append_global)
+    """
+    grid = get_grid(grid)
+    curves = resample_curves(df, grid=grid)[:, ::-1]
+    df_curves = pd.DataFrame(curves, columns=grid[::-1], index=df.index)
+    return pd.concat([df.drop(columns=curve_columns(df)), df_curves], axis=1)
@@ -0,0 +1,132 @@
+""" Module containing the vectorized porosity predictors and Kozeny-Carman hydraulic conductivity estimator. All
+functions accept single samples (1d arrays or floats) as well as batches of samples (2d arrays with one sample per
+row) and broadcast porosity and sphericity (SF) arrays against them.
+
+Author: Beatriz Negreiros
+
+"""
+from sedimentanalyst.analyzer.config import *
+
+# names of the porosity estimators, in the order of the columns returned by porosity_predictors
+POROSITY_AUTHORS = ["Carling and Reader (1982)",
+                    "Wu and Wang (2006)",
+                    "Wooster et al. (2008)",
+                    "Frings et al. (2011) "]
+
+# constant of the Kozeny-Carman equation
+KOZENY_CARMAN_CTE = 19900
+
+
+def effective_diameter(grain_sizes=None, fractions=None):
+    """
+    Computes the effective grain diameter for the Kozeny-Carman equation. It only depends on the grain size
+    distribution, thus it has to be computed only once per sample, independently of the porosity.
+
+    Args:
+        grain_sizes (np.array): sieve diameters in mm, ordered from the largest to the smallest sieve. Shape
+            (n_sieves,) if shared by all samples, or (n_samples, n_sieves)
+        fractions (np.array): percentage fraction [%] retained in each sieve, shape (n_sieves,) or
+            (n_samples, n_sieves)
+
+    Returns:
+        np.array: effective diameter Deff [cm], a float for a single sample or shape (n_samples,)
+    """
+    grain_sizes = np.asarray(grain_sizes, dtype=float)
+    fractions = np.asarray(fractions, dtype=float)
+
+    # geometric average of the sieve and of the next larger sieve (0 above the largest sieve)
+    upper_sizes = np.concatenate([np.zeros(grain_sizes.shape[:-1] + (1,)), grain_sizes[..., :-1]], axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        d_ave_cm = ((upper_sizes / 10) ** 0.404) * (grain_sizes / 10) ** 0.595
+        deff_i = fractions / d_ave_cm
+        return 100 / np.nansum(deff_i, axis=-1)
+
+
+def kozeny_carman(deff_cm=None, porosity=None, sf=6.1):
+    """
+    Computes the hydraulic conductivity according to the Kozeny Carman Equation. The arguments are broadcast
+    against each other, e.g., deff_cm[:, None] with porosity of shape (n_samples, n_estimators) gives the kf of all
+    estimators for all samples at once.
+
+    Args:
+        deff_cm (np.array): effective grain diameter [cm]
+        porosity (np.array): porosity [-]
+        sf (np.array): sphericity index [-] (6.1 for rounded sediments)
+
+    Returns:
+        np.array: hydraulic conductivity [m/s]
+    """
+    deff_cm = np.asarray(deff_cm, dtype=float)
+    porosity = np.asarray(porosity, dtype=float)
+    sf = np.asarray(sf, dtype=float)
+    e = porosity / (1 - porosity)
+    return KOZENY_CARMAN_CTE * ((deff_cm / 100) ** 2) * (1 / (sf ** 2)) * ((e ** 3) / (1 + e))
+
+
+def porosity_predictors(d50=None, geometric_std=None, cumulative_5mm=None):
+    """
+    Computes the empirical porosity estimators of Carling and Reader (1982), Wu and Wang (2006), Wooster et al.
+    (2008) and Frings et al. (2011) for one or many samples.
+
+    Args:
+        d50 (np.array): median grain size [mm]
+        geometric_std (np.array): geometric standard deviation after Frings et al. (2011)
+        cumulative_5mm (np.array): fraction [-] of the sample passing through the sieve of the Frings et al. (2011)
+            equation
+
+    Returns:
+        np.array: porosity estimators with shape (..., 4), ordered as POROSITY_AUTHORS
+    """
+    d50 = np.asarray(d50, dtype=float)
+    geometric_std = np.asarray(geometric_std, dtype=float)
+    cumulative_5mm = np.asarray(cumulative_5mm, dtype=float)
+
+    carling = -0.0333 + (0.4665 / ((1000 * d50 / 1000) ** 0.21))
+    wu = 0.13 + (0.21 / ((1000 * d50 / 1000 + 0.002) ** 0.21))
+    wooster = 0.621 * np.exp(-0.457 * geometric_std)
+    frings = 0.353 - 0.068 * geometric_std + 0.146 * cumulative_5mm
+    return np.stack(np.broadcast_arrays(carling, wu, wooster, frings), axis=-1)
+
+
+def porosity_conductivity(d50=None, geometric_std=None, cumulative_5mm=None, deff_cm=None, user_porosity=np.nan,
+                          sf=6.1):
+    """
+    Evaluates all porosity estimators (plus the user input porosity) and their corresponding Kozeny-Carman kf for
+    whole arrays of samples at once.
+
+    Args:
+        d50 (np.array): median grain sizes [mm], shape (n_samples,)
+        geometric_std (np.array): geometric standard deviations, shape (n_samples,)
+        cumulative_5mm (np.array): fractions [-] passing through the sieve of the Frings et al. (2011) equation
+        deff_cm (np.array): effective diameters [cm] (see effective_diameter), shape (n_samples,)
+        user_porosity (np.array): porosity given by the user (np.nan if not available), shape (n_samples,)
+        sf (np.array): sphericity index of each sample, shape (n_samples,) or scalar
+
+    Returns:
+        tuple: porosity array and kf array [m/s], both with shape (n_samples, 5), where the columns are ordered as
+            POROSITY_AUTHORS plus the user input porosity
+    """
+    predictors = porosity_predictors(d50=d50, geometric_std=geometric_std, cumulative_5mm=cumulative_5mm)
+    user_porosity = np.broadcast_to(np.asarray(user_porosity, dtype=float), predictors.shape[:-1])
+    porosity = np.concatenate([predictors, user_porosity[..., None]], axis=-1)
+    kf = kozeny_carman(deff_cm=np.asarray(deff_cm, dtype=float)[..., None], porosity=porosity,
+                       sf=np.asarray(sf, dtype=float)[..., None])
+    return porosity, kf
+
+
+def sf_sensitivity(deff_cm=None, porosity=None, sf_values=np.linspace(6.0, 8.4, 13)):
+    """
+    Sensitivity sweep of the Kozeny-Carman kf over a range of sphericity indexes (SF).
+
+    Args:
+        deff_cm (np.array): effective diameters [cm], shape (n_samples,)
+        porosity (np.array): porosity of each sample, shape (n_samples,) or (n_samples, n_estimators)
+        sf_values (np.array): sphericity indexes to evaluate, shape (n_sf,)
+
+    Returns:
+        np.array: kf [m/s] with shape porosity.shape + (n_sf,)
+    """
+    porosity = np.asarray(porosity, dtype=float)
+    deff_cm = np.asarray(deff_cm, dtype=float)
+    deff_cm = deff_cm.reshape(deff_cm.shape + (1,) * (porosity.ndim - deff_cm.ndim))
+    return kozeny_carman(deff_cm=deff_cm[..., None], porosity=porosity[..., None], sf=np.asarray(sf_values))
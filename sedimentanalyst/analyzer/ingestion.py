@@ -0,0 +1,447 @@
+""" Module designated for the classes IngestionService and SummaryStore: a long-running service that watches a drop
+folder for new sieving files, analyzes them in a worker pool and appends the results to a persistent summary store
+
+Author: Beatriz Negreiros
+
+"""
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from sedimentanalyst.analyzer.config import *
+from sedimentanalyst.analyzer.file_finder import FileIndex
+from sedimentanalyst.analyzer.statistical_analyzer import StatisticalAnalyzer
+from sedimentanalyst.analyzer.utils import append_global, compile_plan
+from sedimentanalyst.analyzer.validation import collect_samples
+from sedimentanalyst.analyzer.batch_statistics import characteristic_percentiles
+
+
+def analyze_file(file=None, dic=None):
+    """
+    Extracts, validates and analyzes all samples of one file. Runs in the worker processes of the IngestionService.
+
+    Args:
+        file (str): path of the sieving file
+        dic (dict): input parameters (see config.get_input)
+
+    Returns:
+        tuple: global summary rows of the valid samples (see utils.append_global), index of each row's sample in
+            the file, and QA report of the file (see validation.qa_report)
+    """
+    percentiles = dic.get("percentiles")
+    samples, report = collect_samples(files=[file], plan=compile_plan(dic),
+                                      min_percentile=characteristic_percentiles(
+                                          percentiles if percentiles is not None else []).min())
+    df = pd.DataFrame()
+    for _, k, sieving_df, metadata in samples:
+        analyzer = StatisticalAnalyzer(sieving_df=sieving_df, metadata=metadata, percentiles=percentiles,
+                                       scale=dic.get("size_scale", "iso"))
+        df = append_global(obj=analyzer, df=df)
+    return df, [k for _, k, _, _ in samples], report
+
+
+class SummaryStore:
+    """
+    A class for persisting global summary rows in an append-only file of json lines (one line per sample), so that
+    new results are appended in milliseconds without rewriting the store. A file that is analyzed again (e.g., after
+    a correction in the lab) replaces its previous rows when the store is loaded.
+
+    Attributes:
+        path (str): path of the store file
+
+    Methods:
+        append (int): appends the rows of one file
+        load (pandas.core.frame.DataFrame): global summary of the latest rows of all files
+    """
+
+    def __init__(self, path=None):
+        self.path = str(path)
+
+    def __repr__(self):
+        return "SummaryStore({0})".format(self.path)
+
+    def append(self, df=None, file=None, samples=None):
+        """
+        Appends summary rows to the store. A file without rows is stored as a tombstone, which removes the rows of
+        its previous ingestion.
+
+        Args:
+            df (pandas.core.frame.DataFrame): global summary rows (see utils.append_global)
+            file (str): path of the analyzed file
+            samples (list): index of each row's sample in the file
+
+        Returns:
+            int: number of appended rows
+        """
+        samples = list(range(len(df))) if samples is None else samples
+        columns = [c.item() if isinstance(c, np.generic) else c for c in df.columns]
+        ingested = time.time()
+        lines = [json.dumps({"file": str(file), "sample": int(k), "ingested": ingested, "columns": columns,
+                             "values": list(row)}, default=str)
+                 for k, row in zip(samples, df.itertuples(index=False, name=None))]
+        if not lines:
+            # tombstone without rows: replaces the rows of a previous ingestion (e.g., all samples now quarantined)
+            lines = [json.dumps({"file": str(file), "sample": None, "ingested": ingested})]
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return len(df)
+
+    def load(self):
+        """
+        Reads the store, keeping the latest rows of every file.
+
+        Returns:
+            pandas.core.frame.DataFrame: global summary (the sieve columns keep their float names)
+        """
+        latest = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # line of a write interrupted by a crash
+                        continue
+                    # the rows of an older ingestion of the file are replaced
+                    ingested, rows = latest.get(record["file"], (None, None))
+                    if ingested != record["ingested"]:
+                        rows = {}
+                        latest[record["file"]] = (record["ingested"], rows)
+                    if record["sample"] is not None:
+                        rows[record["sample"]] = dict(zip(record["columns"], record["values"]))
+        except OSError:
+            return pd.DataFrame()
+        return pd.DataFrame([row for _, rows in latest.values() for row in rows.values()])
+
+
+class IngestionMetrics:
+    """
+    A class for collecting the throughput and latency of the IngestionService.
+
+    Attributes:
+        started (float): start time of the service [s since epoch]
+        counters (dict): number of ingested files and samples, quarantined files and samples, and failures
+        latencies (collections.deque): seconds between the last modification of the recent files and the storage of
+            their results
+        processing_times (collections.deque): seconds spent analyzing the recent files
+
+    Methods:
+        record (None): records an analyzed file
+        snapshot (dict): current metrics
+    """
+
+    def __init__(self, window=1000):
+        self.started = time.time()
+        self.counters = {"files ingested": 0, "samples ingested": 0, "files quarantined": 0,
+                         "samples quarantined": 0, "failures": 0}
+        self.latencies = deque(maxlen=window)
+        self.processing_times = deque(maxlen=window)
+
+    def record(self, n_samples=0, n_quarantined=0, latency=None, processing_time=None, failed=False):
+        """
+        Records the outcome of one file.
+
+        Args:
+            n_samples (int): number of stored samples
+            n_quarantined (int): number of quarantined samples or file issues
+            latency (float): seconds from the last modification of the file to the storage of its results
+            processing_time (float): seconds spent analyzing the file
+            failed (bool): True if the analysis raised an exception
+        """
+        if failed:
+            self.counters["failures"] += 1
+            return
+        self.counters["files ingested"] += 1
+        self.counters["samples ingested"] += n_samples
+        self.counters["samples quarantined"] += n_quarantined
+        self.counters["files quarantined"] += int(n_samples == 0)
+        if latency is not None:
+            self.latencies.append(latency)
+        if processing_time is not None:
+            self.processing_times.append(processing_time)
+
+    def snapshot(self, queue_size=0, pending=0):
+        """
+        Summarizes the metrics.
+
+        Args:
+            queue_size (int): files waiting for a worker
+            pending (int): files waiting for their writes to settle
+
+        Returns:
+            dict: counters, uptime [s], throughput [files/min] and latency and processing time percentiles [s]
+        """
+        uptime = time.time() - self.started
+        metrics = dict(self.counters)
+        metrics.update({"uptime [s]": uptime,
+                        "throughput [files/min]": 60 * self.counters["files ingested"] / uptime if uptime else 0.0,
+                        "queue": queue_size,
+                        "pending": pending})
+        for name, values in [("latency", self.latencies), ("processing time", self.processing_times)]:
+            values = np.asarray(values, dtype=float)
+            for label, q in [("p50", 50), ("p95", 95), ("max", 100)]:
+                metrics["{0} {1} [s]".format(name, label)] = float(np.percentile(values, q)) if values.size else None
+        return metrics
+
+
+class IngestionService:
+    """
+    A class for continuously ingesting the sieving files dropped into a folder. The folder is polled with a
+    FileIndex (only changed directories are listed again). New or replaced files are debounced until their size
+    and modification time stay unchanged for settle_time seconds, so that files still being copied or saved are
+    not read. The settled files are analyzed in a pool of worker processes, and their results are appended to a
+    SummaryStore and their issues to a QA log.
+
+    Attributes:
+        folder (str): path of the watched folder
+        store (SummaryStore): persistent summary of the ingested samples
+        dic (dict): input parameters (see config.get_input)
+        poll_interval (float): seconds between two scans of the folder
+        settle_time (float): seconds a file has to stay unchanged before it is analyzed
+        n_workers (int): number of worker processes (or threads)
+        metrics (IngestionMetrics): throughput and latency metrics
+
+    Methods:
+        run (coroutine): watches the folder until stop is called
+        poll (coroutine): scans the folder once and queues the settled files
+        process (coroutine): analyzes one file and stores its results
+        stop (None): stops the service after the queued files were processed
+        snapshot (dict): current metrics
+    """
+
+    def __init__(self, folder=None, store_path="summary_store.jsonl", dic=None, poll_interval=0.5, settle_time=1.0,
+                 n_workers=2, use_processes=True, state_path=None, metrics_path=None):
+        """
+        Args:
+            folder (str): path of the watched folder
+            store_path (str): path of the summary store (json lines)
+            dic (dict): input parameters (default: config.get_input())
+            poll_interval (float): seconds between two scans of the folder
+            settle_time (float): seconds a file has to stay unchanged before it is analyzed
+            n_workers (int): number of workers analyzing files in parallel
+            use_processes (bool): if False, the workers are threads (e.g., for debugging)
+            state_path (str): path of the json file with the signatures of the ingested files, for resuming after a
+                restart (default: store_path + ".state.json")
+            metrics_path (str): path of a json file rewritten with the metrics after every poll (None: no file)
+        """
+        from sedimentanalyst.analyzer.config import get_input
+        self.dic = get_input() if dic is None else dict(dic)
+        self.folder = str(folder)
+        self.store = SummaryStore(store_path)
+        self.qa_path = str(store_path) + ".qa.jsonl"
+        self.state_path = str(store_path) + ".state.json" if state_path is None else state_path
+        self.metrics_path = metrics_path
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self.n_workers = n_workers
+        self.use_processes = use_processes
+        self.metrics = IngestionMetrics()
+        self.__index = FileIndex(folder=folder,
+                                 patterns=self.dic.get("file_patterns", ["*.xlsx", "*.ods", "*.csv", "*.tsv"]),
+                                 exclude=self.dic.get("exclude_patterns", ["~$*", ".*"]),
+                                 recursive=self.dic.get("recursive", True))
+        self.__pending = {}
+        self.__queued = set()
+        self.__ingested = self.__load_state()
+        self.__failed = {}
+        self.__queue = None
+        self.__stopping = None
+
+    def __repr__(self):
+        return "IngestionService({0}, {1})".format(self.folder, self.store)
+
+    def __load_state(self):
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return {path: tuple(signature) for path, signature in json.load(f).items()}
+        except (OSError, ValueError):
+            return {}
+
+    def __save_state(self):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.__ingested, f)
+        os.replace(tmp_path, self.state_path)
+
+    def __scan(self):
+        self.__index.scan()
+        return self.__index.list_files()
+
+    @staticmethod
+    def __signature(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def snapshot(self):
+        """
+        Current metrics of the service (see IngestionMetrics.snapshot).
+
+        Returns:
+            dict: metrics
+        """
+        return self.metrics.snapshot(queue_size=self.__queue.qsize() if self.__queue is not None else 0,
+                                     pending=len(self.__pending))
+
+    async def poll(self):
+        """
+        Scans the folder once. Files that are new or changed since their ingestion (or their failed analysis) are
+        debounced, and the files whose size and modification time did not change for settle_time seconds are queued.
+        The rows of ingested files that were deleted from the folder are removed from the store (tombstones).
+
+        Returns:
+            int: number of queued files
+        """
+        loop = asyncio.get_running_loop()
+        files = await loop.run_in_executor(None, self.__scan)
+        now = time.monotonic()
+        queued = 0
+        for path in files:
+            if path in self.__queued:
+                continue
+            signature = self.__signature(path)
+            if signature is None or signature in (self.__ingested.get(path), self.__failed.get(path)):
+                self.__pending.pop(path, None)
+                continue
+            previous = self.__pending.get(path)
+            if previous is None or previous[0] != signature:
+                # new file or still being written
+                self.__pending[path] = (signature, now)
+            elif now - previous[1] >= self.settle_time:
+                del self.__pending[path]
+                self.__queued.add(path)
+                await self.__queue.put((path, signature))
+                queued += 1
+
+        # forget pending files that were removed before settling
+        for path in set(self.__pending) - set(files):
+            del self.__pending[path]
+        # remove the rows of the ingested files that were deleted from the folder (unless the folder itself is gone,
+        # e.g., an unmounted drive)
+        removed = set(self.__ingested) - set(files) - self.__queued if os.path.isdir(self.folder) else set()
+        for path in removed:
+            logging.info("Removing the rows of the deleted file {0}".format(path))
+            self.__remove(path)
+        for path in set(self.__failed) - set(files):
+            del self.__failed[path]
+
+        if self.metrics_path is not None:
+            with open(self.metrics_path, "w", encoding="utf-8") as f:
+                json.dump(self.snapshot(), f, indent=1)
+        return queued
+
+    def __remove(self, path):
+        self.store.append(df=pd.DataFrame(), file=path)
+        del self.__ingested[path]
+        self.__save_state()
+
+    async def process(self, executor=None, path=None, signature=None):
+        """
+        Analyzes one file in the worker pool and appends its results to the store. Failures of the analysis or of
+        the storage are logged and counted, so that they never stop the worker.
+
+        Args:
+            executor (concurrent.futures.Executor): worker pool
+            path (str): path of the file
+            signature (tuple): size and modification time [ns] of the file when it was queued
+        """
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            df, samples, report = await loop.run_in_executor(executor, analyze_file, path, self.dic)
+        except Exception as e:
+            logging.error("Failed ingesting {0}: {1}".format(path, e))
+            # not retried until the file changes
+            self.__failed[path] = signature
+            self.metrics.record(failed=True)
+            return
+        processing_time = time.perf_counter() - start
+
+        try:
+            self.store.append(df=df, file=path, samples=samples)
+            issues = report[report["status"] != "ok"]
+            if not issues.empty:
+                with open(self.qa_path, "a", encoding="utf-8") as f:
+                    f.write(issues.to_json(orient="records", lines=True, default_handler=str).rstrip("\n") + "\n")
+            self.__ingested[path] = signature
+            self.__failed.pop(path, None)
+            self.__save_state()
+        except Exception as e:
+            logging.error("Failed storing the results of {0}: {1}".format(path, e))
+            self.__failed[path] = signature
+            self.metrics.record(failed=True)
+            return
+        self.metrics.record(n_samples=len(df), n_quarantined=int((report["status"] == "quarantined").sum()),
+                            latency=time.time() - signature[1] / 1e9, processing_time=processing_time)
+
+    async def __worker(self, executor):
+        while True:
+            path, signature = await self.__queue.get()
+            try:
+                await self.process(executor=executor, path=path, signature=signature)
+            finally:
+                self.__queued.discard(path)
+                self.__queue.task_done()
+
+    async def run(self, duration=None):
+        """
+        Watches the folder and ingests new files until stop is called (or for duration seconds).
+
+        Args:
+            duration (float): seconds to run (None: until stop is called)
+
+        Returns:
+            dict: metrics at the end of the run
+        """
+        self.__queue = asyncio.Queue()
+        self.__stopping = asyncio.Event()
+        pool = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+        deadline = None if duration is None else time.monotonic() + duration
+        with pool(max_workers=self.n_workers) as executor:
+            workers = [asyncio.create_task(self.__worker(executor)) for _ in range(self.n_workers)]
+            try:
+                while not self.__stopping.is_set() and (deadline is None or time.monotonic() < deadline):
+                    await self.poll()
+                    try:
+                        await asyncio.wait_for(self.__stopping.wait(), timeout=self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                # finish the queued files
+                await self.__queue.join()
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+        return self.snapshot()
+
+    def stop(self):
+        """
+        Stops the service after the queued files were processed.
+
+        """
+        if self.__stopping is not None:
+            self.__stopping.set()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Ingest the sieving files dropped into a folder.")
+    parser.add_argument("folder", help="watched folder")
+    parser.add_argument("--store", default="summary_store.jsonl", help="path of the summary store")
+    parser.add_argument("--workers", type=int, default=2, help="number of worker processes")
+    parser.add_argument("--poll", type=float, default=0.5, help="seconds between two scans of the folder")
+    parser.add_argument("--settle", type=float, default=1.0, help="seconds a file has to stay unchanged")
+    parser.add_argument("--metrics", default=None, help="path of a json file with the metrics")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    service = IngestionService(folder=args.folder, store_path=args.store, n_workers=args.workers,
+                               poll_interval=args.poll, settle_time=args.settle, metrics_path=args.metrics)
+    try:
+        asyncio.run(service.run())
+    except KeyboardInterrupt:
+        pass
@@ -8,6 +8,17 @@ from sedimentanalyst.analyzer.statistical_analyzer import StatisticalAnalyzer
 from sedimentanalyst.analyzer.utils import *
 from sedimentanalyst.analyzer.static_plotter import StaticPlotter
 from sedimentanalyst.analyzer.config import get_input
+from sedimentanalyst.analyzer.uncertainty import propagate_batch
+from sedimentanalyst.analyzer.campaign_comparison import compare_campaigns, location_key
+from sedimentanalyst.analyzer.file_finder import infer_campaign
+from sedimentanalyst.analyzer.clustering import add_facies
+from sedimentanalyst.analyzer.harmonization import harmonize
+from sedimentanalyst.analyzer.gridding import interpolate_raster
+from sedimentanalyst.analyzer.mixtures import combine_samples
+from sedimentanalyst.analyzer.distribution_fitting import add_fits
+from sedimentanalyst.analyzer.transport import evaluate_scenarios, scenario_table
+from sedimentanalyst.analyzer.validation import collect_samples
+from sedimentanalyst.analyzer.batch_statistics import characteristic_percentiles
 
 
 def main():
@@ -19,16 +30,35 @@ def main():
     input_local = get_input()
 
     # List of files in the user-selected folder (given in the config)
-    files_to_loop = find_files(input_local["folder_path"])
-
-    # loop through all the samples and compute corresponding
-    for i, file_name in enumerate(files_to_loop):
+    files_to_loop = find_files(folder=input_local["folder_path"],
+                               patterns=input_local["file_patterns"],
+                               exclude=input_local["exclude_patterns"],
+                               recursive=input_local["recursive"],
+                               index_path=input_local["file_index"])
+
+    # compile the input indexes once for all files
+    plan = compile_plan(input_local)
+    analyzers = []
+    campaigns, locations = [], []
+
+    # extract the sieving tables of all samples (sheets or column blocks) from excel or csv and quarantine the
+    # unreadable files and invalid samples
+    samples, df_qa = collect_samples(files=files_to_loop, plan=plan,
+                                     min_percentile=characteristic_percentiles(input_local["percentiles"]).min())
+    df_qa.to_excel("qa_report.xlsx")
+    n_samples = {}
+    for file_name, _, _, _ in samples:
+        n_samples[file_name] = n_samples.get(file_name, 0) + 1
+
+    # loop through all the valid samples and compute corresponding statistics
+    for file_name, k, sieving_df, metadata in samples:
         print(file_name)
-        # extract the sieving table from excel or csv
-        sieving_df, metadata = extract_df(dic=input_local, file=file_name)
-
         # call the class StatisticalAnalyzer
-        analyzer = StatisticalAnalyzer(sieving_df=sieving_df, metadata=metadata)
+        analyzer = StatisticalAnalyzer(sieving_df=sieving_df, metadata=metadata,
+                                       percentiles=input_local["percentiles"], scale=input_local["size_scale"])
+        analyzers.append(analyzer)
+        campaigns.append(infer_campaign(file_name))
+        locations.append(location_key(Path(file_name).stem))
 
         print(analyzer.statistics_df)
         print(analyzer.cumulative_df)
@@ -38,13 +68,65 @@ def main():
         df_global = append_global(obj=analyzer,
                                   df=df_global
                                   )
-        df_global.to_excel("global_dataframe.xlsx")
 
         # call the class StaticPlotter
-        plotter = StaticPlotter(analyzer)
+        plotter = StaticPlotter(analyzer, scale=input_local["size_scale"])
+
+        # outputs the cumulative grain size distribution curve (one image per sample of the file, named after the path
+        # of the file relative to folder_path)
+        suffix = "" if n_samples[file_name] == 1 and k == 0 else "_{0}".format(k)
+        plotter.cum_plotter('outputs/' + output_name(file_name, folder=input_local["folder_path"]) + suffix + '.png')
+
+    df_global.to_excel("global_dataframe.xlsx")
+
+    # map the cumulative curves of all samples onto a common sieve grid (dense curve columns)
+    if input_local["sieve_grid"] is not None:
+        df_global = harmonize(df=df_global, grid=input_local["sieve_grid"])
+        df_global.to_excel("global_dataframe.xlsx")
+
+    # parameters and goodness of fit of parametric distributions
+    if input_local["fit_models"]:
+        df_global = add_fits(df=df_global, models=input_local["fit_models"])
+        df_global.to_excel("global_dataframe.xlsx")
+
+    # critical shear stress, mobility and bedload transport rates of the samples for each shear stress scenario
+    if input_local["shear_stresses"]:
+        results = evaluate_scenarios(df=df_global, tau=input_local["shear_stresses"])
+        df_transport = scenario_table(results=results, names=df_global["sample name"],
+                                      tau=input_local["shear_stresses"])
+        df_transport.to_excel("transport_dataframe.xlsx")
+
+    # classify the samples into sediment facies
+    if input_local["n_facies"] > 0:
+        df_global = add_facies(df=df_global, n_facies=input_local["n_facies"], method=input_local["facies_method"])
+        df_global.to_excel("global_dataframe.xlsx")
 
-        # outputs the cumulative grain size distribution curve
-        plotter.cum_plotter('outputs/' + file_name[8:-5] + '.png')
+    # mass-weighted mixtures of the layers of each core
+    if input_local["layer_pattern"] is not None:
+        df_mixtures = combine_samples(analyzers=analyzers, key=input_local["layer_pattern"], campaigns=campaigns,
+                                      scale=input_local["size_scale"])
+        df_mixtures.to_excel("mixtures_dataframe.xlsx")
+
+    # continuous maps of the statistics (ESRI ASCII grids)
+    for column in input_local["raster_columns"]:
+        raster = interpolate_raster(df=df_global, column=column, projection=input_local["projection"],
+                                    method=input_local["raster_method"], resolution=input_local["raster_resolution"])
+        if raster is not None:
+            raster.to_ascii('outputs/' + re.sub(r"[^\w.-]+", "_", column).strip("_") + '.asc')
+
+    # confidence intervals of the statistics given the weighing errors of the class weights
+    if input_local["n_realizations"] > 0:
+        df_uncertainty = propagate_batch(analyzers=analyzers,
+                                         n_realizations=input_local["n_realizations"],
+                                         relative_error=input_local["weight_relative_error"],
+                                         absolute_error=input_local["weight_absolute_error"])
+        df_uncertainty.to_excel("uncertainty_dataframe.xlsx")
+
+    # paired comparison of the samples taken before and after flushing at the same locations
+    if input_local["n_resamples"] > 0 and {"pre-flush", "post-flush"} <= set(campaigns):
+        df_comparison = compare_campaigns(df=df_global, campaigns=campaigns, locations=locations,
+                                          n_resamples=input_local["n_resamples"])
+        df_comparison.to_excel("campaign_comparison.xlsx")
 
     pass
 
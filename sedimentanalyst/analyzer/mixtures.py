@@ -0,0 +1,182 @@
+""" Module containing the combination of several sieving samples (e.g., the layers of a freeze core or the surface
+and subsurface layers of a sampling point) into mass-weighted mixtures, computed for all groups at once
+
+Author: Beatriz Negreiros
+
+"""
+from sedimentanalyst.analyzer.config import *
+from sedimentanalyst.analyzer import batch_statistics
+from sedimentanalyst.analyzer.harmonization import harmonize_curves
+from sedimentanalyst.analyzer import size_classes
+
+# suffix of the sample names identifying the layer of a core (e.g., "MS3_FC1-2", "MS1 SP1 US"), removed to obtain
+# the name of the core
+LAYER_PATTERN = r"[-_\s]+(?:\d+|OS|US)$"
+
+
+def core_key(name=None, pattern=LAYER_PATTERN):
+    """
+    Derives the name of the core (group) of a layer sample by removing its layer suffix, e.g., "MS3_FC1-1" and
+    "MS3_FC1-2" both give "MS3_FC1".
+
+    Args:
+        name (str): sample name
+        pattern (str): regular expression of the layer suffix
+
+    Returns:
+        str: group key
+    """
+    return re.sub(pattern, "", str(name).strip())
+
+
+def group_codes(names=None, key=LAYER_PATTERN, campaigns=None):
+    """
+    Assigns each sample to a group (mixture). Only layers of the same core and sampling campaign are combined, and
+    each layer appears once per mixture: a layer name repeated within a core (e.g., the same sample stored in
+    several files, or a replicate sieving) starts another mixture of that core.
+
+    Args:
+        names (list): sample names
+        key (str or callable): regular expression of the suffix removed from the names (see core_key), or function
+            mapping a sample name to its group key
+        campaigns (list): sampling campaign of each sample (see file_finder.infer_campaign), None if unknown
+
+    Returns:
+        tuple: list of the groups (sorted tuples of campaign, core key and occurrence of the repeated layers) and
+            array of the group index of each sample
+    """
+    function = key if callable(key) else (lambda name: core_key(name, pattern=key))
+    campaigns = [None] * len(names) if campaigns is None else list(campaigns)
+    occurrences = {}
+    groups = []
+    for name, campaign in zip(names, campaigns):
+        campaign = None if campaign is None else str(campaign)
+        core = str(function(name))
+        layer = (campaign, core, str(name).strip())
+        occurrences[layer] = occurrences.get(layer, 0) + 1
+        groups.append((campaign, core, occurrences[layer] - 1))
+
+    repeated = sorted(layer[2] for layer, n in occurrences.items() if n > 1)
+    if repeated:
+        logging.warning("Layers found more than once are kept in separate mixtures: {0}".format(", ".join(repeated)))
+
+    keys = sorted(set(groups), key=lambda group: ("" if group[0] is None else group[0], group[1], group[2]))
+    index = {group: k for k, group in enumerate(keys)}
+    return keys, np.array([index[group] for group in groups], dtype=int)
+
+
+def harmonized_weights(grain_sizes=None, weights=None, grid=None):
+    """
+    Maps the class weights of samples sieved with different sieve sets onto common sieves. Samples sieved with
+    exactly the grid sieves are copied; for the others, the cumulative mass curve is interpolated log-linearly onto
+    the grid and differentiated back into class weights, so that the total mass of each sample is preserved.
+
+    Args:
+        grain_sizes (list): sieve diameters [mm] of each sample, ordered from the largest to the smallest sieve
+        weights (list): class weights [g] of each sample (same lengths as grain_sizes)
+        grid (np.array): common sieve diameters [mm] (default: union of the sieves of all samples)
+
+    Returns:
+        tuple: common sieve diameters from the largest to the smallest and class weights with shape
+            (n_samples, n_grid)
+    """
+    sizes = [np.asarray(s, dtype=float) for s in grain_sizes]
+    grid = np.unique(np.concatenate(sizes)) if grid is None else np.unique(np.asarray(grid, dtype=float))
+    grid = grid[::-1]
+    matrix = np.zeros((len(sizes), len(grid)))
+
+    # samples sharing the same sieve set are mapped together
+    sets = {}
+    for k, s in enumerate(sizes):
+        sets.setdefault(tuple(s), []).append(k)
+    for sieve_set, rows in sets.items():
+        sieve_set = np.asarray(sieve_set)
+        block = np.vstack([np.asarray(weights[k], dtype=float) for k in rows])
+        if sieve_set.shape == grid.shape and np.array_equal(sieve_set, grid):
+            matrix[rows] = block
+            continue
+        masses = batch_statistics.cumulative_percentages(block)
+        with np.errstate(divide="ignore"):
+            masses = harmonize_curves(sieve_set, masses, grid=grid)
+        matrix[rows] = masses - np.concatenate([masses[:, 1:], np.zeros((len(rows), 1))], axis=1)
+    return grid, matrix
+
+
+def combine_weights(weights=None, codes=None, n_groups=None):
+    """
+    Sums the class weights of the samples of each group (sorted segment sums, without a loop over the groups).
+
+    Args:
+        weights (np.array): class weights [g], shape (n_samples, n_sieves)
+        codes (np.array): group index of each sample, shape (n_samples,)
+        n_groups (int): number of groups (default: codes.max() + 1)
+
+    Returns:
+        np.array: class weights of the mixtures, shape (n_groups, n_sieves)
+    """
+    n_groups = int(codes.max()) + 1 if n_groups is None else n_groups
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    combined = np.zeros((n_groups, weights.shape[1]))
+    combined[sorted_codes[starts]] = np.add.reduceat(weights[order], starts, axis=0)
+    return combined
+
+
+def combine_samples(analyzers=None, key=LAYER_PATTERN, campaigns=None, grid=None, scale="iso"):
+    """
+    Combines the samples of each group into one mixture by summing their class weights on common sieves, and
+    computes the statistics, porosity and kf of all mixtures at once with the functions of batch_statistics.
+
+    Args:
+        analyzers (list): list of StatisticalAnalyzer objects
+        key (str or callable): group definition (see group_codes)
+        campaigns (list): sampling campaign of each analyzer (see file_finder.infer_campaign), None if unknown
+        grid (np.array): common sieve diameters [mm] (default: union of the sieves of all samples)
+        scale (str or list): grain size classes (see size_classes.get_classes)
+
+    Returns:
+        df: one row per group, with the columns of the global summary (see utils.append_global) plus
+            "campaign", "n samples" and "total mass [g]". Repeated mixtures of a core are named with their
+            occurrence, e.g., "MS3_FC2 (2)". The coordinates are the mass-weighted mean of the samples and the
+            date is the date of the first sample of the group.
+    """
+    names = [analyzer.samplename for analyzer in analyzers]
+    keys, codes = group_codes(names, key=key, campaigns=campaigns)
+    grid, weights = harmonized_weights(
+        grain_sizes=[analyzer.original_df["Grain Sizes [mm]"].to_numpy(dtype=float) for analyzer in analyzers],
+        weights=[analyzer.original_df["Fraction Mass [g]"].to_numpy(dtype=float) for analyzer in analyzers],
+        grid=grid)
+
+    combined = combine_weights(weights, codes, n_groups=len(keys))
+    masses = weights.sum(axis=1)
+    total = np.bincount(codes, weights=masses, minlength=len(keys))
+
+    # mass-weighted sphericity and coordinates of the members
+    def weighted_mean(values):
+        values = pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return (np.bincount(codes[valid], weights=(values * masses)[valid], minlength=len(keys))
+                    / np.bincount(codes[valid], weights=masses[valid], minlength=len(keys)))
+
+    sf = weighted_mean([analyzer.sf_porosity for analyzer in analyzers])
+    first = np.unique(codes, return_index=True)[1]
+
+    statistics = batch_statistics.compute_statistics(grain_sizes=grid, weights=combined)
+    conductivity = batch_statistics.compute_porosity_conductivity(grain_sizes=grid, statistics=statistics,
+                                                                  user_porosity=np.nan, sf=np.nan_to_num(sf, nan=6.1))
+
+    columns = {"sample name": [core if k == 0 else "{0} ({1})".format(core, k + 1) for _, core, k in keys],
+               "date": [analyzers[k].sampledate for k in first],
+               "lat": weighted_mean([analyzer.coords[0] for analyzer in analyzers]),
+               "lon": weighted_mean([analyzer.coords[1] for analyzer in analyzers])}
+    columns.update({name: values for name, values in statistics.items() if name not in ["fractions", "cumulative"]})
+    columns.update(conductivity)
+    classes = size_classes.get_classes(scale)
+    percentages = size_classes.class_percentages(grain_sizes=grid, cumulative=statistics["cumulative"], classes=classes)
+    columns.update(zip(size_classes.class_columns(classes), percentages.T))
+    columns.update({"campaign": [campaign for campaign, _, _ in keys],
+                    "n samples": np.bincount(codes, minlength=len(keys)), "total mass [g]": total})
+    columns.update({size: statistics["cumulative"][:, k] for k, size in enumerate(grid)})
+    return pd.DataFrame(columns)
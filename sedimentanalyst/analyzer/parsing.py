@@ -0,0 +1,232 @@
+""" Module designated for the class ExtractionPlan, shared by the analyzer (utils.extract_df) and the app
+(Accessories.parse_contents) for parsing sieving files
+
+Author : Beatriz Negreiros
+
+"""
+
+from sedimentanalyst.analyzer.config import *
+from sedimentanalyst.analyzer.readers import read_sieving_table, read_workbook
+
+# metadata entries of the input dictionary given as [row index, column index]
+METADATA_KEYS = ["index_sample_name", "index_sample_date", "index_lat", "index_long", "porosity", "SF_porosity"]
+
+# default sphericity index (rounded sediments)
+DEFAULT_SF_POROSITY = 6.1
+
+
+class ExtractionPlan:
+    """
+    A class for compiling the input dictionary (see config.get_input or the app's save_inputs) into a reusable
+    plan that knows exactly which cells to fetch from a sieving file. The indexes are validated once when the plan
+    is compiled, and the plan is then applied to every file of a batch.
+
+    Attributes:
+        dic (dict): input dictionary the plan was compiled from
+        table_rows (slice): rows of the sieving table
+        table_columns (list): column indexes of the grain sizes and class weights
+        cells (dict): [row, column] of each metadata entry (None if not given by the user)
+        n_lines (int): number of lines to read from the top of a file
+        sheets (str or list): sheets containing samples (None for the first sheet only)
+        block_offset (int): columns between samples placed side by side (None: one sample per sheet)
+        n_blocks (int): number of side by side samples (None: detected from each sheet)
+
+    Methods:
+        apply (tuple): tabularizes the sieving table and metadata from the raw cells of a file
+        extract (tuple): reads a file and applies the plan
+        extract_workbook (list): reads all sheets of a workbook once and applies the plan to every sample block
+        blocks (generator): yields the plans of the side by side sample blocks of a sheet
+        shifted (ExtractionPlan): plan with all column indexes shifted
+    """
+
+    def __init__(self, dic=None):
+        """
+        Compiles and validates the input dictionary.
+
+        Args:
+            dic (dict): input parameters, see config.get_input
+
+        Raises:
+            ValueError: if an index of the sieving table or of the metadata is not a valid (non-negative) integer
+        """
+        self.dic = dict(dic)
+        header = self.__as_index(dic.get("header"), "header")
+        n_rows = self.__as_index(dic.get("n_rows"), "n_rows")
+        self.table_rows = slice(header, header + n_rows)
+        self.table_columns = [self.__as_index(dic.get("gs_clm"), "gs_clm"),
+                              self.__as_index(dic.get("cw_clm"), "cw_clm")]
+
+        self.cells = {}
+        for key in METADATA_KEYS:
+            index = dic.get(key)
+            if index is None:
+                self.cells[key] = None
+            elif len(index) != 2:
+                raise ValueError("Index {0} must be given as [row, column], got {1}.".format(key, index))
+            else:
+                self.cells[key] = [self.__as_index(index[0], key), self.__as_index(index[1], key)]
+
+        rows = [self.table_rows.stop] + [cell[0] + 1 for cell in self.cells.values() if cell is not None]
+        self.n_lines = max(rows)
+        self.sheets = dic.get("sheets")
+        self.block_offset = dic.get("block_offset")
+        self.n_blocks = dic.get("n_blocks")
+
+    def __repr__(self):
+        return "ExtractionPlan({0})".format(self.dic)
+
+    def apply(self, df=None, source=None):
+        """
+        Tabularizes the sieving table and the metadata of one sample from the raw cells of a file or sheet.
+
+        Args:
+            df (df): raw cells of the file (without header), as returned by readers.read_sieving_table
+            source (str): name of the file, for error messages
+
+        Returns:
+            df: dataframe containing grain sizes and class weights
+            list: list of sample's information as following: [samplename, sampledate, (lat, long), porosity,
+                sf_porosity]
+
+        Raises:
+            ValueError: if the sieving table contains non-numeric cells
+        """
+        values = df.to_numpy()
+        try:
+            table = values[self.table_rows, self.table_columns].astype(float)
+        except (ValueError, TypeError) as e:
+            raise ValueError("Non-numeric cell in the sieving table of {0}: {1}".format(source, e))
+        except IndexError:
+            raise ValueError("Columns {0} of the sieving table are not available in {1}.".format(
+                self.table_columns, source))
+
+        metadata_values = {key: self.__get_cell(values, key, source) for key in METADATA_KEYS}
+        sf_porosity = self.__as_float(metadata_values["SF_porosity"])
+        metadata = [metadata_values["index_sample_name"],
+                    metadata_values["index_sample_date"],
+                    (metadata_values["index_lat"], metadata_values["index_long"]),
+                    self.__as_float(metadata_values["porosity"]),
+                    DEFAULT_SF_POROSITY if sf_porosity is None else sf_porosity]
+
+        sieving_df = pd.DataFrame(table, columns=["Grain Sizes [mm]", "Fraction Mass [g]"])
+        return sieving_df, metadata
+
+    def extract(self, file=None, file_name=None):
+        """
+        Reads the required lines of a sieving file and applies the plan.
+
+        Args:
+            file (str or file-like): path of the file or buffer with its content
+            file_name (str): name of the file (used for detecting the format of buffers)
+
+        Returns:
+            tuple: sieving dataframe and metadata list, see apply
+        """
+        df = read_sieving_table(file, n_lines=self.n_lines, file_name=file_name)
+        return self.apply(df, source=file_name or file)
+
+    def extract_workbook(self, file=None, file_name=None, errors=None):
+        """
+        Reads the sheets of a workbook once and applies the plan to every sample block (one per sheet and/or side
+        by side column blocks). Blocks that cannot be parsed are logged and skipped.
+
+        Args:
+            file (str or file-like): path of the file or buffer with its content
+            file_name (str): name of the file (used for detecting the format of buffers)
+            errors (list): list to which the messages of the skipped blocks are appended (e.g., for a QA report)
+
+        Returns:
+            list: list of tuples (sieving dataframe, metadata), see apply
+        """
+        source = file_name or file
+        sheets = read_workbook(file, n_lines=self.n_lines, sheets=self.sheets, file_name=file_name)
+
+        samples = []
+        for sheet_name, df in sheets.items():
+            for plan in self.blocks(df):
+                try:
+                    samples.append(plan.apply(df, source=source))
+                except ValueError as e:
+                    message = "Skipping sample block at column {0} of sheet {1}: {2}".format(
+                        plan.table_columns[0], sheet_name, e)
+                    logging.error(message)
+                    if errors is not None:
+                        errors.append(message)
+        return samples
+
+    def blocks(self, df=None):
+        """
+        Yields the plans of the sample blocks of a sheet, i.e., the plan shifted by multiples of block_offset.
+        Without block_offset, the sheet holds one sample. If n_blocks is None, blocks are read until the grain size
+        column is empty or outside the sheet.
+
+        Args:
+            df (df): raw cells of the sheet (without header)
+
+        Yields:
+            ExtractionPlan: plan of the sample block
+        """
+        if not self.block_offset:
+            yield self
+            return
+
+        k = 0
+        while self.n_blocks is None or k < self.n_blocks:
+            plan = self.shifted(k * self.block_offset)
+            if max(plan.table_columns) >= df.shape[1]:
+                break
+            if self.n_blocks is None and df.iloc[plan.table_rows, plan.table_columns[0]].isna().all():
+                break
+            yield plan
+            k += 1
+
+    def shifted(self, offset=0):
+        """
+        Creates a plan with the column indexes of the sieving table and metadata shifted by offset.
+
+        Args:
+            offset (int): number of columns to shift
+
+        Returns:
+            ExtractionPlan: shifted plan
+        """
+        if offset == 0:
+            return self
+        dic = dict(self.dic)
+        dic["gs_clm"] = self.table_columns[0] + offset
+        dic["cw_clm"] = self.table_columns[1] + offset
+        for key, cell in self.cells.items():
+            if cell is not None:
+                dic[key] = [cell[0], cell[1] + offset]
+        return ExtractionPlan(dic)
+
+    def __get_cell(self, values, key, source):
+        """
+        Returns the value of a metadata cell, or None if the index was not given or is outside the file.
+
+        """
+        cell = self.cells[key]
+        if cell is None:
+            return None
+        if cell[0] >= values.shape[0] or cell[1] >= values.shape[1]:
+            logging.warning("Index {0} {1} is outside of {2}, assigning None.".format(key, cell, source))
+            return None
+        value = values[cell[0], cell[1]]
+        return None if pd.isna(value) else value
+
+    @staticmethod
+    def __as_float(value):
+        try:
+            return None if value is None else float(value)
+        except (ValueError, TypeError):
+            return None
+
+    @staticmethod
+    def __as_index(value, key):
+        try:
+            index = int(value)
+        except (ValueError, TypeError):
+            raise ValueError("Index {0} must be an integer, got {1}.".format(key, value))
+        if index < 0 or index != value:
+            raise ValueError("Index {0} must be a non-negative integer, got {1}.".format(key, value))
+        return index
@@ -0,0 +1,177 @@
+""" Module containing the readers of sieving files (Excel workbooks and delimited text files)
+
+Author: Beatriz Negreiros
+
+"""
+from sedimentanalyst.analyzer.config import *
+
+EXCEL_EXTENSIONS = (".xlsx", ".xlsm")
+ODS_EXTENSIONS = (".ods",)
+TEXT_EXTENSIONS = (".csv", ".tsv", ".txt")
+
+# numbers written with a decimal comma, e.g. "0,063" (common in german lab exports)
+_DECIMAL_COMMA = re.compile(r"^[+-]?\d+,\d+$")
+
+
+def detect_format(file_name=None, content=None):
+    """
+    Detects the format of a sieving file from its extension or, if the extension is unknown, from its first bytes.
+
+    Args:
+        file_name (str): name or path of the file
+        content (bytes): first bytes of the file (optional, used when the extension is not conclusive)
+
+    Returns:
+        str: "excel", "ods" or "text"
+    """
+    extension = os.path.splitext(str(file_name).lower())[1] if file_name is not None else ""
+    if extension in EXCEL_EXTENSIONS:
+        return "excel"
+    if extension in ODS_EXTENSIONS:
+        return "ods"
+    if extension in TEXT_EXTENSIONS:
+        return "text"
+
+    # xlsx and ods files are zip archives
+    if content is None and file_name is not None and os.path.isfile(str(file_name)):
+        with open(file_name, "rb") as f:
+            content = f.read(4)
+    if content is not None and bytes(content[:2]) == b"PK":
+        return "excel"
+    return "text"
+
+
+def read_sieving_table(file=None, n_lines=None, file_format=None, file_name=None):
+    """
+    Reads the top of a sieving file into a dataframe without header, where rows and columns correspond to the
+    row and column indexes used in the input parameters.
+
+    Args:
+        file (str or file-like): path of the file or buffer with its content (e.g., io.BytesIO from an upload)
+        n_lines (int): number of lines to read (None reads the entire file)
+        file_format (str): "excel", "ods" or "text" (None: detected from file_name or file)
+        file_name (str): name of the file, used for detecting the format of buffers
+
+    Returns:
+        df: dataframe with the raw cells of the file
+    """
+    if file_format is None:
+        if isinstance(file, (str, Path)):
+            file_format = detect_format(file_name=file)
+        else:
+            file_format = detect_format(file_name=file_name, content=_peek(file))
+
+    if file_format == "excel":
+        return pd.read_excel(file, engine="openpyxl", header=None, nrows=n_lines)
+    if file_format == "ods":
+        return pd.read_excel(file, engine="odf", header=None, nrows=n_lines)
+    return read_text_table(file, n_lines=n_lines)
+
+
+def read_workbook(file=None, n_lines=None, sheets=None, file_format=None, file_name=None):
+    """
+    Reads the top of several sheets of a workbook at once (the file is opened a single time).
+
+    Args:
+        file (str or file-like): path of the file or buffer with its content
+        n_lines (int): number of lines to read from each sheet (None reads the entire sheets)
+        sheets (str or list): None for the first sheet only, "all" for all sheets or a list of sheet names/indexes
+        file_format (str): "excel", "ods" or "text" (None: detected from file_name or file)
+        file_name (str): name of the file, used for detecting the format of buffers
+
+    Returns:
+        dict: dataframes with the raw cells of each sheet, keyed by sheet name (delimited text files have a single
+            sheet with key 0)
+    """
+    if file_format is None:
+        if isinstance(file, (str, Path)):
+            file_format = detect_format(file_name=file)
+        else:
+            file_format = detect_format(file_name=file_name, content=_peek(file))
+
+    if file_format == "text":
+        return {0: read_text_table(file, n_lines=n_lines)}
+
+    engine = "openpyxl" if file_format == "excel" else "odf"
+    sheet_name = 0 if sheets is None else (None if sheets == "all" else list(sheets))
+    frames = pd.read_excel(file, engine=engine, header=None, nrows=n_lines, sheet_name=sheet_name)
+    return frames if isinstance(frames, dict) else {0: frames}
+
+
+def read_text_table(file=None, n_lines=None):
+    """
+    Reads the first lines of a delimited text file (csv, tsv or semicolon separated) with the csv module.
+    The delimiter is sniffed from the beginning of the file and numbers (also with decimal comma) are converted
+    to float.
+
+    Args:
+        file (str or file-like): path of the file or buffer (bytes or text) with its content
+        n_lines (int): number of lines to read (None reads the entire file)
+
+    Returns:
+        df: dataframe with the raw cells of the file (rows of different lengths are padded with None)
+    """
+    lines = _read_lines(file, n_lines=n_lines)
+
+    try:
+        dialect = csv.Sniffer().sniff("\n".join(lines[:50]), delimiters=",;\t|")
+    except csv.Error:
+        dialect = csv.excel
+
+    rows = [[_to_value(cell) for cell in row] for row in csv.reader(lines, dialect)]
+    return pd.DataFrame(rows)
+
+
+def _read_lines(file, n_lines=None):
+    """
+    Reads the first n_lines lines of a text file or buffer, stopping as soon as enough lines were read.
+
+    """
+    if isinstance(file, (str, Path)):
+        with open(file, "rb") as f:
+            raw_lines = list(itertools.islice(f, n_lines))
+    else:
+        content = file.read()
+        raw_lines = content.splitlines(keepends=True)[:n_lines]
+    return [_decode(line) if isinstance(line, bytes) else line for line in raw_lines]
+
+
+def _peek(buffer):
+    """
+    Reads the first bytes of a buffer without moving its position.
+
+    """
+    if not hasattr(buffer, "read"):
+        return None
+    position = buffer.tell()
+    content = buffer.read(4)
+    buffer.seek(position)
+    return content if isinstance(content, bytes) else None
+
+
+def _decode(raw):
+    """
+    Decodes the bytes of a text line, trying utf-8 first and latin-1 (common in lab instrument exports) next.
+
+    """
+    try:
+        return raw.decode("utf-8-sig").rstrip("\r\n")
+    except UnicodeDecodeError:
+        return raw.decode("latin-1").rstrip("\r\n")
+
+
+def _to_value(cell):
+    """
+    Converts a cell of a text file to float if it represents a number, otherwise returns the stripped string
+    (or None if the cell is empty).
+
+    """
+    cell = cell.strip()
+    if cell == "":
+        return None
+    try:
+        return float(cell)
+    except ValueError:
+        if _DECIMAL_COMMA.match(cell):
+            return float(cell.replace(",", "."))
+    return cell
@@ -0,0 +1,128 @@
+""" Module containing the schema of the global summary: its columns are classified once into named groups (metadata,
+diameters, statistics, porosity, kf, size classes and curve), so that the plots and the app select columns by group
+instead of by position, independently of the number of sieves and of the computed statistics.
+
+Author: Beatriz Negreiros
+
+"""
+import functools
+
+from sedimentanalyst.analyzer.config import *
+from sedimentanalyst.analyzer.batch_statistics import STATISTIC_NAMES, percentile_columns
+from sedimentanalyst.analyzer.harmonization import curve_columns
+
+# metadata columns of the samples (see utils.append_global)
+METADATA_COLUMNS = ["sample name", "date", "lat", "lon"]
+
+# column groups in the order of the global summary
+GROUPS = ["metadata", "diameters", "statistics", "porosity", "kf", "classes", "curve", "other"]
+
+
+class SummarySchema:
+    """
+    A class for looking up the columns of a global summary by group. The groups and their positions are computed
+    once per set of columns (see SummarySchema.of).
+
+    Attributes:
+        names (list): column names of the summary
+        groups (dict): column names of each group of GROUPS
+        positions (dict): np.array of the column positions of each group
+
+    Methods:
+        columns (list): column names of one or more groups
+        select (df): columns of one or more groups of a summary
+        of (SummarySchema): cached schema of a list of columns
+    """
+
+    def __init__(self, columns=None):
+        """
+        Args:
+            columns (list): column names of the global summary
+        """
+        self.names = list(columns)
+        empty = pd.DataFrame(columns=self.names)
+        diameters = set(percentile_columns(empty))
+        curve = set(curve_columns(empty))
+        self.groups = {group: [] for group in GROUPS}
+        positions = {group: [] for group in GROUPS}
+        for k, c in enumerate(self.names):
+            group = self.__classify(c, diameters, curve)
+            self.groups[group].append(c)
+            positions[group].append(k)
+        self.positions = {group: np.array(positions[group], dtype=int) for group in GROUPS}
+
+    def __repr__(self):
+        return "SummarySchema({0})".format(", ".join("{0}: {1}".format(group, len(self.groups[group]))
+                                                     for group in GROUPS))
+
+    @staticmethod
+    def __classify(column, diameters, curve):
+        if column in curve:
+            return "curve"
+        if not isinstance(column, str):
+            return "other"
+        if column in METADATA_COLUMNS:
+            return "metadata"
+        if column in diameters:
+            return "diameters"
+        if column in STATISTIC_NAMES:
+            return "statistics"
+        if column.endswith(" [Porosity]"):
+            return "porosity"
+        if column.endswith(" [Estimated kf]"):
+            return "kf"
+        if column.endswith(" [%]"):
+            return "classes"
+        return "other"
+
+    @staticmethod
+    @functools.lru_cache(maxsize=32)
+    def __cached(columns):
+        return SummarySchema(columns)
+
+    @staticmethod
+    def of(columns=None):
+        """
+        Returns the schema of a list of columns, classifying them only once per set of columns.
+
+        Args:
+            columns (list): column names of the global summary (or the summary itself)
+
+        Returns:
+            SummarySchema: schema
+        """
+        columns = columns.columns if isinstance(columns, pd.DataFrame) else columns
+        return SummarySchema.__cached(tuple(c.item() if isinstance(c, np.generic) else c for c in columns))
+
+    def columns(self, *groups):
+        """
+        Lists the columns of one or more groups, in the order of the groups.
+
+        Args:
+            groups (str): names of the groups (see GROUPS)
+
+        Returns:
+            list: column names
+        """
+        unknown = [group for group in groups if group not in GROUPS]
+        if unknown:
+            raise KeyError("Unknown column groups {0}, use {1}.".format(", ".join(unknown), ", ".join(GROUPS)))
+        return [c for group in groups for c in self.groups[group]]
+
+    def select(self, df=None, *groups):
+        """
+        Selects the columns of one or more groups from a summary with this schema. A group of consecutive columns is
+        selected with a positional slice, which pandas returns without copying the values.
+
+        Args:
+            df (pandas.core.frame.DataFrame): global summary with the columns of the schema
+            groups (str): names of the groups (see GROUPS)
+
+        Returns:
+            pandas.core.frame.DataFrame: selected columns
+        """
+        self.columns(*groups)
+        positions = np.concatenate([self.positions[group] for group in groups]) if groups else np.array([], int)
+        if positions.size and np.all(np.diff(positions) == 1):
+            return df.iloc[:, positions[0]:positions[-1] + 1]
+        return df.iloc[:, positions]
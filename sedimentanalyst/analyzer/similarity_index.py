@@ -0,0 +1,148 @@
+""" Module designated for the class SimilarityIndex
+
+Author : Beatriz Negreiros
+
+"""
+
+from sedimentanalyst.analyzer.config import *
+from sedimentanalyst.analyzer.harmonization import DEFAULT_GRID, resample_curves
+from scipy.spatial import cKDTree
+
+# statistics describing a grain size distribution in the feature space
+DEFAULT_FEATURES = ["d16", "d50", "d84", "Geometric Standard Deviation"]
+
+
+class SimilarityIndex:
+    """
+    A class for finding samples with similar grain size distributions. The samples are indexed with a KD-tree,
+    either on their cumulative curves resampled onto a common sieve grid or on characteristic statistics (log
+    transformed and standardized).
+
+    Attributes:
+        names (np.array): sample names, in the order of the indexed vectors
+        mode (str): "curve" or "features"
+        grid (np.array): common sieve grid [mm] (curve mode)
+        features (list): statistics used as features (features mode)
+        vectors (np.array): indexed vectors, shape (n_samples, n_dimensions)
+        tree (scipy.spatial.cKDTree): KD-tree over the vectors
+
+    Methods:
+        query (df): k nearest neighbours of a sample or vector
+        query_radius (df): samples within a distance of a sample or vector
+        vector_of (np.array): indexed vector of a sample
+    """
+
+    def __init__(self, df=None, mode="curve", grid=DEFAULT_GRID, features=DEFAULT_FEATURES):
+        """
+        Builds the index from the global summary.
+
+        Args:
+            df (df): global summary (see utils.append_global)
+            mode (str): "curve" for indexing the resampled cumulative curves, "features" for indexing statistics
+            grid (np.array): common sieve grid [mm] (curve mode)
+            features (list): names of the statistic columns (features mode)
+        """
+        self.mode = mode
+        self.grid = np.asarray(grid, dtype=float)
+        self.features = list(features)
+        self.__mean = None
+        self.__std = None
+
+        if mode == "curve":
+            vectors = resample_curves(df, grid=self.grid)
+        elif mode == "features":
+            vectors = self.__scale(np.log(df[self.features].to_numpy(dtype=float)), fit=True)
+        else:
+            raise ValueError("Unknown similarity mode {0}, use 'curve' or 'features'.".format(mode))
+
+        # samples that cannot be represented (e.g., missing sieves) are not indexed
+        valid = ~np.isnan(vectors).any(axis=1)
+        if not valid.all():
+            logging.warning("{0} samples could not be indexed.".format(int((~valid).sum())))
+        self.names = df["sample name"].to_numpy()[valid]
+        self.vectors = vectors[valid]
+        self.tree = cKDTree(self.vectors)
+
+    def __repr__(self):
+        return "SimilarityIndex({0} samples, mode={1})".format(len(self.names), self.mode)
+
+    def vector_of(self, sample_name=None):
+        """
+        Returns the indexed vector of a sample.
+
+        Args:
+            sample_name (str): name of the sample
+
+        Returns:
+            np.array: vector of the sample
+        """
+        return self.vectors[self.__position(sample_name)]
+
+    def query(self, reference=None, k=5, exclude_self=True):
+        """
+        Finds the k samples most similar to a reference.
+
+        Args:
+            reference (str or np.array): sample name or vector (resampled curve or feature vector)
+            k (int): number of neighbours
+            exclude_self (bool): if True and reference is a sample name, the sample itself is not returned
+
+        Returns:
+            df: neighbours with the columns "sample name" and "distance", sorted by distance and indexed by their
+                position in vectors
+        """
+        vector, own_position = self.__reference(reference, exclude_self)
+        n = min(k + (own_position is not None), len(self.names))
+        distances, positions = self.tree.query(vector, k=n)
+        distances, positions = np.atleast_1d(distances), np.atleast_1d(positions)
+        return self.__result(positions, distances, own_position).iloc[:k]
+
+    def query_radius(self, reference=None, radius=1.0, exclude_self=True):
+        """
+        Finds all samples within a distance of a reference.
+
+        Args:
+            reference (str or np.array): sample name or vector (resampled curve or feature vector)
+            radius (float): maximum distance (in percent for curves, standardized units for features)
+            exclude_self (bool): if True and reference is a sample name, the sample itself is not returned
+
+        Returns:
+            df: neighbours with the columns "sample name" and "distance", sorted by distance and indexed by their
+                position in vectors
+        """
+        vector, own_position = self.__reference(reference, exclude_self)
+        positions = np.asarray(self.tree.query_ball_point(vector, r=radius), dtype=int)
+        distances = np.linalg.norm(self.vectors[positions] - vector, axis=1)
+        order = np.argsort(distances)
+        return self.__result(positions[order], distances[order], own_position)
+
+    def __position(self, sample_name):
+        position = np.flatnonzero(self.names == sample_name)
+        if position.size == 0:
+            raise KeyError("Sample {0} is not in the index.".format(sample_name))
+        return position[0]
+
+    def __reference(self, reference, exclude_self):
+        """
+        Returns the vector of a reference and, if it is an indexed sample to be excluded, its position.
+
+        """
+        if isinstance(reference, str):
+            position = self.__position(reference)
+            return self.vectors[position], position if exclude_self else None
+        vector = np.asarray(reference, dtype=float)
+        if self.mode == "features":
+            vector = self.__scale(np.log(vector))
+        return vector, None
+
+    def __result(self, positions, distances, own_position=None):
+        keep = positions != own_position if own_position is not None else slice(None)
+        return pd.DataFrame({"sample name": self.names[positions][keep], "distance": distances[keep]},
+                            index=positions[keep])
+
+    def __scale(self, values, fit=False):
+        if fit:
+            self.__mean = np.nanmean(values, axis=0)
+            self.__std = np.nanstd(values, axis=0)
+            self.__std[self.__std == 0] = 1
+        return (values - self.__mean) / self.__std
@@ -0,0 +1,157 @@
+""" Module containing the grain size class definitions (ISO 14688 and Wentworth scales) and the mass percentages of
+the samples in each class, computed for all samples at once from their cumulative curves. The same definitions
+draw the class boxes of the static plots.
+
+Author: Beatriz Negreiros
+
+"""
+from sedimentanalyst.analyzer.config import *
+from sedimentanalyst.analyzer import batch_statistics
+
+# size classes (name, main class, lower and upper limit [mm]) from the finest to the coarsest, after ISO 14688-1
+ISO_CLASSES = [("Clay", "Clay", 0.0, 0.002),
+               ("Silt", "Silt", 0.002, 0.063),
+               ("Fine sand", "Sand", 0.063, 0.2),
+               ("Medium sand", "Sand", 0.2, 0.63),
+               ("Coarse sand", "Sand", 0.63, 2.0),
+               ("Fine gravel", "Gravel", 2.0, 6.3),
+               ("Medium gravel", "Gravel", 6.3, 20.0),
+               ("Coarse gravel", "Gravel", 20.0, 63.0),
+               ("Cobble", "Cobble", 63.0, 200.0),
+               ("Boulder", "Boulder", 200.0, np.inf),
+               ]
+
+# size classes after Wentworth (1922)
+WENTWORTH_CLASSES = [("Clay", "Clay", 0.0, 0.0039),
+                     ("Silt", "Silt", 0.0039, 0.0625),
+                     ("Very fine sand", "Sand", 0.0625, 0.125),
+                     ("Fine sand", "Sand", 0.125, 0.25),
+                     ("Medium sand", "Sand", 0.25, 0.5),
+                     ("Coarse sand", "Sand", 0.5, 1.0),
+                     ("Very coarse sand", "Sand", 1.0, 2.0),
+                     ("Granule", "Gravel", 2.0, 4.0),
+                     ("Pebble", "Gravel", 4.0, 64.0),
+                     ("Cobble", "Cobble", 64.0, 256.0),
+                     ("Boulder", "Boulder", 256.0, np.inf),
+                     ]
+
+# scales selectable by name
+SCALES = {"iso": ISO_CLASSES,
+          "wentworth": WENTWORTH_CLASSES,
+          }
+
+
+def get_classes(scale="iso"):
+    """
+    Returns the size classes of a scale given by name (see SCALES) or as a list of classes.
+
+    Args:
+        scale (str or list): name of the scale or list of (name, main class, lower [mm], upper [mm]) tuples
+
+    Returns:
+        list: size classes from the finest to the coarsest
+    """
+    if isinstance(scale, str):
+        if scale not in SCALES:
+            raise ValueError("Unknown size class scale {0}, use one of {1}.".format(scale, ", ".join(SCALES)))
+        return SCALES[scale]
+    return list(scale)
+
+
+def class_limits(classes=ISO_CLASSES):
+    """
+    Limits between consecutive size classes (the lower limit of the finest class and the upper limit of the
+    coarsest class are open).
+
+    Args:
+        classes (list): size classes from the finest to the coarsest
+
+    Returns:
+        np.array: grain sizes [mm] in increasing order, shape (n_classes - 1,)
+    """
+    return np.array([upper for _, _, _, upper in classes[:-1]], dtype=float)
+
+
+def class_label(size_class=None):
+    """
+    Label of a size class within its main class, e.g., "fine" for the fine sand (empty for classes without
+    subdivision, such as silt).
+
+    Args:
+        size_class (tuple): (name, main class, lower [mm], upper [mm])
+
+    Returns:
+        str: label
+    """
+    name, group = size_class[0], size_class[1]
+    return re.sub(group, "", name, flags=re.IGNORECASE).strip().lower()
+
+
+def class_percentages(grain_sizes=None, cumulative=None, classes=ISO_CLASSES):
+    """
+    Computes the mass percentage of all samples in each size class, from a single log-linear interpolation of the
+    cumulative curves at the class limits (as batch_statistics.passing_at). The curve is unknown finer than the
+    smallest and coarser than the largest sieve: the classes with a limit outside of the sieves are NaN, unless no mass
+    passes the smallest sieve (the finer classes are empty) or all mass passes the largest sieve (the coarser classes
+    are empty).
+
+    Args:
+        grain_sizes (np.array): sieve diameters [mm] ordered from the largest to the smallest sieve, shape
+            (n_sieves,) or (n, n_sieves)
+        cumulative (np.array): cumulative percentages [%], shape (n, n_sieves)
+        classes (list): size classes from the finest to the coarsest
+
+    Returns:
+        np.array: percentages [%] with shape (n, n_classes); the classes of a sample sum up to 100 % if the sieves
+            cover its whole curve
+    """
+    cumulative = np.atleast_2d(np.asarray(cumulative, dtype=float))
+    grain_sizes = np.broadcast_to(np.asarray(grain_sizes, dtype=float), cumulative.shape)
+    limits = class_limits(classes)
+    with np.errstate(divide="ignore"):
+        passing = batch_statistics.batch_interp(x=np.log(limits), xp=np.log(grain_sizes[:, ::-1]),
+                                                fp=cumulative[:, ::-1])
+    # limits outside of the sieves (batch_interp clips them to the curve ends)
+    passing[(limits < grain_sizes[:, -1:]) & (cumulative[:, -1:] > 0)] = np.nan
+    passing[(limits > grain_sizes[:, :1]) & (cumulative[:, :1] < 100)] = np.nan
+    n = cumulative.shape[0]
+    passing = np.concatenate([np.zeros((n, 1)), passing, np.full((n, 1), 100.0)], axis=1)
+    return np.clip(np.diff(passing, axis=1), 0, None)
+
+
+def class_columns(classes=ISO_CLASSES):
+    """
+    Names of the size class columns of the global summary.
+
+    Args:
+        classes (list): size classes
+
+    Returns:
+        list: column names, e.g., "Fine sand [%]"
+    """
+    return ["{0} [%]".format(name) for name, _, _, _ in classes]
+
+
+def main_classes(classes=ISO_CLASSES, left=0.0, right=np.inf):
+    """
+    Extent of the main classes (e.g., sand or gravel) within a grain size range, for drawing their boxes.
+
+    Args:
+        classes (list): size classes from the finest to the coarsest
+        left (float): smallest grain size [mm] of the range
+        right (float): largest grain size [mm] of the range
+
+    Returns:
+        list: tuples (main class, lower [mm], upper [mm], labels of its subclasses) of the main classes that overlap
+            the range, with the limits clipped to the range
+    """
+    groups = []
+    for name, group, lower, upper in classes:
+        if upper <= left or lower >= right:
+            continue
+        if groups and groups[-1][0] == group:
+            groups[-1][2] = min(upper, right)
+            groups[-1][3].append(class_label((name, group, lower, upper)))
+        else:
+            groups.append([group, max(lower, left), min(upper, right), [class_label((name, group, lower, upper))]])
+    return [tuple(group) for group in groups]
@@ -5,6 +5,10 @@ Author : Federica Scolari
 """
 
 from sedimentanalyst.analyzer.config import *
+from sedimentanalyst.analyzer.size_classes import get_classes, class_limits, main_classes
+
+# grain size range of the plots [mm]
+PLOT_LIMITS = (0.031, 250)
 
 
 class StaticPlotter:
@@ -15,14 +19,16 @@ class StaticPlotter:
         analyzer (StatisticalAnalyzer): StatisticalAnalyzer object containing all the computed sample statistics.
                                         For more information check the Class StatisticalAnalyzer
         cum_df: DataFrame containing the Grain Sizes [mm] and the corresponding Cumulative Percentage [%]
+        classes (list): grain size classes drawn as boxes above the plot (see size_classes.get_classes)
 
     Methods:
         cum_plotter(output): Plots the cumulative grain size distribution curve for each sample
     """
 
-    def __init__(self, analyzer):
+    def __init__(self, analyzer, scale="iso"):
         self.actual_analyzer = analyzer
         self.cum_df = self.actual_analyzer.cumulative_df
+        self.classes = get_classes(scale)
 
     def cum_plotter(self, output):
         """
@@ -65,19 +71,16 @@ class StaticPlotter:
         Returns:
              None
         """
-        # setting text and appearance of the various ticks
-
-        ax.text(0.22, 1.18, 'Sand', fontsize=10, transform=ax.transAxes, verticalalignment='top')
-        ax.add_patch(plt.Rectangle((0.074, 1), 0.389, 0.21, clip_on=False, transform=ax.transAxes,
-                                   linewidth=1, fill=False))
-        ax.text(0.60, 1.18, 'Gravel', fontsize=10, transform=ax.transAxes, verticalalignment='top')
-        ax.add_patch(plt.Rectangle((0.074 + 0.389, 1), 0.384, 0.21, clip_on=False, transform=ax.transAxes,
-                                   linewidth=1, fill=False))
-        ax.text(0.88, 1.13, 'Cobble', fontsize=10, transform=ax.transAxes, verticalalignment='top')
-        ax.add_patch(plt.Rectangle((0.847, 1), 0.1533, 0.21, clip_on=False, transform=ax.transAxes,
-                                   linewidth=1, fill=False))
-        ax.text(0.003, 1.13, 'Silt', fontsize=10, transform=ax.transAxes, verticalalignment='top')
-        ax.add_patch(plt.Rectangle((0, 1), 0.074, 0.21, clip_on=False, transform=ax.transAxes, linewidth=1, fill=False))
+        # one box per main class of the scale, placed in axes coordinates of the log axis
+        left, right = PLOT_LIMITS
+        for group, lower, upper, labels in main_classes(self.classes, left=left, right=right):
+            x0, x1 = np.log([lower / left, upper / left]) / np.log(right / left)
+            ax.add_patch(plt.Rectangle((x0, 1), x1 - x0, 0.21, clip_on=False, transform=ax.transAxes,
+                                       linewidth=1, fill=False))
+            # the names of subdivided classes are placed above the labels of their subclasses
+            if x1 - x0 > 0.05:
+                ax.text((x0 + x1) / 2, 1.18 if any(labels) else 1.13, group, fontsize=10, transform=ax.transAxes,
+                        verticalalignment='top', horizontalalignment='center')
 
     def __set_min_sec_axis(self, ax2):
         """
@@ -90,11 +93,15 @@ class StaticPlotter:
              None
         """
 
-        # Secondary axis to outputs sediment classes
-        categories = ['', 'fine', 'medium', 'coarse', 'fine', 'medium', 'coarse', '']
-        ticks = [0.06, 0.2, 0.63, 2, 6, 20, 63, 250]
+        # Secondary axis to outputs sediment classes (labels on the left of the upper limit of each class)
+        left, right = PLOT_LIMITS
+        ticks, categories = [], []
+        for group, lower, upper, labels in main_classes(self.classes, left=left, right=right):
+            limits = [limit for limit in class_limits(self.classes) if lower < limit < upper] + [upper]
+            ticks += limits
+            categories += labels
         ax2.set_xscale('log')
-        ax2.set_xlim(left=0.031, right=250)
+        ax2.set_xlim(left=left, right=right)
         ax2.set_xticks(ticks, minor=False)
         ax2.set_xticklabels(categories, minor=False, horizontalalignment='right')
         ax2.tick_params(which='major', length=8)
@@ -113,7 +120,8 @@ class StaticPlotter:
              None
         """
 
-        a = [0.06, 0.20, 0.63, 2.00, 6.00, 20.00, 63.00, 250]
+        left, right = PLOT_LIMITS
+        a = [limit for limit in class_limits(self.classes) if left < limit < right]
         b = np.arange(0, 110, 10)
         ax.axvline(0.1, color='black', alpha=0.3, linewidth=0.5)
         ax.axvline(1.0, color='black', alpha=0.3, linewidth=0.5)
@@ -123,6 +131,6 @@ class StaticPlotter:
         ax.set_yticks(b)
         ax.tick_params(which='minor', length=0)
         ax.xaxis.set_major_formatter(mtick.FormatStrFormatter('%1.2f'))
-        ax.set_xlim(left=0.031, right=250)
+        ax.set_xlim(left=left, right=right)
         ax.set_xlabel('Grain Size [mm]')
         ax.set_ylabel('Percentage [%]')
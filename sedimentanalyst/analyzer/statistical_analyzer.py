@@ -5,6 +5,9 @@ Author : Beatriz Negreiros
 """
 
 from sedimentanalyst.analyzer.config import *
+from sedimentanalyst.analyzer import hydraulics
+from sedimentanalyst.analyzer import batch_statistics
+from sedimentanalyst.analyzer import size_classes
 
 
 class StatisticalAnalyzer:
@@ -18,22 +21,28 @@ class StatisticalAnalyzer:
         cumulative_df (df): dataframe containing in the first column the grain sizes diameters (in mm) and in the second
             column the cumulative percentages (% in mass, in grams) that passes through the corresponding grain size diameters.
         statistics_df (df): dataframe containing all the statistics of the sample, which includes:
-            d10, d16, d25, d30, d50, d60, d75, d84, d90, Mean Grain Site dm [mm], Geometrical mean grain size dg [mm],
-            Sorting Index, Fredle Index, Grain Size standard deviation, skewness, kurtosis, coefficient of uniformity Cu,
-            curvature coefficient Cc.
+            the characteristic grain sizes (by default d10, d16, d25, d30, d50, d60, d75, d84, d90), Mean Grain Site dm
+            [mm], Geometrical mean grain size dg [mm], Sorting Index, Fredle Index, Grain Size standard deviation,
+            skewness, kurtosis, coefficient of uniformity Cu, curvature coefficient Cc.
         porosity_conductivity_df (df): dataframe containing the porosity estimators (estimated from the grain size
             analysis) according to different literature, as well as the corresponding hydraulic conductivity estimator for
             each of the porosity values according to the Kozeny Carman Equation.
+        size_class_df (df): dataframe containing the limits of the grain size classes (e.g., fine sand or coarse
+            gravel) and the mass percentage of the sample in each class.
         samplename (str): sample name
         coords (tuple): x and y coordinates, in this order
         porosity (float): porosity values set up by the user, possibly via alternative measurements, such as
             with photogramic approaches.
         sf_porosity (float): sphericity index. For rounded sediments it equals 6.10
+        percentiles (np.array): cumulative percentages of the characteristic grain sizes (user-defined percentiles
+            completed with the ones required by the other statistics)
 
     Methods:
         compute_cumulative_df (df): computes cumulative_df dataframe
         compute_statistics_df (df): computes statistics_df dataframe
+        get_statistic (float): value of a statistic given its name (e.g., "d50")
         compute_porosity_conductivity_df (df): computes porosity_conductivity_df dataframe
+        compute_size_class_df (df): computes size_class_df dataframe
 
     Note:
         See more on the determination of riverbed porosity from Freezecore samples via a Structure from Motion approach
@@ -41,7 +50,7 @@ class StatisticalAnalyzer:
 
     """
 
-    def __init__(self, sieving_df=None, metadata=None):
+    def __init__(self, sieving_df=None, metadata=None, percentiles=None, scale="iso"):
         """
         Initializes attributes and direct calling of class methods
 
@@ -52,6 +61,10 @@ class StatisticalAnalyzer:
                 sizes and 2nd sample containing the class weights in grams.
             metadata (list): list of single values as metadata, [samplename (str), sampledate (str), (lat (float), long (float)),
                 porosity (float), sf_porosity (float)]
+            percentiles (list): cumulative percentages of the characteristic grain sizes, e.g., [5, 10, 16, 35, 50,
+                65, 84, 90, 95] (default: batch_statistics.DEFAULT_PERCENTILES)
+            scale (str or list): grain size classes of size_class_df, "iso" (ISO 14688), "wentworth" or a list of
+                classes (see size_classes)
         """
 
         # Attributes
@@ -60,18 +73,24 @@ class StatisticalAnalyzer:
         self.statistics_df = pd.DataFrame()
         self.__interpolation_df = pd.DataFrame()
         self.porosity_conductivity_df = pd.DataFrame()
+        self.size_class_df = pd.DataFrame()
         self.metadata = metadata
         self.samplename = metadata[0]
         self.sampledate = metadata[1]
         self.coords = metadata[2]
         self.porosity = metadata[3]
         self.sf_porosity = metadata[4]
+        self.percentiles = batch_statistics.characteristic_percentiles(
+            batch_statistics.DEFAULT_PERCENTILES if percentiles is None else percentiles)
+        self.__ds = {}
+        self.__classes = size_classes.get_classes(scale)
 
         # Methods
         self.compute_cumulative_df()
         self.__compute_interp_dfs()
         self.compute_statistics_df()
         self.compute_porosity_conductivity_df()
+        self.compute_size_class_df()
 
     def __repr__(self):
         return "StatisticalAnalyzer({0}, {1})".format(self.original_df, self.metadata)
@@ -128,14 +147,41 @@ class StatisticalAnalyzer:
 
         pass
 
+    def get_statistic(self, name):
+        """
+        Looks up a statistic of statistics_df by its name, independently of its row.
+
+        Args:
+            name (str): statistic name, e.g., "d50" or "Geometric Standard Deviation"
+
+        Returns:
+            float: value of the statistic
+        """
+        values = self.statistics_df.loc[self.statistics_df["Name"] == name, "Value"]
+        if values.empty:
+            raise KeyError("Statistic {0} was not computed for the sample {1}.".format(name, self.samplename))
+        return values.iat[0]
+
+    def __set_statistic(self, name, value):
+        """
+        Appends a statistic to the statistics dataframe (self.statistics_df)
+
+        Args:
+            name (str): statistic name
+            value (float): value of the statistic
+        """
+        row = len(self.statistics_df)
+        self.statistics_df.at[row, "Name"] = name
+        self.statistics_df.at[row, "Value"] = value
+        pass
+
     def __mean_grain_size_dm(self):
         """
         Computes mean grain size and fills it in the statistics dataframe (self.statistics_df)
 
         """
-        self.statistics_df.at[9, "Name"] = "Mean Grain Size dm [mm]"
         mean_gsdm = 0.0025 * self.__interpolation_df["Grain size (interpolated) "].sum()
-        self.statistics_df.at[9, "Value"] = mean_gsdm
+        self.__set_statistic("Mean Grain Size dm [mm]", mean_gsdm)
         pass
 
     def __geometrical_mean_dg(self):
@@ -144,11 +190,9 @@ class StatisticalAnalyzer:
         fill statistics dataframe
 
         """
-        self.statistics_df.at[10, "Name"] = "Geometrical mean dg [mm]"
-
-        d16 = self.statistics_df.at[1, "Value"]
-        d84 = self.statistics_df.at[7, "Value"]
-        self.statistics_df.at[10, "Value"] = np.sqrt([d16 * d84])
+        d16 = self.get_statistic("d16")
+        d84 = self.get_statistic("d84")
+        self.__set_statistic("Geometrical mean dg [mm]", np.sqrt(d16 * d84))
 
         pass
 
@@ -161,11 +205,9 @@ class StatisticalAnalyzer:
         available pore space.
 
         """
-        self.statistics_df.at[11, "Name"] = "Sorting Index 1 ds"
-
-        d16 = self.statistics_df.at[1, "Value"]
-        d84 = self.statistics_df.at[7, "Value"]
-        self.statistics_df.at[11, "Value"] = np.sqrt([d84 / d16])
+        d16 = self.get_statistic("d16")
+        d84 = self.get_statistic("d84")
+        self.__set_statistic("Sorting Index 1 ds", np.sqrt(d84 / d16))
 
         pass
 
@@ -178,9 +220,8 @@ class StatisticalAnalyzer:
         available pore space.
 
         """
-        self.statistics_df.at[12, "Name"] = "Fredle - Index"
-        fredle_index = self.statistics_df.at[10, "Value"] / self.statistics_df.at[11, "Value"]
-        self.statistics_df.at[12, "Value"] = fredle_index
+        fredle_index = self.get_statistic("Geometrical mean dg [mm]") / self.get_statistic("Sorting Index 1 ds")
+        self.__set_statistic("Fredle - Index", fredle_index)
         pass
 
     def __standard_deviation(self):
@@ -191,9 +232,8 @@ class StatisticalAnalyzer:
         grain size (Baiyegunhi, C., Liu, K., & Gwavava, O. , 2017).
 
         """
-        self.statistics_df.at[13, "Name"] = "Grain Size std"
         grain_size_std = np.nanstd(self.__interpolation_df["Grain size (interpolated) "].to_numpy())
-        self.statistics_df.at[13, "Value"] = grain_size_std
+        self.__set_statistic("Grain Size std", grain_size_std)
 
         pass
 
@@ -202,8 +242,6 @@ class StatisticalAnalyzer:
         Computes geometric_standard_deviation by Frings 2001 et. al.
 
         """
-        self.statistics_df.at[14, "Name"] = "Geometric Standard Deviation"
-
         # temporary dataframe geo_df to compute elements of Frings et al. (2011) equation
         geo_df = self.cumulative_df.drop("Fraction Mass [g]", axis=1)
         geo_df["Percentage Fraction [%]"] = geo_df["Percentage Fraction [%]"].shift(1, fill_value=0)
@@ -215,7 +253,7 @@ class StatisticalAnalyzer:
 
         # compute geometric_std
         geometric_std = np.sqrt(geo_df["result"].sum())
-        self.statistics_df.at[14, "Value"] = geometric_std
+        self.__set_statistic("Geometric Standard Deviation", geometric_std)
 
         pass
 
@@ -224,10 +262,8 @@ class StatisticalAnalyzer:
         Computes skewness of grain sizes
 
         """
-        self.statistics_df.at[15, "Name"] = "Skewness"
-
         skewness = stats.skew(self.__interpolation_df["Grain size (interpolated) "])
-        self.statistics_df.at[15, "Value"] = skewness
+        self.__set_statistic("Skewness", skewness)
         pass
 
     def __kurtosis(self):
@@ -235,31 +271,18 @@ class StatisticalAnalyzer:
         Computes kurtosis of grain sizes
 
         """
-        self.statistics_df.at[16, "Name"] = "Kurtosis"
-
         kurtosis = stats.kurtosis(self.__interpolation_df["Grain size (interpolated) "])
-        self.statistics_df.at[16, "Value"] = kurtosis
+        self.__set_statistic("Kurtosis", kurtosis)
         pass
 
     def __compute_ds(self):
         """
-        Computes characteristic grain sizes (d10, d16, d25, d30, d50, d60, d75, d84, d90)
-        and fills statistic dataframe
+        Fills the statistic dataframe with the characteristic grain sizes (self.percentiles, e.g., d10, d16, d25,
+        d30, d50, d60, d75, d84, d90), inverted from the cumulative curve together with the interpolation grid
 
         """
-        # type of characteristic grain size (cgs)
-        ds = [10, 16, 25, 30, 50,
-              60, 75, 84, 90]
-
-        # assign each ds value to a line of the dataframe
-        for n in range(0, 9):
-            # name ds
-            self.statistics_df.at[n, "Name"] = "d{s}".format(s=ds[n])
-
-            # assign value to ds
-            boolean_filter = self.__interpolation_df["Cumulative (interpolated) "] == ds[n]
-            ds_value = self.__interpolation_df[boolean_filter.to_list()].iat[0, 1]
-            self.statistics_df.at[n, "Value"] = ds_value
+        for percent in self.percentiles:
+            self.__set_statistic(batch_statistics.percentile_name(percent), self.__ds[percent])
         pass
 
     def __uniformity_coefficient(self):
@@ -267,11 +290,9 @@ class StatisticalAnalyzer:
         Computes uniformity coefficient and fills statistics dataframe
 
         """
-        self.statistics_df.at[17, "Name"] = "Coefficient of uniformity - Cu"
-
-        d10 = self.statistics_df.at[0, "Value"]
-        d60 = self.statistics_df.at[5, "Value"]
-        self.statistics_df.at[17, "Value"] = d60 / d10
+        d10 = self.get_statistic("d10")
+        d60 = self.get_statistic("d60")
+        self.__set_statistic("Coefficient of uniformity - Cu", d60 / d10)
         pass
 
     def __curvature_coefficient(self):
@@ -279,30 +300,30 @@ class StatisticalAnalyzer:
         Computes curvature coefficient and fills statistics dataframe
 
         """
-        self.statistics_df.at[18, "Name"] = "Curvature coefficient - Cc"
-
-        d10 = self.statistics_df.at[0, "Value"]
-        d30 = self.statistics_df.at[3, "Value"]
-        d60 = self.statistics_df.at[5, "Value"]
-        self.statistics_df.at[18, "Value"] = d30 ** 2 / (d60 * d10)
+        d10 = self.get_statistic("d10")
+        d30 = self.get_statistic("d30")
+        d60 = self.get_statistic("d60")
+        self.__set_statistic("Curvature coefficient - Cc", d30 ** 2 / (d60 * d10))
         pass
 
     def __compute_interp_dfs(self):
         """
-        Computes linearly interpolated grain sizes for several cumulative percentages (every 0.25%)
+        Computes linearly interpolated grain sizes for several cumulative percentages (every 0.25%) and for the
+        characteristic grain sizes, in a single interpolation
 
         """
         # extract data from sample
         y = np.flip(np.array(self.cumulative_df["Grain Sizes [mm]"]))
         x = np.flip(np.array(self.cumulative_df["Cumulative Percentage [%]"]))
 
-        # estimate grain size linearly for a increase of 0.25% of cumulative percentage
-        x_vals = np.linspace(0, 100, 401)
-        y_interpolated = np.interp(x_vals, x, y)
+        # estimate grain size linearly for a increase of 0.25% of cumulative percentage and for the percentiles
+        x_vals = batch_statistics.INTERPOLATION_GRID
+        y_interpolated = np.interp(np.concatenate([self.percentiles, x_vals]), x, y)
+        self.__ds = dict(zip(self.percentiles, y_interpolated[:len(self.percentiles)]))
 
         # fill dataframe with results of interpolation
         self.__interpolation_df["Cumulative (interpolated) "] = x_vals
-        self.__interpolation_df["Grain size (interpolated) "] = y_interpolated
+        self.__interpolation_df["Grain size (interpolated) "] = y_interpolated[len(self.percentiles):]
 
         pass
 
@@ -320,10 +341,7 @@ class StatisticalAnalyzer:
         self.__porosity_name()
 
         # compute predictors
-        self.__porosity_carling()
-        self.__porosity_wu()
-        self.__porosity_wooster()
-        self.__porosity_frings()
+        self.__porosity_predictors()
         self.__porosity_user()
 
         # compute kfs based on porosity predictors and input
@@ -336,55 +354,28 @@ class StatisticalAnalyzer:
         Create columns the porosity estimators according to available literature
 
         """
-        authors = ["Carling and Reader (1982)",
-                   "Wu and Wang (2006)",
-                   "Wooster et al. (2008)",
-                   "Frings et al. (2011) ",
-                   "User input"]
+        authors = hydraulics.POROSITY_AUTHORS + ["User input"]
         for k, name in enumerate(authors):
             self.porosity_conductivity_df.at[k, "Name"] = name
 
         pass
 
-    def __porosity_carling(self):
-        """
-        Calculates porosity estimator according to Carling & Reader (1982)
-
-        """
-        d50 = self.statistics_df.at[4, "Value"]
-        carling = -0.0333 + (0.4665 / ((1000 * d50 / 1000) ** 0.21))
-        self.porosity_conductivity_df.at[0, "Porosity"] = carling
-        pass
-
-    def __porosity_wu(self):
+    def __porosity_predictors(self):
         """
-        Calculates porosity estimator according to Wu and Wang (2006)
+        Calculates porosity estimators according to Carling & Reader (1982), Wu and Wang (2006), Wooster et al. (2008)
+        and Frings et al. (2011)
 
         """
-        d50 = self.statistics_df.at[4, "Value"]
-        wu = 0.13 + (0.21 / ((1000 * d50 / 1000 + 0.002) ** 0.21))
-        self.porosity_conductivity_df.at[1, "Porosity"] = wu
-        pass
-
-    def __porosity_wooster(self):
-        """
-           Calculates porosity estimator according to Wooster et al. (2008)
-
-        """
-        geometric_std = self.statistics_df.at[14, "Value"]
-        wooster = 0.621 * np.exp(-0.457 * geometric_std)
-        self.porosity_conductivity_df.at[2, "Porosity"] = wooster
-        pass
-
-    def __porosity_frings(self):
-        """
-        Calculates porosity estimator according to Frings et al. (2011)
-
-        """
-        geometric_std = self.statistics_df.at[14, "Value"]
-        cumulative_5mm = self.cumulative_df.at[9, "Cumulative Percentage [%]"] / 100
-        frings = 0.353 - 0.068 * geometric_std + 0.146 * cumulative_5mm
-        self.porosity_conductivity_df.at[3, "Porosity"] = frings
+        d50 = self.get_statistic("d50")
+        geometric_std = self.get_statistic("Geometric Standard Deviation")
+        # fraction passing the sieve of the Frings et al. (2011) equation, looked up by grain size
+        cumulative_5mm = batch_statistics.passing_at(grain_sizes=self.cumulative_df["Grain Sizes [mm]"].to_numpy(),
+                                                     cumulative=self.cumulative_df["Cumulative Percentage [%]"],
+                                                     size=batch_statistics.FRINGS_SIEVE)[0] / 100
+        predictors = hydraulics.porosity_predictors(d50=d50, geometric_std=geometric_std,
+                                                    cumulative_5mm=cumulative_5mm)
+        for k, porosity in enumerate(predictors):
+            self.porosity_conductivity_df.at[k, "Porosity"] = porosity
         pass
 
     def __porosity_user(self):
@@ -400,6 +391,20 @@ class StatisticalAnalyzer:
             self.porosity_conductivity_df.at[4, "Porosity"] = np.nan
         pass
 
+    def compute_size_class_df(self):
+        """
+        Computes the mass percentage of the sample in each grain size class (interpolated log-linearly on the
+        cumulative curve at the class limits)
+
+        """
+        percentages = size_classes.class_percentages(grain_sizes=self.cumulative_df["Grain Sizes [mm]"].to_numpy(),
+                                                     cumulative=self.cumulative_df["Cumulative Percentage [%]"],
+                                                     classes=self.__classes)
+        self.size_class_df = pd.DataFrame(self.__classes, columns=["Name", "Main class", "Lower limit [mm]",
+                                                                   "Upper limit [mm]"])
+        self.size_class_df["Percentage [%]"] = percentages[0]
+        pass
+
     def print_excel(self, file_name="statistics.xlsx"):
         """
         Print all attribute dataframes into excel sheet output is saved
@@ -416,43 +421,21 @@ class StatisticalAnalyzer:
             self.cumulative_df.to_excel(writer, sheet_name="Sample Summary")
             self.statistics_df.to_excel(writer, sheet_name="Statistics")
             self.porosity_conductivity_df.to_excel(writer, sheet_name="PorosityAndConductivity")
+            self.size_class_df.to_excel(writer, sheet_name="Size Classes")
         pass
 
     def __compute_kfs(self):
         """
         Computes hydraulic conductivity values based on porosity from the user input
-        and porosity predictions
+        and porosity predictions. The effective diameter is computed once and the Kozeny Carman Equation is
+        evaluated for all porosity values at once.
 
         """
-
-        self.porosity_conductivity_df["Corresponding kf [m/s]"] = np.nan
-
-        for k, porosity in enumerate(self.porosity_conductivity_df["Porosity"]):
-            kf = self.__kozeny_carman(porosity=porosity)
-            self.porosity_conductivity_df.at[k, "Corresponding kf [m/s]"] = kf
+        deff_cm = hydraulics.effective_diameter(grain_sizes=self.cumulative_df["Grain Sizes [mm]"].to_numpy(),
+                                                fractions=self.cumulative_df["Percentage Fraction [%]"].to_numpy())
+        porosity = self.porosity_conductivity_df["Porosity"].to_numpy(dtype=float)
+        self.porosity_conductivity_df["Corresponding kf [m/s]"] = hydraulics.kozeny_carman(deff_cm=deff_cm,
+                                                                                           porosity=porosity,
+                                                                                           sf=self.sf_porosity)
 
         pass
-
-    def __kozeny_carman(self, porosity=np.nan):
-        """
-        Computes the hydraulic conductivity according to the Kozeny Carman Equation
-
-        Args:
-             porosity (float): Sample porosity
-
-        Returns:
-             float: Sample hydraulic conductivity [m\s]
-        """
-        kozeny_df = pd.DataFrame()
-        kozeny_df = pd.concat([kozeny_df, self.cumulative_df])
-        kozeny_df["D_ave_i [cm]"] = ((kozeny_df["Grain Sizes [mm]"].shift(1, fill_value=0) / 10) ** 0.404) * (
-                kozeny_df["Grain Sizes [mm]"] / 10) ** 0.595
-        kozeny_df["Deff_i [cm]"] = kozeny_df["Percentage Fraction [%]"] / kozeny_df["D_ave_i [cm]"]
-        Deff_i_cm = 100 / kozeny_df["Deff_i [cm]"].sum()
-        SF = self.sf_porosity
-        e = porosity / (1 - porosity)
-        cte = 19900
-
-        kozeny_carman_kf = cte * ((Deff_i_cm / 100) ** 2) * (1 / (SF ** 2)) * ((e ** 3) / (1 + e))
-
-        return kozeny_carman_kf
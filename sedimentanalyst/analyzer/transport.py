@@ -0,0 +1,381 @@
+""" Module containing incipient motion (Shields) and bedload transport (Meyer-Peter and Mueller, Wilcock and Crowe)
+calculators evaluated for whole batches of samples and hydraulic scenarios at once. Sample arrays have shape
+(n_samples,) or (n_samples, n_classes) and scenario arrays shape (n_scenarios,); the results are matrices of shape
+(n_samples, n_scenarios).
+
+Author: Beatriz Negreiros
+
+"""
+from sedimentanalyst.analyzer.config import *
+from sedimentanalyst.analyzer.harmonization import curve_columns
+
+# gravitational acceleration [m/s2], densities of water and sediment [kg/m3] and kinematic viscosity of water [m2/s]
+GRAVITY = 9.81
+RHO_WATER = 1000.0
+RHO_SEDIMENT = 2650.0
+VISCOSITY = 1.0e-6
+
+# critical Shields parameter and coefficients of the Meyer-Peter and Mueller (1948) equation
+MPM_CRITICAL_SHIELDS = 0.047
+MPM_COEFFICIENT = 8.0
+MPM_EXPONENT = 1.5
+
+# upper grain size [mm] of the sand fraction in the Wilcock and Crowe (2003) hiding function
+SAND_LIMIT = 2.0
+
+
+def _column(samples):
+    """
+    Reshapes a sample array (n_samples,) into a column for broadcasting against the scenarios into a
+    (n_samples, n_scenarios) matrix. Scalars are left unchanged.
+
+    """
+    samples = np.asarray(samples, dtype=float)
+    return samples[..., None] if samples.ndim else samples
+
+
+def submerged_weight(rho_s=RHO_SEDIMENT, rho_w=RHO_WATER):
+    """
+    Submerged specific weight of the sediment (rho_s - rho_w) * g [N/m3].
+
+    Args:
+        rho_s (float): sediment density [kg/m3]
+        rho_w (float): water density [kg/m3]
+
+    Returns:
+        float: submerged specific weight [N/m3]
+    """
+    return (rho_s - rho_w) * GRAVITY
+
+
+def shear_stress(discharge=None, width=None, slope=None, manning_n=0.035, rho_w=RHO_WATER):
+    """
+    Bed shear stress of normal (uniform) flow in a wide rectangular channel, where the hydraulic radius equals the
+    flow depth h = (n Q / (B sqrt(S))) ** 0.6 and tau = rho g h S. The arguments are broadcast against each other,
+    e.g., a vector of discharges gives one shear stress per discharge scenario.
+
+    Args:
+        discharge (np.array): discharge Q [m3/s]
+        width (np.array): channel width B [m]
+        slope (np.array): energy slope S [-]
+        manning_n (np.array): Manning roughness coefficient n [s/m^(1/3)]
+        rho_w (float): water density [kg/m3]
+
+    Returns:
+        np.array: bed shear stress [Pa]
+    """
+    discharge, width, slope, manning_n = (np.asarray(a, dtype=float) for a in (discharge, width, slope, manning_n))
+    depth = (manning_n * discharge / (width * np.sqrt(slope))) ** 0.6
+    return rho_w * GRAVITY * depth * slope
+
+
+def shields_parameter(tau=None, d=None, rho_s=RHO_SEDIMENT, rho_w=RHO_WATER):
+    """
+    Dimensionless bed shear stress (Shields parameter) theta = tau / ((rho_s - rho_w) g d) for all samples and
+    scenarios.
+
+    Args:
+        tau (np.array): bed shear stress [Pa] of each scenario, shape (n_scenarios,)
+        d (np.array): characteristic grain size [mm] of each sample (e.g., d50), shape (n_samples,)
+        rho_s (float): sediment density [kg/m3]
+        rho_w (float): water density [kg/m3]
+
+    Returns:
+        np.array: Shields parameters, shape (n_samples, n_scenarios)
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.asarray(tau, dtype=float) / (submerged_weight(rho_s, rho_w) * _column(d) / 1000)
+
+
+def dimensionless_grain_size(d=None, rho_s=RHO_SEDIMENT, rho_w=RHO_WATER, nu=VISCOSITY):
+    """
+    Dimensionless grain size D* = d ((s - 1) g / nu^2)^(1/3).
+
+    Args:
+        d (np.array): grain size [mm]
+        rho_s (float): sediment density [kg/m3]
+        rho_w (float): water density [kg/m3]
+        nu (float): kinematic viscosity of water [m2/s]
+
+    Returns:
+        np.array: D* [-]
+    """
+    return np.asarray(d, dtype=float) / 1000 * ((rho_s / rho_w - 1) * GRAVITY / nu ** 2) ** (1 / 3)
+
+
+def critical_shields(d=None, method="soulsby", theta_c=MPM_CRITICAL_SHIELDS, rho_s=RHO_SEDIMENT, rho_w=RHO_WATER,
+                     nu=VISCOSITY):
+    """
+    Critical Shields parameter for incipient motion.
+
+    Args:
+        d (np.array): grain size [mm]
+        method (str): "soulsby" (Soulsby and Whitehouse 1997 fit of the Shields curve) or "constant" (theta_c)
+        theta_c (float): constant critical Shields parameter
+        rho_s (float): sediment density [kg/m3]
+        rho_w (float): water density [kg/m3]
+        nu (float): kinematic viscosity of water [m2/s]
+
+    Returns:
+        np.array: critical Shields parameters [-], same shape as d
+    """
+    d = np.asarray(d, dtype=float)
+    if method == "constant":
+        return np.full(d.shape, float(theta_c))
+    if method != "soulsby":
+        raise ValueError("Unknown method {0} for the critical Shields parameter, use soulsby or constant.".format(
+            method))
+    d_star = dimensionless_grain_size(d, rho_s=rho_s, rho_w=rho_w, nu=nu)
+    return 0.3 / (1 + 1.2 * d_star) + 0.055 * (1 - np.exp(-0.02 * d_star))
+
+
+def critical_shear_stress(d=None, theta_c=None, rho_s=RHO_SEDIMENT, rho_w=RHO_WATER, **kwargs):
+    """
+    Critical bed shear stress for incipient motion tau_c = theta_c (rho_s - rho_w) g d.
+
+    Args:
+        d (np.array): grain size [mm] of each sample (e.g., d50 or d84)
+        theta_c (np.array): critical Shields parameter (default: critical_shields(d, **kwargs))
+        rho_s (float): sediment density [kg/m3]
+        rho_w (float): water density [kg/m3]
+        kwargs: method and parameters of critical_shields
+
+    Returns:
+        np.array: critical shear stress [Pa], same shape as d
+    """
+    d = np.asarray(d, dtype=float)
+    theta_c = critical_shields(d, rho_s=rho_s, rho_w=rho_w, **kwargs) if theta_c is None else theta_c
+    return theta_c * submerged_weight(rho_s, rho_w) * d / 1000
+
+
+def mobility(tau=None, tau_c=None):
+    """
+    Mobility ratio tau / tau_c of each sample in each scenario (larger than 1 when the grain size is mobile).
+
+    Args:
+        tau (np.array): bed shear stress [Pa] of each scenario, shape (n_scenarios,)
+        tau_c (np.array): critical shear stress [Pa] of each sample, shape (n_samples,)
+
+    Returns:
+        np.array: mobility ratios, shape (n_samples, n_scenarios)
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.asarray(tau, dtype=float) / _column(tau_c)
+
+
+def meyer_peter_mueller(tau=None, d=None, theta_c=MPM_CRITICAL_SHIELDS, coefficient=MPM_COEFFICIENT,
+                        exponent=MPM_EXPONENT, rho_s=RHO_SEDIMENT, rho_w=RHO_WATER):
+    """
+    Bedload transport rate per unit width after Meyer-Peter and Mueller (1948),
+    q* = coefficient (theta - theta_c)^exponent and qb = q* sqrt((s - 1) g d^3). Use coefficient=3.97 and
+    theta_c=0.0495 for the correction of Wong and Parker (2006).
+
+    Args:
+        tau (np.array): bed shear stress [Pa] of each scenario, shape (n_scenarios,)
+        d (np.array): characteristic grain size [mm] of each sample (usually d50 or dm), shape (n_samples,)
+        theta_c (float or np.array): critical Shields parameter (scalar or one per sample)
+        coefficient (float): transport coefficient
+        exponent (float): exponent of the excess Shields parameter
+        rho_s (float): sediment density [kg/m3]
+        rho_w (float): water density [kg/m3]
+
+    Returns:
+        np.array: volumetric bedload rates [m2/s], shape (n_samples, n_scenarios)
+    """
+    theta = shields_parameter(tau=tau, d=d, rho_s=rho_s, rho_w=rho_w)
+    d_m = _column(d) / 1000
+    excess = np.clip(theta - _column(theta_c), 0, None)
+    return coefficient * excess ** exponent * np.sqrt((rho_s / rho_w - 1) * GRAVITY * d_m ** 3)
+
+
+def class_fractions(cumulative=None):
+    """
+    Fractions [-] of the sample mass retained on each sieve, i.e., between a sieve and the next larger one, from
+    cumulative percentages (e.g., the curve columns of the global summary).
+
+    Args:
+        cumulative (np.array): cumulative percentages [%] ordered from the largest to the smallest sieve, shape
+            (n_samples, n_sieves)
+
+    Returns:
+        np.array: fractions [-], shape (n_samples, n_sieves)
+    """
+    cumulative = np.atleast_2d(np.asarray(cumulative, dtype=float))
+    next_smaller = np.concatenate([cumulative[:, 1:], np.zeros((cumulative.shape[0], 1))], axis=1)
+    return np.clip(np.nan_to_num(cumulative - next_smaller), 0, None) / 100
+
+
+def class_sizes(grain_sizes=None):
+    """
+    Representative grain size of the mass retained on each sieve: geometric mean of the sieve and the next larger
+    sieve (the largest sieve for the mass retained on it).
+
+    Args:
+        grain_sizes (np.array): sieve diameters [mm] ordered from the largest to the smallest sieve
+
+    Returns:
+        np.array: class sizes [mm], same shape as grain_sizes
+    """
+    grain_sizes = np.asarray(grain_sizes, dtype=float)
+    upper_sizes = np.concatenate([grain_sizes[..., :1], grain_sizes[..., :-1]], axis=-1)
+    return np.sqrt(grain_sizes * upper_sizes)
+
+
+def wilcock_crowe_function(phi=None):
+    """
+    Dimensionless transport rate W* of Wilcock and Crowe (2003) given the ratio phi = tau / tau_ri of the shear
+    stress to the reference shear stress of a size class. The fractional powers are evaluated with products and
+    square roots, which is about twice as fast for large arrays.
+
+    Args:
+        phi (np.array): shear stress ratios [-]
+
+    Returns:
+        np.array: W* [-], same shape as phi
+    """
+    phi = np.asarray(phi, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        root = np.sqrt(phi)
+
+        # 0.002 phi^7.5 below phi = 1.35
+        low = phi * phi
+        low *= low
+        low *= phi * phi
+        low *= phi
+        low *= root
+
+        # 14 (1 - 0.894 / phi^0.5)^4.5 above
+        x = np.subtract(1, 0.894 / root)
+        high = x * x
+        high *= high
+        high *= np.sqrt(x)
+    return np.where(phi < 1.35, 0.002 * low, 14 * high)
+
+
+def wilcock_crowe(tau=None, grain_sizes=None, fractions=None, rho_s=RHO_SEDIMENT, rho_w=RHO_WATER,
+                  chunk_size=200000):
+    """
+    Fractional bedload transport of mixed sand and gravel after Wilcock and Crowe (2003). The reference shear
+    stress of each size class follows from the surface sand fraction and the hiding function, so that the
+    transport of all classes of all samples in all scenarios is a (n_samples, n_scenarios, n_classes) array that is
+    evaluated in chunks of samples and summed over the classes with a matrix product.
+
+    Args:
+        tau (np.array): bed shear stress [Pa] of each scenario, shape (n_scenarios,)
+        grain_sizes (np.array): sieve diameters [mm] ordered from the largest to the smallest sieve, shape
+            (n_classes,)
+        fractions (np.array): surface fractions [-] or percentages [%] retained on each sieve (e.g., the
+            "fractions" of batch_statistics.compute_statistics), shape (n_samples, n_classes)
+        rho_s (float): sediment density [kg/m3]
+        rho_w (float): water density [kg/m3]
+        chunk_size (int): maximum number of sample x scenario x class values evaluated at once (bounds the memory
+            use)
+
+    Returns:
+        np.array: volumetric bedload rates of all classes [m2/s], shape (n_samples, n_scenarios)
+    """
+    tau = np.atleast_1d(np.asarray(tau, dtype=float))
+    fractions = np.atleast_2d(np.nan_to_num(np.asarray(fractions, dtype=float)))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fractions = fractions / fractions.sum(axis=1, keepdims=True)
+    grain_sizes = np.asarray(grain_sizes, dtype=float)
+    sizes = class_sizes(grain_sizes)
+    retained = (fractions > 0) & (sizes > 0)
+
+    # surface sand fraction (classes below SAND_LIMIT), geometric mean size and reference shear stress of each class
+    # (they do not depend on the scenarios)
+    upper_sizes = np.concatenate([grain_sizes[:1], grain_sizes[:-1]])
+    sand = fractions[:, upper_sizes <= SAND_LIMIT].sum(axis=1)
+    d_sm = np.exp((fractions * np.log(np.where(sizes > 0, sizes, 1))).sum(axis=1))
+    tau_rm = (0.021 + 0.015 * np.exp(-20 * sand)) * submerged_weight(rho_s, rho_w) * d_sm / 1000
+    ratio = sizes / d_sm[:, None]
+    tau_ri = tau_rm[:, None] * ratio ** (0.67 / (1 + np.exp(1.5 - ratio)))
+    tau_ri = np.where(retained, tau_ri, np.inf)
+
+    # transport rate scaling u*^3 / ((s - 1) g) of each scenario
+    scaling = (tau / rho_w) ** 1.5 / ((rho_s / rho_w - 1) * GRAVITY)
+
+    transport = np.zeros((fractions.shape[0], tau.size))
+    rows = max(1, int(chunk_size) // max(1, tau.size * sizes.size))
+    for start in range(0, fractions.shape[0], rows):
+        block = slice(start, start + rows)
+        # skip the classes without mass in all samples of the chunk (e.g., boulders or clay)
+        classes = retained[block].any(axis=0)
+        w_star = wilcock_crowe_function(tau[None, :, None] / tau_ri[block, None, :][..., classes])
+        transport[block] = np.matmul(w_star, fractions[block][:, classes, None])[..., 0]
+    return transport * scaling
+
+
+def evaluate_scenarios(df=None, tau=None, d="d50", theta_c_method="soulsby", rho_s=RHO_SEDIMENT, rho_w=RHO_WATER):
+    """
+    Evaluates incipient motion and bedload transport of all samples of the global summary for a set of shear
+    stress scenarios.
+
+    Args:
+        df (df): global summary (see utils.append_global) with the characteristic grain size column d and the
+            cumulative curve columns
+        tau (np.array): bed shear stress [Pa] of each scenario (e.g., from shear_stress for discharge scenarios),
+            shape (n_scenarios,)
+        d (str): characteristic grain size column used for the Shields and Meyer-Peter and Mueller calculations
+        theta_c_method (str): method of critical_shields for the critical shear stress of d
+        rho_s (float): sediment density [kg/m3]
+        rho_w (float): water density [kg/m3]
+
+    Returns:
+        dict: "critical shear stress [Pa]" of shape (n_samples,), and "Shields parameter", "mobility",
+            "Meyer-Peter Mueller [m2/s]" and "Wilcock Crowe [m2/s]" of shape (n_samples, n_scenarios)
+    """
+    sizes = df[d].to_numpy(dtype=float)
+    columns = curve_columns(df)
+    tau_c = critical_shear_stress(sizes, method=theta_c_method, rho_s=rho_s, rho_w=rho_w)
+    return {"critical shear stress [Pa]": tau_c,
+            "Shields parameter": shields_parameter(tau=tau, d=sizes, rho_s=rho_s, rho_w=rho_w),
+            "mobility": mobility(tau=tau, tau_c=tau_c),
+            "Meyer-Peter Mueller [m2/s]": meyer_peter_mueller(tau=tau, d=sizes, rho_s=rho_s, rho_w=rho_w),
+            "Wilcock Crowe [m2/s]": wilcock_crowe(tau=tau, grain_sizes=np.asarray(columns, dtype=float),
+                                                  fractions=class_fractions(df[columns].to_numpy(dtype=float)),
+                                                  rho_s=rho_s, rho_w=rho_w)}
+
+
+def scenario_table(results=None, names=None, tau=None):
+    """
+    Tabularizes the sample x scenario matrices of evaluate_scenarios.
+
+    Args:
+        results (dict): output of evaluate_scenarios
+        names (list): sample names
+        tau (np.array): bed shear stress [Pa] of each scenario
+
+    Returns:
+        df: one row per sample and scenario with the columns "sample name", "tau [Pa]" and the results
+    """
+    n_samples, n_scenarios = len(names), len(np.atleast_1d(tau))
+    table = {"sample name": np.repeat(np.asarray(names, dtype=object), n_scenarios),
+             "tau [Pa]": np.tile(np.atleast_1d(tau), n_samples)}
+    for name, values in results.items():
+        values = np.asarray(values)
+        table[name] = np.repeat(values, n_scenarios) if values.ndim == 1 else values.ravel()
+    return pd.DataFrame(table)
+
+
+if __name__ == "__main__":
+    # benchmark of the calculators with synthetic samples and shear stress scenarios
+    import time
+
+    rng = np.random.default_rng(0)
+    n_samples, n_scenarios = 10000, 1000
+    grain_sizes = np.array([250, 125, 63, 31.5, 16, 8, 4, 2, 1, 0.5, 0.25, 0.125, 0.063, 0.031, 0.0039, 0.00006])
+    fractions = rng.dirichlet(np.ones(grain_sizes.size), size=n_samples)
+    d50 = np.exp(rng.uniform(np.log(0.5), np.log(64), n_samples))
+    tau = np.linspace(1, 100, n_scenarios)
+
+    for name, function in [
+        ("critical shear stress", lambda: critical_shear_stress(d50)),
+        ("Shields parameter", lambda: shields_parameter(tau=tau, d=d50)),
+        ("mobility", lambda: mobility(tau=tau, tau_c=critical_shear_stress(d50))),
+        ("Meyer-Peter Mueller", lambda: meyer_peter_mueller(tau=tau, d=d50)),
+        ("Wilcock Crowe", lambda: wilcock_crowe(tau=tau, grain_sizes=grain_sizes, fractions=fractions)),
+    ]:
+        start = time.perf_counter()
+        result = function()
+        print("{0:<25} {1:>14} {2:8.3f} s".format(name, str(np.shape(result)), time.perf_counter() - start))
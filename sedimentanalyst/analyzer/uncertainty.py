@@ -0,0 +1,135 @@
+""" Module containing the Monte Carlo propagation of sieving (weighing) errors into the grain size statistics,
+porosity and hydraulic conductivity estimators
+
+Author: Beatriz Negreiros
+
+"""
+from sedimentanalyst.analyzer.config import *
+from sedimentanalyst.analyzer import batch_statistics
+
+# statistics reported by default (names of the global summary columns)
+UNCERTAINTY_STATISTICS = ["d10", "d16", "d50", "d84", "d90", "Geometrical mean dg [mm]",
+                          "Geometric Standard Deviation"]
+
+
+def perturb_weights(weights=None, n_realizations=1000, relative_error=0.01, absolute_error=0.0, rng=None):
+    """
+    Draws perturbed class weights of one sample according to a (per-sieve) normal error model. Negative weights
+    are clipped to zero.
+
+    Args:
+        weights (np.array): class weights [g] of the sample, shape (n_sieves,)
+        n_realizations (int): number of realizations
+        relative_error (float or np.array): standard deviation of the weighing error relative to the class weight,
+            scalar or one value per sieve
+        absolute_error (float or np.array): standard deviation of the weighing error [g] (e.g., scale resolution),
+            scalar or one value per sieve
+        rng (np.random.Generator): random generator
+
+    Returns:
+        np.array: perturbed class weights, shape (n_realizations, n_sieves)
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    weights = np.asarray(weights, dtype=float)
+    sigma = np.sqrt((np.asarray(relative_error) * weights) ** 2 + np.asarray(absolute_error) ** 2)
+    realizations = weights + sigma * rng.standard_normal((n_realizations, weights.shape[-1]))
+    return np.clip(realizations, 0, None)
+
+
+def propagate_sample(grain_sizes=None, weights=None, n_realizations=1000, relative_error=0.01, absolute_error=0.0,
+                     user_porosity=np.nan, sf=6.1, statistics=None, confidence=0.95, chunk_size=2000, seed=None):
+    """
+    Propagates the weighing errors of one sample into its statistics. The realizations are evaluated in vectorized
+    chunks of chunk_size rows with the functions of batch_statistics.
+
+    Args:
+        grain_sizes (np.array): sieve diameters [mm] ordered from the largest to the smallest sieve
+        weights (np.array): class weights [g], shape (n_sieves,)
+        n_realizations (int): number of Monte Carlo realizations
+        relative_error (float or np.array): relative standard deviation of the class weights (scalar or per sieve)
+        absolute_error (float or np.array): absolute standard deviation [g] of the class weights (scalar or per sieve)
+        user_porosity (float): porosity given by the user (np.nan if not available)
+        sf (float): sphericity index
+        statistics (list): names of the statistics to report (default: UNCERTAINTY_STATISTICS plus all porosity
+            and kf estimators)
+        confidence (float): confidence level of the reported interval
+        chunk_size (int): number of realizations evaluated at once (bounds the memory use)
+        seed (int): seed of the random generator (for reproducible results)
+
+    Returns:
+        df: one row per statistic with the columns "Name", "Mean", "Std", "CI low" and "CI high"
+    """
+    rng = np.random.default_rng(seed)
+    samples = {}
+    for start in range(0, n_realizations, chunk_size):
+        n_chunk = min(chunk_size, n_realizations - start)
+        realizations = perturb_weights(weights, n_realizations=n_chunk, relative_error=relative_error,
+                                       absolute_error=absolute_error, rng=rng)
+        results = batch_statistics.compute_statistics(grain_sizes, realizations)
+        results.update(batch_statistics.compute_porosity_conductivity(grain_sizes, results,
+                                                                      user_porosity=user_porosity, sf=sf))
+        if statistics is None:
+            statistics = UNCERTAINTY_STATISTICS + [name for name in results
+                                                   if "[Porosity]" in name or "[Estimated kf]" in name]
+        for name in statistics:
+            samples.setdefault(name, []).append(results[name])
+
+    alpha = (1 - confidence) / 2
+    rows = []
+    for name in statistics:
+        values = np.concatenate(samples[name])
+        if np.isnan(values).all():
+            rows.append([name, np.nan, np.nan, np.nan, np.nan])
+            continue
+        low, high = np.nanquantile(values, [alpha, 1 - alpha])
+        rows.append([name, np.nanmean(values), np.nanstd(values), low, high])
+    return pd.DataFrame(rows, columns=["Name", "Mean", "Std", "CI low", "CI high"])
+
+
+def propagate_batch(analyzers=None, n_realizations=1000, relative_error=0.01, absolute_error=0.0, confidence=0.95,
+                    seed=None, n_jobs=1):
+    """
+    Propagates the weighing errors of many samples. Samples are distributed over a process pool when n_jobs > 1.
+
+    Args:
+        analyzers (list): list of StatisticalAnalyzer objects
+        n_realizations (int): number of Monte Carlo realizations per sample
+        relative_error (float or np.array): relative standard deviation of the class weights (scalar or per sieve)
+        absolute_error (float or np.array): absolute standard deviation [g] of the class weights (scalar or per sieve)
+        confidence (float): confidence level of the reported intervals
+        seed (int): seed of the random generators (sample k uses seed + k)
+        n_jobs (int): number of worker processes
+
+    Returns:
+        df: one row per sample with the columns "sample name" and "<statistic> [Mean]", "<statistic> [CI low]" and
+            "<statistic> [CI high]" for each statistic
+    """
+    tasks = []
+    for k, analyzer in enumerate(analyzers):
+        user_porosity = analyzer.porosity if isinstance(analyzer.porosity, (int, float)) else np.nan
+        tasks.append(dict(grain_sizes=analyzer.original_df["Grain Sizes [mm]"].to_numpy(dtype=float),
+                          weights=analyzer.original_df["Fraction Mass [g]"].to_numpy(dtype=float),
+                          n_realizations=n_realizations, relative_error=relative_error,
+                          absolute_error=absolute_error, user_porosity=user_porosity, sf=analyzer.sf_porosity,
+                          confidence=confidence, seed=None if seed is None else seed + k))
+
+    if n_jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            tables = list(executor.map(_propagate_task, tasks))
+    else:
+        tables = [_propagate_task(task) for task in tasks]
+
+    rows = []
+    for analyzer, table in zip(analyzers, tables):
+        row = {"sample name": analyzer.samplename}
+        for name, mean, low, high in table[["Name", "Mean", "CI low", "CI high"]].itertuples(index=False):
+            row["{} [Mean]".format(name)] = mean
+            row["{} [CI low]".format(name)] = low
+            row["{} [CI high]".format(name)] = high
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def _propagate_task(task):
+    return propagate_sample(**task)
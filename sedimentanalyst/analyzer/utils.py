@@ -5,6 +5,8 @@ Author: Beatriz Negreiros and Federica Scolari
 
 """
 from sedimentanalyst.analyzer.config import *
+from sedimentanalyst.analyzer.file_finder import FileIndex
+from sedimentanalyst.analyzer.parsing import ExtractionPlan
 
 
 def extract_df(dic=input, file=None):
@@ -12,100 +14,103 @@ def extract_df(dic=input, file=None):
     Function to extract parsed datafiles and tabularize it into dataframe.
 
     Args:
-        dic (dict):  global input parameters that can be altered in the config.py file
-        file (str): path name of the file containing a sieving sample
+        dic (dict or ExtractionPlan):  global input parameters that can be altered in the config.py file, or a plan
+            already compiled from them (recommended when looping through many files)
+        file (str): path name of the file containing a sieving sample (.xlsx, .ods or delimited text as .csv)
 
     Returns:
         df: dataframe containing grain sizes and class weights (parsed according to the config.py)
         list: list of sample's information as following: [samplename, sampledate, (lat, long), porosity,
             sf_porosity], parsed accoridng to the config.py.
     """
-    df = pd.read_excel(file, engine="openpyxl", header=None)
-    dff = df.copy()
-    columns_to_get = [dic["gs_clm"], dic["cw_clm"]]
-    dff_gs = dff.iloc[dic["header"]: dic["header"] + dic["n_rows"], columns_to_get]
-    dff_gs.reset_index(inplace=True, drop=True)
-    dff_gs = dff_gs.astype(float)
-
-    # Get metadata from the dataframe
-    # get sample name
-    try:
-        samplename = dff.iat[dic["index_sample_name"][0], dic["index_sample_name"][1]]
-    except Exception as e:
-        logging.error("Index for sample name not recognized, "
-                      "assigning None to the sample name.")
-        samplename = None
-        print(e)
-        pass
-
-    # get sample date
-    try:
-        sampledate = dff.iat[dic["index_sample_date"][0], dic["index_sample_date"][1]]
-    except Exception as e:
-        logging.error("Index for sample date not recognized, "
-                      "assigning None to the sample date.")
-        sampledate = None
-        print(e)
-        pass
-
-    # get sample coordinates
-    try:
-        lat = dff.iat[dic["index_lat"][0], dic["index_lat"][1]]
-        long = dff.iat[dic["index_long"][0], dic["index_long"][1]]
-    except Exception as e:
-        logging.error("Index for latitude and longitude not recognized, "
-                      "assigning None to both latitude and longitude.")
-        lat, long = None, None
-        print(e)
-        pass
-
-    # get porosity
-    try:
-        porosity = dff.iat[dic["porosity"][0], dic["porosity"][1]]
-    except Exception as e:
-        logging.error("Index for porosity not recognized, "
-                      "assigning None User defined porosity.")
-        porosity = None
-        print(e)
-        pass
-
-    # get sf_porosity
-    try:
-        sf_porosity = dff.iat[dic["SF_porosity"][0], dic["SF_porosity"][1]]
-    except Exception as e:
-        logging.error("Index for sf_porosity not recognized, "
-                      "assigning 6.1 which corresponds to rounded sediments.")
-        sf_porosity = 6.1  # default for rounded sediments
-        print(e)
-        pass
-
-    metadata = [samplename, sampledate, (lat, long), porosity, sf_porosity]
-
-    # Rename and standardize the Grain Size dataframe
-    dff_gs.rename(columns={dff_gs.columns[0]: "Grain Sizes [mm]", dff_gs.columns[1]: "Fraction Mass [g]"},
-                  inplace=True)
-    return dff_gs, metadata
-
-
-def find_files(folder=None):
+    # read only the lines containing the sieving table and the metadata
+    return compile_plan(dic).extract(file)
+
+
+def extract_sample(df=None, dic=input):
+    """
+    Function to tabularize the sieving table and the metadata of one sample from the raw cells of a file or sheet.
+
+    Args:
+        df (df): raw cells of the file (without header), as returned by readers.read_sieving_table
+        dic (dict or ExtractionPlan):  global input parameters that can be altered in the config.py file
+
+    Returns:
+        df: dataframe containing grain sizes and class weights (parsed according to the config.py)
+        list: list of sample's information as following: [samplename, sampledate, (lat, long), porosity,
+            sf_porosity], parsed accoridng to the config.py.
+    """
+    return compile_plan(dic).apply(df)
+
+
+def extract_workbook(dic=input, file=None):
+    """
+    Function to extract all samples of a workbook in a single pass. Samples can be stored one per sheet
+    (dic["sheets"]) and/or side by side in column blocks repeating every dic["block_offset"] columns. The file
+    is opened once and every block is tabularized from the cells already in memory.
+
+    Args:
+        dic (dict or ExtractionPlan):  global input parameters that can be altered in the config.py file
+        file (str): path name of the file containing the sieving samples
+
+    Returns:
+        list: list of tuples (df, metadata) as returned by extract_df, one per sample block
     """
-    Lists the files in the folder indicated
+    return compile_plan(dic).extract_workbook(file)
+
+
+def compile_plan(dic=input):
+    """
+    Compiles the input parameters into an ExtractionPlan (plans are returned unchanged).
+
+    Args:
+        dic (dict or ExtractionPlan): global input parameters that can be altered in the config.py file
+
+    Returns:
+        ExtractionPlan: validated plan for parsing sieving files
+    """
+    return dic if isinstance(dic, ExtractionPlan) else ExtractionPlan(dic)
+
+
+def find_files(folder=None, patterns=("*.xlsx", "*.ods", "*.csv", "*.tsv"), exclude=("~$*", ".*"), recursive=True,
+               index_path=None):
+    """
+    Lists the files in the folder indicated (and its subfolders if recursive is True)
 
     Args:
         folder (str): path of the folder to scan (to look for .xlxs files)
+        patterns (list): file name patterns to look for (e.g., ["*.xlsx", "*.csv", "*.ods"])
+        exclude (list): file and folder name patterns to skip
+        recursive (bool): if True, the subfolders are scanned as well
+        index_path (str): path of a json file for persisting the file index between runs (None: no persistence)
 
     Returns:
         list: list of strings from addresses of all files inside the folder
     """
+    file_index = FileIndex(folder=folder, patterns=patterns, exclude=exclude, recursive=recursive,
+                           index_path=index_path)
+    file_index.scan()
 
-    # Append / or / in director name if it does not have
-    if not str(folder).endswith("/") and not str(folder).endswith("\\"):
-        folder = Path(str(folder) + "/")
+    return file_index.list_files()
 
-    # Create a list of shape files or raster files names
-    file_list = glob.glob(str(folder) + "/*.xlsx")
 
-    return file_list
+def output_name(file=None, folder=None):
+    """
+    Names the outputs of a file after its path relative to the scanned folder, so that files with the same name in
+    different subfolders (e.g., FC/vorspü/x.xlsx and FC/nachspü/x.xlsx) do not overwrite each other's outputs.
+
+    Args:
+        file (str): path of the sieving file
+        folder (str): path of the scanned folder (None: name after the file name only)
+
+    Returns:
+        str: relative path of the file without extension, with the folder separators replaced by underscores
+    """
+    relative = Path(Path(file).name if folder is None else os.path.relpath(file, folder))
+    if os.pardir in relative.parts:
+        # the file is not inside the folder
+        relative = Path(relative.name)
+    return re.sub(r"[^\w.-]+", "_", "_".join(relative.with_suffix("").parts)).strip("_")
 
 
 def append_global(obj=None, df=None):
@@ -146,12 +151,16 @@ def append_global(obj=None, df=None):
     new_row = new_row + obj.porosity_conductivity_df["Corresponding kf [m/s]"].to_list()
     df_copo.loc[0] = new_row
 
+    # extract mass percentages of the grain size classes
+    df_classes = pd.DataFrame(data=[obj.size_class_df["Percentage [%]"].to_numpy()],
+                              columns=["{0} [%]".format(name) for name in obj.size_class_df["Name"]])
+
     # extract cumulative
     df_cum = pd.DataFrame(data=[obj.cumulative_df["Cumulative Percentage [%]"].to_numpy()],
                           columns=obj.cumulative_df["Grain Sizes [mm]"].to_numpy())
 
     # join dataframes
-    df_add = pd.concat([df_meta, df_stat, df_copo, df_cum], axis=1)
+    df_add = pd.concat([df_meta, df_stat, df_copo, df_classes, df_cum], axis=1)
 
     # append global dataframe in global
     if df.empty:
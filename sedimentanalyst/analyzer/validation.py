@@ -0,0 +1,182 @@
+""" Module containing the quality assurance of sieving data: the sieving tables of a batch of samples are checked at
+once (vectorized over the samples), and samples with errors are quarantined instead of aborting the analysis. The
+issues of every file and sample are summarized in a QA report.
+
+Author: Beatriz Negreiros
+
+"""
+from sedimentanalyst.analyzer.config import *
+
+# issue codes with their severity ("error": the sample is quarantined, "warning": the sample is analyzed but
+# flagged in the report) and description
+ISSUES = {"unreadable": ("error", "the file cannot be read"),
+          "no-samples": ("error", "no sieving table found in the file"),
+          "non-numeric": ("error", "non-numeric cell in the sieving table"),
+          "missing-values": ("error", "empty or infinite cells or less rows than n_rows in the sieving table"),
+          "non-positive-size": ("error", "grain size of zero or below"),
+          "unsorted-sieves": ("error", "grain sizes are not strictly decreasing"),
+          "negative-weights": ("error", "negative class weight"),
+          "zero-mass": ("error", "the total mass is zero"),
+          "few-sieves": ("warning", "less than three sieves retain mass"),
+          "incomplete-curve": ("warning", "the cumulative curve does not reach the smallest percentile (its "
+                                          "characteristic grain size is the smallest sieve)"),
+          }
+
+# issues detected from the sieving tables, in the column order of check_tables
+TABLE_CHECKS = ["missing-values", "non-positive-size", "unsorted-sieves", "negative-weights", "zero-mass",
+                "few-sieves", "incomplete-curve"]
+
+
+def stack_tables(sieving_dfs=None, n_rows=None):
+    """
+    Stacks the sieving tables of a batch of samples into two matrices, padded with NaN.
+
+    Args:
+        sieving_dfs (list): sieving dataframes (grain sizes and class weights columns)
+        n_rows (int): expected number of rows (default: rows of the longest table)
+
+    Returns:
+        tuple: grain sizes and class weights, both with shape (n_samples, n_rows)
+    """
+    n_rows = max([len(df) for df in sieving_dfs] + [0]) if n_rows is None else n_rows
+    tables = np.full((len(sieving_dfs), n_rows, 2), np.nan)
+    for k, df in enumerate(sieving_dfs):
+        values = df.to_numpy(dtype=float)[:n_rows, :2]
+        tables[k, :values.shape[0], :values.shape[1]] = values
+    return tables[..., 0], tables[..., 1]
+
+
+def check_tables(grain_sizes=None, weights=None, min_percentile=10):
+    """
+    Checks the sieving tables of all samples at once.
+
+    Args:
+        grain_sizes (np.array): sieve diameters [mm], expected from the largest to the smallest sieve, shape
+            (n_samples, n_rows)
+        weights (np.array): class weights [g], shape (n_samples, n_rows)
+        min_percentile (float): smallest cumulative percentage [%] of the characteristic grain sizes
+
+    Returns:
+        df: boolean dataframe with one row per sample and one column per issue of TABLE_CHECKS
+    """
+    grain_sizes = np.atleast_2d(np.asarray(grain_sizes, dtype=float))
+    weights = np.atleast_2d(np.asarray(weights, dtype=float))
+    # tables without rows (e.g., empty lists sent to the REST API) are missing all their values
+    if grain_sizes.shape[1] == 0 or weights.shape[1] == 0:
+        n = max(grain_sizes.shape[0], weights.shape[0])
+        grain_sizes, weights = np.full((n, 1), np.nan), np.full((n, 1), np.nan)
+    # infinite sizes or weights are treated like empty cells (the statistics of such samples are undefined)
+    finite_sizes, finite_weights = np.isfinite(grain_sizes), np.isfinite(weights)
+    with np.errstate(invalid="ignore"):
+        sizes_ok = np.where(finite_sizes, grain_sizes, 1.0)
+        weights_ok = np.where(finite_weights, weights, 0.0)
+        total = weights_ok.sum(axis=1)
+        # cumulative percentage of the smallest sieve (all mass passing the next larger sieve)
+        smallest = 100 * weights_ok[:, -1] / total
+        issues = {"missing-values": ~finite_sizes.all(axis=1) | ~finite_weights.all(axis=1),
+                  "non-positive-size": (sizes_ok <= 0).any(axis=1),
+                  "unsorted-sieves": (np.diff(sizes_ok, axis=1) >= 0).any(axis=1),
+                  "negative-weights": (weights_ok < 0).any(axis=1),
+                  "zero-mass": ~(total > 0),
+                  "few-sieves": (weights_ok > 0).sum(axis=1) < 3,
+                  "incomplete-curve": smallest > min_percentile,
+                  }
+    return pd.DataFrame(issues, columns=TABLE_CHECKS)
+
+
+def is_error(codes=None):
+    """
+    Tells if a list of issue codes contains an error (see ISSUES).
+
+    Args:
+        codes (list): issue codes
+
+    Returns:
+        bool: True if the sample has to be quarantined
+    """
+    return any(ISSUES[code][0] == "error" for code in codes)
+
+
+def validate_samples(samples=None, n_rows=None, min_percentile=10):
+    """
+    Validates the parsed samples of a batch.
+
+    Args:
+        samples (list): tuples (sieving dataframe, metadata) as returned by utils.extract_workbook
+        n_rows (int): expected number of rows of the sieving tables (see config.get_input)
+        min_percentile (float): smallest cumulative percentage [%] of the characteristic grain sizes
+
+    Returns:
+        list: list of issue codes of each sample
+    """
+    if not samples:
+        return []
+    grain_sizes, weights = stack_tables([df for df, _ in samples], n_rows=n_rows)
+    issues = check_tables(grain_sizes, weights, min_percentile=min_percentile)
+    codes = np.array(TABLE_CHECKS, dtype=object)
+    return [codes[row].tolist() for row in issues.to_numpy()]
+
+
+def collect_samples(files=None, plan=None, min_percentile=10):
+    """
+    Extracts and validates the samples of a list of files. Files that cannot be read and samples with errors are
+    quarantined (left out of the returned samples) and reported, so that a bad file never aborts a run.
+
+    Args:
+        files (list): paths of the sieving files
+        plan (ExtractionPlan): compiled input parameters (see utils.compile_plan)
+        min_percentile (float): smallest cumulative percentage [%] of the characteristic grain sizes
+
+    Returns:
+        tuple: list of valid samples as tuples (file, index of the sample in the file, sieving dataframe, metadata)
+            and the QA report (see qa_report)
+    """
+    records, extracted = [], []
+    n_rows = plan.table_rows.stop - plan.table_rows.start
+    for file in files:
+        errors = []
+        try:
+            samples = plan.extract_workbook(file, errors=errors)
+        except Exception as e:
+            logging.error("Quarantining {0}: {1}".format(file, e))
+            records.append({"file": str(file), "sample": None, "sample name": None, "issues": ["unreadable"],
+                            "message": str(e)})
+            continue
+        for message in errors:
+            records.append({"file": str(file), "sample": None, "sample name": None, "issues": ["non-numeric"],
+                            "message": message})
+        if not samples and not errors:
+            records.append({"file": str(file), "sample": None, "sample name": None, "issues": ["no-samples"],
+                            "message": ""})
+        extracted += [(str(file), k, sample) for k, sample in enumerate(samples)]
+
+    # check the sieving tables of all samples at once
+    codes = validate_samples([sample for _, _, sample in extracted], n_rows=n_rows, min_percentile=min_percentile)
+    valid = []
+    for (file, k, (sieving_df, metadata)), sample_codes in zip(extracted, codes):
+        records.append({"file": file, "sample": k, "sample name": metadata[0], "issues": sample_codes,
+                        "message": "; ".join(ISSUES[code][1] for code in sample_codes)})
+        if is_error(sample_codes):
+            logging.error("Quarantining sample {0} of {1}: {2}".format(k, file, ", ".join(sample_codes)))
+        else:
+            valid.append((file, k, sieving_df, metadata))
+    return valid, qa_report(records)
+
+
+def qa_report(records=None):
+    """
+    Tabularizes the issues found in a batch.
+
+    Args:
+        records (list): dictionaries with the keys "file", "sample", "sample name", "issues" and "message"
+
+    Returns:
+        df: one row per file issue or sample with the columns "file", "sample", "sample name", "status" ("ok",
+            "flagged" or "quarantined"), "issues" (comma separated codes) and "message"
+    """
+    report = pd.DataFrame(records, columns=["file", "sample", "sample name", "issues", "message"])
+    report.insert(3, "status", ["quarantined" if is_error(codes) else "flagged" if codes else "ok"
+                                for codes in report["issues"]])
+    report["sample"] = report["sample"].astype("Int64")
+    report["issues"] = report["issues"].apply(", ".join)
+    return report
@@ -6,6 +6,7 @@ Author: Beatriz Negreiros
 
 from sedimentanalyst.app.appconfig import *
 from sedimentanalyst.analyzer.statistical_analyzer import StatisticalAnalyzer
+from sedimentanalyst.analyzer.parsing import ExtractionPlan
 
 
 class Accessories:
@@ -126,82 +127,23 @@ class Accessories:
             corresponding grain sizes)
             filename (dash.dcc.State.State): Filename
             date (dash.dcc.State.State):  date of last modified
-            input_dict_app (dict): Index parameters input by the user necessary to read and parse the contents
-                of the file
+            input_dict_app (dict or ExtractionPlan): Index parameters input by the user necessary to read and parse
+                the contents of the file (compile them once with ExtractionPlan when parsing many files)
 
         Returns:
             StatisticalAnalyzer: object for accessing necessary attributes of the class.
         """
-        # create a dataframe from Upload or example file
+        plan = input_dict_app if isinstance(input_dict_app, ExtractionPlan) else ExtractionPlan(input_dict_app)
+
+        # parse the sieving table and metadata from Upload or example file (xlsx, ods or delimited text)
         if contents is not None:
             content_type, content_string = contents.split(',')
 
             decoded = base64.b64decode(content_string)
-            if 'csv' in filename:
-                # Assume that the user uploaded a CSV file
-                df = pd.read_csv(
-                    io.StringIO(decoded.decode('utf-8')))
-            elif 'xls' in filename:
-                # Assume that the user uploaded an excel file
-                df = pd.read_excel(io.BytesIO(decoded), engine="openpyxl", header=None)
-
-            print(df.head())
-        elif file_name_example is not None:
-            df = pd.read_excel(file_name_example, engine="openpyxl", header=None)
-            print(df.head())
-
-
-        # clean the dataset by catching only inputs indicated with the indexes
-        dff = df.copy()
-        columns_to_get = [input_dict_app["gs_clm"], input_dict_app["cw_clm"]]
-        dff_gs = dff.iloc[input_dict_app["header"]: input_dict_app["header"] + input_dict_app["n_rows"],
-                 columns_to_get]
-        dff_gs.reset_index(inplace=True, drop=True)
-        dff_gs = dff_gs.astype(float)
-
-        # Get metadata from the dataframe
-        # get sample name
-        try:
-            samplename = dff.iat[input_dict_app["index_sample_name"][0], input_dict_app["index_sample_name"][1]]
-        except:
-            samplename = None
-            pass
-
-        # get sample date
-        try:
-            sampledate = dff.iat[input_dict_app["index_sample_date"][0], input_dict_app["index_sample_date"][1]]
-        except:
-            sampledate = None
-            pass
-
-        # get sample coordinates
-        try:
-            lat = dff.iat[input_dict_app["index_lat"][0], input_dict_app["index_lat"][1]]
-            long = dff.iat[input_dict_app["index_long"][0], input_dict_app["index_long"][1]]
-        except:
-            lat, long = None, None
-            pass
-
-        # get porosity
-        try:
-            porosity = dff.iat[input_dict_app["porosity"][0], input_dict_app["porosity"][1]]
-        except:
-            porosity = None
-            pass
-
-        # get sf_porosity
-        try:
-            sf_porosity = float(dff.iat[input_dict_app["SF_porosity"][0], input_dict_app["SF_porosity"][1]])
-        except:
-            sf_porosity = 6.1  # default for rounded sediments
-            pass
-
-        metadata = [samplename, sampledate, (lat, long), porosity, sf_porosity]
-
-        # Rename and standardize the Grain Size dataframe
-        dff_gs.rename(columns={dff_gs.columns[0]: "Grain Sizes [mm]", dff_gs.columns[1]: "Fraction Mass [g]"},
-                      inplace=True)
-
-        analyzer = StatisticalAnalyzer(sieving_df=dff_gs, metadata=metadata)
+            sieving_df, metadata = plan.extract(io.BytesIO(decoded), file_name=filename)
+        else:
+            sieving_df, metadata = plan.extract(file_name_example)
+
+        analyzer = StatisticalAnalyzer(sieving_df=sieving_df, metadata=metadata)
 
         return analyzer
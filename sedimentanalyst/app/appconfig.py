@@ -5,11 +5,18 @@ try:
     import plotly.express as px
     import plotly.graph_objects as go
     from dash import dcc, Input, Output, State, html
-    from pyproj import transform, CRS
+    from pyproj import transform, CRS, Transformer
     import pandas as pd
+    import numpy as np
+    from matplotlib import image as mpimg
     import glob
     from pathlib import Path
     import os
+    import hashlib
+    import json
+    import tempfile
+    import functools
+    import time
 except ImportError:
     print(
         "Error importing necessary packages")
@@ -0,0 +1,214 @@
+""" Caches of the web application: bounded in-memory caches for the objects built per dataset within one worker
+process, and a SQLite cache shared by all worker processes of a host (e.g., gunicorn workers) for the analysis
+results. The shared cache lives in a directory private to the user running the app, and stores data only (Arrow
+tables and JSON), so that its content never executes code when read.
+
+Author: Beatriz Negreiros
+
+"""
+
+import sqlite3
+import stat
+import threading
+import time
+from collections import OrderedDict
+
+import pyarrow as pa
+import pyarrow.ipc
+
+from sedimentanalyst.app.appconfig import *
+from sedimentanalyst.analyzer import columnar
+
+# private directory of the shared cache and of the stored summaries (the environment variable
+# SEDIMENTANALYST_CACHE_DIR overrides it)
+CACHE_DIR = os.environ.get("SEDIMENTANALYST_CACHE_DIR",
+                           os.path.join(tempfile.gettempdir(), "sedimentanalyst-{0}".format(
+                               os.getuid() if hasattr(os, "getuid") else os.environ.get("USERNAME", "user"))))
+
+# path of the shared cache (the environment variable SEDIMENTANALYST_CACHE overrides it)
+CACHE_PATH = os.environ.get("SEDIMENTANALYST_CACHE", os.path.join(CACHE_DIR, "cache.sqlite"))
+
+# entries kept per namespace of the shared cache
+SHARED_CACHE_SIZE = 50000
+
+# seconds a worker waits for a lock of the shared cache held by another worker
+SQLITE_TIMEOUT = 30
+
+
+def private_directory(path=None):
+    """
+    Creates a directory only accessible by the current user, or checks that an existing one cannot be written by
+    other users, so that nobody else can place files read by the app (e.g., in the world-writable temp directory).
+
+    Args:
+        path (str): path of the directory
+
+    Returns:
+        str: path of the directory
+
+    Raises:
+        PermissionError: if the directory is a symbolic link, belongs to another user or is writable by others
+    """
+    path = str(path)
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode):
+        raise PermissionError("{0} is not a directory.".format(path))
+    if hasattr(os, "getuid") and (info.st_uid != os.getuid() or info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)):
+        raise PermissionError("{0} must belong to the current user and must not be writable by others, remove it "
+                              "or set SEDIMENTANALYST_CACHE_DIR.".format(path))
+    return path
+
+
+def _dumps(value):
+    # dataframes as Arrow IPC stream, all other values as JSON
+    if isinstance(value, pd.DataFrame):
+        table = columnar.to_arrow(value)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return "arrow", sink.getvalue().to_pybytes()
+    return "json", json.dumps(value).encode()
+
+
+def _loads(value_format, value):
+    if value_format == "arrow":
+        return columnar.from_arrow(pa.ipc.open_stream(value).read_all())
+    if value_format == "json":
+        return json.loads(value)
+    raise ValueError("Unknown format {0} of a cached value.".format(value_format))
+
+
+def content_key(*parts):
+    """
+    Returns a key identifying the content of some values, e.g., of an uploaded file and the input parameters used
+    for reading it.
+
+    Args:
+        parts: JSON serializable values
+
+    Returns:
+        str: md5 hash of the values
+    """
+    return hashlib.md5(json.dumps(parts, default=str, sort_keys=True).encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    A thread-safe in-memory cache keeping the last max_size entries (least recently used entries are dropped).
+
+    Attributes:
+        max_size (int): number of entries kept
+
+    Methods:
+        get (object): value of a key, None if not cached
+        put (None): stores the value of a key
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.__results = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__results)
+
+    def get(self, key):
+        with self.__lock:
+            if key not in self.__results:
+                return None
+            self.__results.move_to_end(key)
+            return self.__results[key]
+
+    def put(self, key, result):
+        with self.__lock:
+            self.__results[key] = result
+            self.__results.move_to_end(key)
+            while len(self.__results) > self.max_size:
+                self.__results.popitem(last=False)
+
+
+class SQLiteCache:
+    """
+    A cache stored in a SQLite database in a private directory, shared by the threads and worker processes of a
+    host. The values are dataframes (stored as Arrow tables) or JSON serializable values, and the least recently
+    written entries of a namespace are dropped beyond max_size entries. It has the same get and put methods as
+    ResultCache.
+
+    Attributes:
+        path (str): path of the database file
+        namespace (str): name separating the entries of different uses of the same database
+        max_size (int): number of entries kept in the namespace
+
+    Methods:
+        get (object): value of a key, None if not cached
+        put (None): stores the value of a key
+        get_or_compute (object): value of a key, computed and stored if not cached
+    """
+
+    def __init__(self, path=CACHE_PATH, namespace="results", max_size=SHARED_CACHE_SIZE):
+        self.path = str(path)
+        private_directory(os.path.dirname(os.path.abspath(self.path)))
+        self.namespace = namespace
+        self.max_size = max_size
+        self.__local = threading.local()
+        self.__writes = 0
+        with self.__connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS cache (namespace TEXT, key TEXT, format TEXT, value BLOB, "
+                               "written REAL, PRIMARY KEY (namespace, key))")
+            connection.execute("CREATE INDEX IF NOT EXISTS cache_written ON cache (namespace, written)")
+
+    def __repr__(self):
+        return "SQLiteCache({0}, {1})".format(self.path, self.namespace)
+
+    def __len__(self):
+        with self.__connection() as connection:
+            return connection.execute("SELECT COUNT(*) FROM cache WHERE namespace = ?",
+                                      (self.namespace,)).fetchone()[0]
+
+    def __connection(self):
+        # one connection per thread and process (connections must not be used after a fork)
+        if getattr(self.__local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.__local.connection = connection
+            self.__local.pid = os.getpid()
+        return self.__local.connection
+
+    def get(self, key):
+        with self.__connection() as connection:
+            row = connection.execute("SELECT format, value FROM cache WHERE namespace = ? AND key = ?",
+                                     (self.namespace, str(key))).fetchone()
+        return None if row is None else _loads(*row)
+
+    def put(self, key, result):
+        with self.__connection() as connection:
+            connection.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                               (self.namespace, str(key), *_dumps(result), time.time()))
+            # drop the oldest entries from time to time
+            self.__writes += 1
+            if self.__writes % 100:
+                return
+            connection.execute("DELETE FROM cache WHERE namespace = ? AND key IN (SELECT key FROM cache WHERE "
+                               "namespace = ? ORDER BY written DESC LIMIT -1 OFFSET ?)",
+                               (self.namespace, self.namespace, self.max_size))
+
+    def get_or_compute(self, key, function, *args, **kwargs):
+        """
+        Returns the cached value of a key, or computes and stores it.
+
+        Args:
+            key (str): key of the value (see content_key)
+            function (callable): function computing the value
+            args: positional arguments of the function
+            kwargs: keyword arguments of the function
+
+        Returns:
+            object: value
+        """
+        result = self.get(key)
+        if result is None:
+            result = function(*args, **kwargs)
+            self.put(key, result)
+        return result
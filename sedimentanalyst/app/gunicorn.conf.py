@@ -0,0 +1,38 @@
+""" Configuration for serving the web application with several gunicorn worker processes:
+
+    gunicorn -c sedimentanalyst/app/gunicorn.conf.py sedimentanalyst.app.web_application:server
+
+The app is loaded once in the master process, which analyses the examples and the reference folders
+(SEDIMENTANALYST_REFERENCE, see web_application.warm_up) before forking the workers. The workers thus start with the
+preloaded datasets in memory and the analysis results in the shared cache.
+
+Author: Beatriz Negreiros
+
+"""
+
+import os
+import sys
+
+# address of the server (PORT is set by hosting platforms such as heroku)
+bind = "0.0.0.0:{0}".format(os.environ.get("PORT", "8050"))
+
+# worker processes and threads per worker
+workers = int(os.environ.get("WEB_CONCURRENCY", 4))
+threads = 4
+
+# load the app in the master process, so that the workers inherit its warm caches
+preload_app = True
+
+
+def when_ready(server):
+    """
+    Preloads the examples and reference datasets in the master process, before the workers are forked.
+
+    Args:
+        server (gunicorn.arbiter.Arbiter): gunicorn master
+    """
+    if os.environ.get("SEDIMENTANALYST_WARM_UP", "1") == "0":
+        return
+    web_application = sys.modules["sedimentanalyst.app.web_application"]
+    for folder, data in web_application.warm_up(reference_folders=web_application.REFERENCE_FOLDERS).items():
+        server.log.info("Preloaded {0} samples of {1}".format(data['n_rows'], folder))
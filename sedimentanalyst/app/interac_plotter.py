@@ -5,6 +5,7 @@ Author : Federica Scolari
 """
 
 from sedimentanalyst.app.appconfig import *
+from sedimentanalyst.analyzer.schema import SummarySchema
 
 
 class InteractivePlotter:
@@ -13,18 +14,25 @@ class InteractivePlotter:
 
     Attributes:
         df (pandas.core.frame.DataFrame): DataFrame containing the information from the statistical analysis
-
+        schema (SummarySchema): column groups of df (e.g., diameters or curve), None without df
 
     Methods:
         convert_coordinates (df, projection): Transforms the coordinates of a given projection to degrees
         create_map (df, projection, samples=None): Creates a scatter map
+        create_viewport_map (index, bounds, zoom, samples): Creates a scatter map of the samples inside a viewport,
+            aggregated into clusters at low zoom levels
+        add_raster_overlay (fig, raster, opacity): Overlays an interpolated raster of a statistic on a map
         plot_barchart (param, samples): Plots the user-selected parameter for all samples in a bar chart
         plot_gsd (samples): Plots the cumulative grain size distribution curve for all samples using a line chart
         plot_diameters(samples): Plots the calculated sediment diameters in a bar chart for all samples
+        plot_similar(index, reference, k): Plots the grain size distribution curves of the samples most similar to a
+            reference sample
+        plot_facies(x, y): Plots the samples in a scatter plot of two statistics colored by their facies
     """
 
     def __init__(self, df):
         self.df = df
+        self.schema = SummarySchema.of(df) if df is not None else None
 
     def convert_coordinates(self, df, projection):
         """
@@ -79,7 +87,7 @@ class InteractivePlotter:
                                 lat=df["lat"],
                                 lon=df["lon"],
                                 hover_name="sample name",
-                                hover_data=df.columns[4:22],
+                                hover_data=self.schema.columns("diameters", "statistics"),
                                 color='sample name',
                                 zoom=11)
 
@@ -93,13 +101,99 @@ class InteractivePlotter:
 
         return fig
 
-    def plot_barchart(self, param, samples):
+    def create_viewport_map(self, index, bounds=None, zoom=11, samples=None, max_points=2000, detail_zoom=14):
+        """
+        Creates a scatter map with only the samples inside the current viewport of the map. When more than
+        max_points samples are visible below detail_zoom, samples close on the screen are aggregated into clusters
+        (sized by their number of samples) and the statistics are not sent to the browser.
+
+        Args:
+            index (SpatialIndex): spatial index of the samples (coordinates converted to degrees)
+            bounds (tuple): west, south, east and north limits of the viewport [degrees] (None: all samples)
+            zoom (float): zoom level of the map
+            samples (list): Names of the samples to show (None: all samples)
+            max_points (int): maximum number of samples drawn individually below detail_zoom
+            detail_zoom (float): zoom level from which all visible samples are drawn with their statistics
+
+        Returns:
+            plotly.graph_objects.Figure: Figure object with the Open Street map of the viewport
+        """
+
+        positions = index.query(bounds)
+        if samples is not None:
+            positions = positions[np.isin(index.df["sample name"].to_numpy()[positions], samples)]
+        df = index.df.iloc[positions]
+
+        fig = go.Figure()
+        if len(df) > max_points and zoom < detail_zoom:
+            clusters = index.aggregate(positions, zoom=zoom)
+            fig.add_trace(go.Scattermapbox(lat=clusters["lat"], lon=clusters["lon"], mode='markers',
+                                           marker=dict(size=10 + 4 * np.log2(clusters["count"]), opacity=0.7),
+                                           text=clusters["count"], hovertemplate="%{text} samples<extra></extra>",
+                                           name="clusters"))
+        else:
+            hover = SummarySchema.of(df).columns("diameters", "statistics")
+            fig.add_trace(go.Scattermapbox(lat=df["lat"], lon=df["lon"], mode='markers',
+                                           marker=dict(size=9), text=df["sample name"],
+                                           customdata=df[hover].to_numpy(),
+                                           hovertemplate="<b>%{text}</b><br>" + "<br>".join(
+                                               f"{name}: %{{customdata[{k}]:.3f}}" for k, name in enumerate(hover))
+                                                         + "<extra></extra>",
+                                           name="samples"))
+
+        # keep the viewport of the user when the figure is updated
+        if bounds is None:
+            bounds = index.bounds() or (0, 0, 0, 0)
+        fig.update_layout(margin={"r": 0, "t": 0, "l": 0, "b": 0}, uirevision="map", showlegend=False,
+                          mapbox=dict(center=dict(lat=(bounds[1] + bounds[3]) / 2, lon=(bounds[0] + bounds[2]) / 2),
+                                      zoom=zoom))
+        fig.update_layout(
+            mapbox_style="https://api.maptiler.com/maps/hybrid/style.json?key=0Z4EjONT5cOhLOIpZlRQ"
+        )
+
+        return fig
+
+    def add_raster_overlay(self, fig, raster, opacity=0.6, colorscale='viridis'):
+        """
+        Overlays an interpolated raster of a statistic (see gridding.interpolate_raster) as image layer on a map,
+        with a color bar of its values.
+
+        Args:
+            fig (plotly.graph_objects.Figure): map created with create_map or create_viewport_map
+            raster (gridding.Raster): interpolated grid
+            opacity (float): opacity of the image layer
+            colorscale (str): name of the colormap (shared by matplotlib and plotly)
+
+        Returns:
+            plotly.graph_objects.Figure: Figure object with the raster below the sample markers
+        """
+
+        # render the raster as png (cells without estimate are transparent)
+        vmin, vmax = np.nanmin(raster.values), np.nanmax(raster.values)
+        buffer = io.BytesIO()
+        mpimg.imsave(buffer, np.ma.masked_invalid(raster.values), cmap=colorscale, vmin=vmin, vmax=vmax, format='png')
+        source = "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+        # corners of the raster in degrees
+        west, south, east, north = raster.bounds()
+        lon, lat = Transformer.from_crs(raster.crs, 'epsg:4326', always_xy=True).transform(
+            [west, east, east, west], [north, north, south, south])
+
+        fig.update_layout(mapbox_layers=[dict(sourcetype="image", source=source, opacity=opacity, below="traces",
+                                              coordinates=[[x, y] for x, y in zip(lon, lat)])])
+        fig.add_trace(go.Scattermapbox(lat=[None], lon=[None], mode='markers', hoverinfo='skip', showlegend=False,
+                                       marker=dict(colorscale=colorscale, cmin=vmin, cmax=vmax, color=[vmin],
+                                                   showscale=True, colorbar=dict(title=raster.name))))
+
+        return fig
+
+    def plot_barchart(self, param, samples=None):
         """
         Method that outputs the results in a bar chart for the interactive comparison of the results.
 
         Args:
             param (str): Statistical parameters selectable from the user
-            samples (list): Names of the collected samples
+            samples (list): Names of the collected samples (None: all samples of the dataframe)
 
         Returns:
             plotly.graph_objects.Figure: Figure object that allows the visualization of the plot of a
@@ -107,10 +201,9 @@ class InteractivePlotter:
         """
 
         # Create a new dataframe, with two columns:
-        # one to identify the samples' name and one for their corresponding value
-
-        new_df = {"sample name": samples, "parameters": self.df[f"{param}"]}
-        new_df = pd.DataFrame(new_df)
+        # one to identify the samples' name and one for their corresponding value (taken from the same rows)
+        df = self.df if samples is None else self.df[self.df["sample name"].isin(samples)]
+        new_df = pd.DataFrame({"sample name": df["sample name"].to_numpy(), "parameters": df[f"{param}"].to_numpy()})
         # Bar Chart creation
         fig = px.bar(new_df,
                      x="sample name",
@@ -131,12 +224,12 @@ class InteractivePlotter:
 
         return fig
 
-    def plot_gsd(self, samples):
+    def plot_gsd(self, samples=None):
         """
         Method which plots the cumulative grain size distribution curve for all selected samples.
 
         Args:
-             samples (list): Names of the collected samples
+             samples (list): Names of the collected samples (None: all samples of the dataframe)
 
         Returns:
             plotly.graph_objects.Figure: Figure object enabling the visualization of the plot of the grain
@@ -144,10 +237,10 @@ class InteractivePlotter:
         """
 
         # filter samples given sample name
-        df = self.df[self.df["sample name"].isin(samples)]
+        df = self.df if samples is None else self.df[self.df["sample name"].isin(samples)]
 
-        # filter only grain size, samples name and class weight
-        df_gsd = df.set_index("sample name").iloc[:, 32:49].stack().reset_index()
+        # filter only grain size, samples name and cumulative percentage (columns named after the sieves)
+        df_gsd = self.schema.select(df, "curve").set_axis(df["sample name"], axis=0).stack().reset_index()
 
         # rename columns for future reference
         df_gsd.rename(columns={df_gsd.columns[1]: "gsd", df_gsd.columns[2]: "cw"}, inplace=True)
@@ -175,30 +268,29 @@ class InteractivePlotter:
 
         return fig
 
-    def plot_diameters(self, samples):
+    def plot_diameters(self, samples=None):
         """
         Method which plots the calculated sediment diameters in a bar chart for all selected samples.
 
         Args:
-            samples (list): Names of the collected samples
+            samples (list): Names of the collected samples (None: all samples of the dataframe)
 
         Returns:
             plotly.graph_objects.Figure: Figure object allowing to visualize the calculated diameters
-            (d10, d16, d25, d30, d50, d60, d75, d84 and d90) for all the collected samples
+            (by default d10, d16, d25, d30, d50, d60, d75, d84 and d90) for all the collected samples
         """
 
         # filter samples given sample name
-        df = self.df[self.df["sample name"].isin(samples)]
+        df = self.df if samples is None else self.df[self.df["sample name"].isin(samples)]
 
         x = df["sample name"].tolist()
         fig = go.Figure()
 
-        diams_values_per_sample = df.iloc[:, 4:13]
-
-        diams_title = df.columns[4:13].tolist()
+        diams_values_per_sample = self.schema.select(df, "diameters")
+        diams_title = diams_values_per_sample.columns.tolist()
 
         # enables proper view of the barchart with the overlay barmode
-        for n in range(8, -1, -1):
+        for n in range(len(diams_title) - 1, -1, -1):
             fig.add_trace(go.Bar(x=x, y=diams_values_per_sample.iloc[:, n].tolist(), name=diams_title[n]))
 
         fig.update_layout(barmode='overlay', title="Overview of Diameters",
@@ -212,3 +304,70 @@ class InteractivePlotter:
                          linecolor='black', gridcolor='darkgrey')
 
         return fig
+
+    def plot_similar(self, index, reference, k=5):
+        """
+        Method which plots the cumulative grain size distribution curves (resampled onto the common sieve grid) of
+        a reference sample and of its k most similar samples.
+
+        Args:
+            index (SimilarityIndex): index of the samples, built with mode "curve"
+            reference (str): name of the reference sample
+            k (int): number of similar samples to show
+
+        Returns:
+            plotly.graph_objects.Figure: Figure object with the curves of the reference (thick line) and of its
+                neighbours, named with their distance to the reference
+        """
+        neighbours = index.query(reference, k=k)
+
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(x=index.grid, y=index.vector_of(reference), name=f"{reference} (reference)",
+                                 line=dict(color='black', width=4)))
+        for position, name, distance in neighbours.itertuples():
+            fig.add_trace(go.Scatter(x=index.grid, y=index.vectors[position],
+                                     name=f"{name} (distance {distance:.1f})"))
+
+        fig.update_layout(title="Similar Samples", title_font_size=20,
+                          legend_bordercolor='darkgrey')
+
+        fig.update_xaxes(type="log", title="Grain Size [mm]", showline=True, mirror=True,
+                         ticks='outside', linewidth=2, title_font_size=14,
+                         linecolor='black', gridcolor='darkgrey')
+
+        fig.update_yaxes(title="Percentage [%]", showline=True, mirror=True,
+                         ticks='outside', linewidth=2, title_font_size=14,
+                         linecolor='black', gridcolor='darkgrey')
+
+        return fig
+
+    def plot_facies(self, x="d50", y="Geometric Standard Deviation"):
+        """
+        Method which plots all samples in a scatter plot of two statistics, colored by their sediment facies (see
+        clustering.classify_facies). WebGL markers are used so that large collections remain responsive.
+
+        Args:
+            x (str): statistic on the x axis (log scale)
+            y (str): statistic on the y axis
+
+        Returns:
+            plotly.graph_objects.Figure: Figure object with one trace per facies
+        """
+
+        fig = go.Figure()
+        for facies, df in self.df.groupby("facies"):
+            fig.add_trace(go.Scattergl(x=df[x], y=df[y], mode='markers', name=f"Facies {facies}",
+                                       text=df["sample name"], hovertemplate="%{text}<br>%{x:.2f}, %{y:.2f}"))
+
+        fig.update_layout(title="Sediment Facies", title_font_size=20, legend_title="Facies",
+                          legend_bordercolor='darkgrey')
+
+        fig.update_xaxes(type="log", title=x, showline=True, mirror=True,
+                         ticks='outside', linewidth=2, title_font_size=14,
+                         linecolor='black', gridcolor='darkgrey')
+
+        fig.update_yaxes(title=y, showline=True, mirror=True,
+                         ticks='outside', linewidth=2, title_font_size=14,
+                         linecolor='black', gridcolor='darkgrey')
+
+        return fig
@@ -0,0 +1,212 @@
+""" Load test of the web application: replays the upload and filter interactions of concurrent users against a
+running server through the Dash callback endpoint, and reports the latency of each interaction.
+
+Usage (with the app running, e.g., gunicorn -c sedimentanalyst/app/gunicorn.conf.py
+sedimentanalyst.app.web_application:server):
+    python load_test.py --url http://127.0.0.1:8050 --users 20 --iterations 5
+
+Author: Beatriz Negreiros
+
+"""
+
+import argparse
+import logging
+import random
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from sedimentanalyst.app.appconfig import *
+
+# input parameters of the template files, as stored by the first callback of the app (save_inputs)
+TEMPLATE_INPUTS = dict(header=9, gs_clm=1, cw_clm=2, n_rows=16, porosity=[2, 4], SF_porosity=[2, 5],
+                       index_lat=[5, 2], index_long=[5, 3], index_sample_name=[6, 2], index_sample_date=[4, 2],
+                       projection="epsg:3857")
+
+# statistics selected in the bar chart interactions
+STATISTICS = ["d10", "d50", "d84", "Mean Grain Size dm [mm]", "Geometric Standard Deviation"]
+
+# media type of the uploaded xlsx files
+XLSX_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def encode_upload(file=None):
+    """
+    Encodes a file as the contents of the dcc.Upload component (base64 data URL).
+
+    Args:
+        file (str): path of the file
+
+    Returns:
+        str: data URL
+    """
+    with open(file, "rb") as f:
+        return "data:{0};base64,{1}".format(XLSX_TYPE, base64.b64encode(f.read()).decode())
+
+
+def prop(component_id=None, name=None, value=None):
+    """
+    Returns the value of a component property as sent to a callback.
+
+    Args:
+        component_id (str): id of the component
+        name (str): name of the property
+        value: value of the property
+
+    Returns:
+        dict: property
+    """
+    return {"id": component_id, "property": name, "value": value}
+
+
+def call_callback(url=None, outputs=None, inputs=None, state=None, changed=None, timeout=120):
+    """
+    Fires a callback of the app, as the browser does.
+
+    Args:
+        url (str): address of the server
+        outputs (list): tuples (component id, property) of the outputs
+        inputs (list): inputs of the callback (see prop), in the order of their declaration
+        state (list): states of the callback (see prop), in the order of their declaration
+        changed (str): input that triggered the callback, e.g., "sample_id.value"
+        timeout (float): seconds to wait for the response
+
+    Returns:
+        dict: response of the callback (outputs by component id and property)
+    """
+    output_specs = [{"id": i, "property": p} for i, p in outputs]
+    payload = {"output": ".".join("{0}.{1}".format(i, p) for i, p in outputs) if len(outputs) == 1
+               else ".." + "...".join("{0}.{1}".format(i, p) for i, p in outputs) + "..",
+               "outputs": output_specs[0] if len(outputs) == 1 else output_specs,
+               "inputs": inputs, "state": state or [], "changedPropIds": [changed]}
+    request = urllib.request.Request(url.rstrip("/") + "/_dash-update-component",
+                                     data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())["response"]
+
+
+class VirtualUser:
+    """
+    A class for replaying the session of one analyst: uploading files, running the analysis and filtering samples
+    and statistics.
+
+    Attributes:
+        url (str): address of the server
+        files (list): paths of the uploaded files
+        latencies (dict): list of the latencies [s] of each interaction
+        errors (dict): number of failed requests of each interaction
+
+    Methods:
+        upload (None): uploads the files and stores the reference to the analyzed summary
+        filter (None): selects a random subset of samples and statistic and redraws the plots
+    """
+
+    def __init__(self, url=None, files=None, seed=0):
+        self.url = url
+        self.files = files
+        self.latencies = {}
+        self.errors = {}
+        self.__random = random.Random(seed)
+        self.__data = None
+        self.__samples = []
+
+    def __timed(self, name, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = call_callback(self.url, *args, **kwargs)
+        except (urllib.error.URLError, OSError, ValueError, KeyError) as e:
+            self.errors[name] = self.errors.get(name, 0) + 1
+            logging.warning("{0} failed: {1}".format(name, e))
+            return None
+        self.latencies.setdefault(name, []).append(time.perf_counter() - start)
+        return response
+
+    def upload(self):
+        contents = [encode_upload(file) for file in self.files]
+        names = [os.path.basename(file) for file in self.files]
+        response = self.__timed("upload", outputs=[("download-buttom", "children"), ("stored-data", "data")],
+                                inputs=[prop("upload-data", "contents", contents), prop("btn_run", "n_clicks", None),
+                                        prop("btn_run_example", "n_clicks", 0)],
+                                state=[prop("upload-data", "filename", names),
+                                       prop("upload-data", "last_modified", [0] * len(names)),
+                                       prop("store_manual_inputs", "data", TEMPLATE_INPUTS)],
+                                changed="upload-data.contents")
+        if response is None:
+            return
+        self.__data = response["stored-data"]["data"]
+        response = self.__timed("sample list", outputs=[("dropdown-sample_id", "children")],
+                                inputs=[prop("btn_run", "n_clicks", 1)],
+                                state=[prop("stored-data", "data", self.__data)], changed="btn_run.n_clicks")
+        if response is not None:
+            dropdown = response["dropdown-sample_id"]["children"]["props"]["children"][1]
+            self.__samples = dropdown["props"]["value"]
+
+    def filter(self):
+        if self.__data is None or not self.__samples:
+            return
+        samples = self.__random.sample(self.__samples, self.__random.randint(1, len(self.__samples)))
+        statistic = self.__random.choice(STATISTICS)
+        stored = prop("stored-data", "data", self.__data)
+        self.__timed("bar chart", outputs=[("div-barchart", "children")],
+                     inputs=[prop("statistics_id", "value", statistic), prop("sample_id", "value", samples)],
+                     state=[stored], changed="sample_id.value")
+        self.__timed("grain size curves", outputs=[("div-gsd", "children")],
+                     inputs=[prop("sample_id", "value", samples)], state=[stored], changed="sample_id.value")
+        self.__timed("diameters", outputs=[("div-diameters", "children")],
+                     inputs=[prop("sample_id", "value", samples)], state=[stored], changed="sample_id.value")
+
+
+def run_load_test(url=None, files=None, users=10, iterations=5, filters=5):
+    """
+    Replays the sessions of concurrent users, each uploading the files and filtering the samples several times.
+
+    Args:
+        url (str): address of the server
+        files (list): paths of the files uploaded by each user
+        users (int): number of concurrent users
+        iterations (int): number of uploads per user
+        filters (int): number of filter interactions after each upload
+
+    Returns:
+        df: number of requests, errors and latency percentiles [s] of each interaction, and the throughput
+            [requests/s] over the whole test
+    """
+    virtual_users = [VirtualUser(url=url, files=files, seed=k) for k in range(users)]
+
+    def session(user):
+        for _ in range(iterations):
+            user.upload()
+            for _ in range(filters):
+                user.filter()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as executor:
+        list(executor.map(session, virtual_users))
+    duration = time.perf_counter() - start
+
+    rows = []
+    names = dict.fromkeys(name for user in virtual_users for name in list(user.latencies) + list(user.errors))
+    for name in names:
+        latencies = np.concatenate([user.latencies.get(name, []) for user in virtual_users])
+        rows.append({"interaction": name, "requests": latencies.size,
+                     "errors": sum(user.errors.get(name, 0) for user in virtual_users),
+                     "p50 [s]": np.percentile(latencies, 50) if latencies.size else np.nan,
+                     "p95 [s]": np.percentile(latencies, 95) if latencies.size else np.nan,
+                     "max [s]": latencies.max() if latencies.size else np.nan,
+                     "throughput [requests/s]": latencies.size / duration})
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test of the Sediment Analyst web application.")
+    parser.add_argument("--url", default="http://127.0.0.1:8050", help="address of the running app")
+    parser.add_argument("--users", type=int, default=10, help="number of concurrent users")
+    parser.add_argument("--iterations", type=int, default=3, help="number of uploads per user")
+    parser.add_argument("--filters", type=int, default=5, help="number of filter interactions per upload")
+    parser.add_argument("--files", nargs="+", default=sorted(glob.glob(os.path.join(os.path.dirname(
+        os.path.abspath(__file__)), "examples", "*.xlsx"))), help="files uploaded by each user")
+    args = parser.parse_args()
+
+    print(run_load_test(url=args.url, files=args.files, users=args.users, iterations=args.iterations,
+                        filters=args.filters).to_string(index=False))
@@ -0,0 +1,458 @@
+""" REST/JSON analysis API served by the Flask server underneath the Dash app, for computing the statistics of
+sieving samples without the browser UI. Concurrent requests are coalesced into vectorized batches.
+
+Author: Beatriz Negreiros
+
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+
+from flask import Blueprint, Response, jsonify, request
+
+from sedimentanalyst.app.appconfig import *
+from sedimentanalyst.app.cache import ResultCache
+from sedimentanalyst.analyzer import batch_statistics, columnar
+from sedimentanalyst.analyzer.config import get_input
+from sedimentanalyst.analyzer.parsing import ExtractionPlan
+from sedimentanalyst.analyzer.validation import ISSUES, check_tables, is_error, validate_samples
+
+# seconds a worker waits for more samples before analyzing a batch
+BATCH_WINDOW = 0.005
+
+# largest number of samples analyzed at once
+MAX_BATCH = 1024
+
+# number of analyzed samples kept for the GET /results/<sample id> endpoint
+CACHE_SIZE = 10000
+
+# sphericity index of rounded sediments, used when a sample has none
+DEFAULT_SF = 6.1
+
+# smallest number of sieves of a sample sent as JSON
+MIN_SIEVES = 2
+
+# text columns of the Arrow responses (the warning codes are comma separated)
+TEXT_COLUMNS = ["id", "file", "sample name", "date", "warnings"]
+
+# media type of the Arrow responses (Arrow IPC stream)
+ARROW_MIMETYPE = "application/vnd.apache.arrow.stream"
+
+
+def analyze_batch(grain_sizes=None, weights=None, porosity=None, sf=None, percentiles=None):
+    """
+    Computes the statistics, porosity and kf of a batch of samples with the same number of sieves at once.
+
+    Args:
+        grain_sizes (np.array): sieve diameters [mm] from the largest to the smallest sieve, shape (n, n_sieves)
+        weights (np.array): class weights [g], shape (n, n_sieves)
+        porosity (np.array): porosity given by the user for each sample (np.nan if not available)
+        sf (np.array): sphericity index of each sample
+        percentiles (list): characteristic grain sizes to compute (default: batch_statistics.DEFAULT_PERCENTILES)
+
+    Returns:
+        list: one dictionary per sample with the keys "statistics", "porosity", "kf" and "cumulative"
+    """
+    percentiles = batch_statistics.DEFAULT_PERCENTILES if percentiles is None else percentiles
+    statistics = batch_statistics.compute_statistics(grain_sizes=grain_sizes, weights=weights,
+                                                     percentiles=percentiles)
+    conductivity = batch_statistics.compute_porosity_conductivity(grain_sizes=grain_sizes, statistics=statistics,
+                                                                  user_porosity=porosity, sf=sf)
+    names = [name for name in statistics if name not in ["fractions", "cumulative"]]
+    results = []
+    for k in range(len(weights)):
+        results.append({"statistics": {name: statistics[name][k] for name in names},
+                        "porosity": {name.replace(" [Porosity]", ""): values[k]
+                                     for name, values in conductivity.items() if name.endswith("[Porosity]")},
+                        "kf": {name.replace(" [Estimated kf]", ""): values[k]
+                               for name, values in conductivity.items() if name.endswith("[Estimated kf]")},
+                        "cumulative": statistics["cumulative"][k].tolist()})
+    return results
+
+
+def sample_id(grain_sizes=None, weights=None, porosity=None, sf=None):
+    """
+    Returns an identifier derived from the content of a sample, so that the same sample always gets the same ID.
+
+    Args:
+        grain_sizes (list): sieve diameters [mm]
+        weights (list): class weights [g]
+        porosity (float): porosity given by the user
+        sf (float): sphericity index
+
+    Returns:
+        str: md5 hash of the sample
+    """
+    return hashlib.md5(json.dumps([grain_sizes, weights, porosity, sf], default=str).encode()).hexdigest()
+
+
+def to_json(value=None):
+    """
+    Converts numpy values (recursively) into JSON serializable values, with NaN and infinite values as null.
+
+    Args:
+        value: number, array, list or dictionary
+
+    Returns:
+        JSON serializable value
+    """
+    if isinstance(value, dict):
+        return {str(key): to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [to_json(item) for item in value]
+    if isinstance(value, (float, np.floating)):
+        return float(value) if np.isfinite(value) else None
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (pd.Timestamp, pd.Timedelta)):
+        return str(value)
+    return value
+
+
+class BatchAnalyzer:
+    """
+    A class for coalescing the samples of concurrent requests into vectorized runs of batch_statistics. A pool of
+    worker threads takes the queued samples, waits up to batch_window seconds for more, groups them by number of
+    sieves and percentiles and analyzes each group at once.
+
+    Attributes:
+        n_workers (int): number of worker threads
+        batch_window (float): seconds a worker waits for more samples
+        max_batch (int): largest number of samples analyzed at once
+        batches (int): number of analyzed batches (for monitoring the coalescing)
+        samples (int): number of analyzed samples
+
+    Methods:
+        submit (concurrent.futures.Future): queues a sample
+        analyze (list): analyzes a list of samples and waits for their results
+    """
+
+    def __init__(self, n_workers=2, batch_window=BATCH_WINDOW, max_batch=MAX_BATCH):
+        self.n_workers = n_workers
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.samples = 0
+        self.__queue = []
+        self.__condition = threading.Condition()
+        self.__workers = []
+
+    def __repr__(self):
+        return "BatchAnalyzer({0} workers, {1} batches, {2} samples)".format(self.n_workers, self.batches,
+                                                                           self.samples)
+
+    def submit(self, grain_sizes=None, weights=None, porosity=np.nan, sf=DEFAULT_SF, percentiles=None):
+        """
+        Queues a sample for the next batch.
+
+        Args:
+            grain_sizes (list): sieve diameters [mm] from the largest to the smallest sieve
+            weights (list): class weights [g]
+            porosity (float): porosity given by the user (np.nan if not available)
+            sf (float): sphericity index
+            percentiles (list): characteristic grain sizes to compute
+
+        Returns:
+            concurrent.futures.Future: result of the sample (see analyze_batch)
+        """
+        future = Future()
+        key = (len(weights), tuple(batch_statistics.DEFAULT_PERCENTILES if percentiles is None else percentiles))
+        with self.__condition:
+            if not self.__workers:
+                self.__start()
+            self.__queue.append((key, grain_sizes, weights, porosity, sf, future))
+            self.__condition.notify()
+        return future
+
+    def analyze(self, samples=None, percentiles=None, timeout=60):
+        """
+        Queues samples and waits for their results.
+
+        Args:
+            samples (list): dictionaries with the keys "grain_sizes", "weights" and optionally "porosity" and "sf"
+            percentiles (list): characteristic grain sizes to compute
+            timeout (float): seconds to wait for the results
+
+        Returns:
+            list: result of each sample (see analyze_batch)
+        """
+        futures = [self.submit(grain_sizes=sample["grain_sizes"], weights=sample["weights"],
+                               porosity=sample.get("porosity", np.nan), sf=sample.get("sf", DEFAULT_SF),
+                               percentiles=percentiles) for sample in samples]
+        return [future.result(timeout=timeout) for future in futures]
+
+    def __start(self):
+        for _ in range(self.n_workers):
+            worker = threading.Thread(target=self.__work, daemon=True)
+            worker.start()
+            self.__workers.append(worker)
+
+    def __work(self):
+        while True:
+            with self.__condition:
+                while not self.__queue:
+                    self.__condition.wait()
+            # give concurrent requests some time to join the batch
+            time.sleep(self.batch_window)
+            with self.__condition:
+                batch, self.__queue = self.__queue[:self.max_batch], self.__queue[self.max_batch:]
+            if not batch:
+                continue
+
+            groups = {}
+            for item in batch:
+                groups.setdefault(item[0], []).append(item)
+            for (_, percentiles), items in groups.items():
+                _, grain_sizes, weights, porosity, sf, futures = zip(*items)
+                try:
+                    results = analyze_batch(grain_sizes=np.array(grain_sizes, dtype=float),
+                                            weights=np.array(weights, dtype=float),
+                                            porosity=np.array(porosity, dtype=float), sf=np.array(sf, dtype=float),
+                                            percentiles=list(percentiles))
+                except Exception as e:
+                    for future in futures:
+                        future.set_exception(e)
+                    continue
+                for future, result in zip(futures, results):
+                    future.set_result(result)
+                self.batches += 1
+                self.samples += len(items)
+
+
+def results_table(results=None):
+    """
+    Tabularizes the results of the analyzed samples with the column names of the global summary (see
+    utils.append_global), e.g., for the Arrow responses.
+
+    Args:
+        results (list): results of the samples (dictionaries with "id", the metadata of the sample, "warnings",
+            "statistics", "porosity" and "kf")
+
+    Returns:
+        pandas.core.frame.DataFrame: one row per sample
+    """
+    rows = []
+    for result in results:
+        row = {key: value for key, value in result.items()
+               if key not in ["statistics", "porosity", "kf", "cumulative"]}
+        if "warnings" in row:
+            row["warnings"] = ", ".join(row["warnings"])
+        row.update(result["statistics"])
+        row.update({"{} [Porosity]".format(name): value for name, value in result["porosity"].items()})
+        row.update({"{} [Estimated kf]".format(name): value for name, value in result["kf"].items()})
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def arrow_response(df=None):
+    """
+    Serializes a table of results as Arrow IPC stream.
+
+    Args:
+        df (pandas.core.frame.DataFrame): results table (see results_table)
+
+    Returns:
+        flask.Response: response with the ARROW_MIMETYPE
+    """
+    table = columnar.to_arrow(df, text_columns=TEXT_COLUMNS)
+    sink = columnar.pa.BufferOutputStream()
+    with columnar.pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return Response(sink.getvalue().to_pybytes(), mimetype=ARROW_MIMETYPE)
+
+
+def parse_samples(payload=None):
+    """
+    Reads the samples of a POST /analyze request, a single sample or a list of samples under "samples".
+
+    Args:
+        payload (dict): JSON body of the request
+
+    Returns:
+        tuple: list of samples (dictionaries with "id", "grain_sizes", "weights", "porosity", "sf" and the
+            "warnings" codes of validation.ISSUES, e.g., "few-sieves") and list of error messages of the rejected
+            samples
+
+    Raises:
+        ValueError: if "samples" is not a list
+    """
+    raw_samples = payload["samples"] if "samples" in payload else [payload]
+    if not isinstance(raw_samples, list):
+        raise ValueError("samples must be a list of samples")
+    samples, errors = [], []
+    for k, raw in enumerate(raw_samples):
+        try:
+            grain_sizes = [float(value) for value in raw["grain_sizes"]]
+            weights = [float(value) for value in raw["weights"]]
+        except (KeyError, TypeError, ValueError):
+            errors.append({"index": k, "id": raw.get("id") if isinstance(raw, dict) else None,
+                           "error": "grain_sizes and weights must be lists of numbers"})
+            continue
+        if len(grain_sizes) != len(weights):
+            errors.append({"index": k, "id": raw.get("id"), "error": "grain_sizes and weights differ in length"})
+            continue
+        if len(weights) < MIN_SIEVES:
+            errors.append({"index": k, "id": raw.get("id"),
+                           "error": "at least {0} sieves are required".format(MIN_SIEVES)})
+            continue
+        try:
+            porosity = np.nan if raw.get("porosity") is None else float(raw["porosity"])
+            sf = DEFAULT_SF if raw.get("sf") is None else float(raw["sf"])
+        except (TypeError, ValueError):
+            errors.append({"index": k, "id": raw.get("id"), "error": "porosity and sf must be numbers"})
+            continue
+        # check the sieving table as the batch validation of the sieving files
+        codes = [code for code, found in check_tables([grain_sizes], [weights]).iloc[0].items() if found]
+        if is_error(codes):
+            errors.append({"index": k, "id": raw.get("id"), "error": "; ".join(ISSUES[code][1] for code in codes)})
+            continue
+        samples.append({"index": k, "id": str(raw.get("id") or sample_id(grain_sizes, weights, raw.get("porosity"),
+                                                                            raw.get("sf"))),
+                        "grain_sizes": grain_sizes, "weights": weights, "porosity": porosity, "sf": sf,
+                        "warnings": codes})
+    return samples, errors
+
+
+def parse_files(files=None, plan=None):
+    """
+    Extracts and validates the samples of uploaded sieving files.
+
+    Args:
+        files (list): uploaded files (werkzeug.datastructures.FileStorage)
+        plan (ExtractionPlan): compiled input parameters
+
+    Returns:
+        tuple: list of samples (dictionaries with "id", "grain_sizes", "weights", "porosity", "sf", the metadata
+            and the "warnings" codes of the sample) and list of error messages of the rejected files and samples
+    """
+    samples, errors = [], []
+    for storage in files:
+        content = storage.read()
+        messages = []
+        try:
+            extracted = plan.extract_workbook(io.BytesIO(content), file_name=storage.filename, errors=messages)
+        except Exception as e:
+            errors.append({"file": storage.filename, "error": str(e)})
+            continue
+        errors += [{"file": storage.filename, "error": message} for message in messages]
+        codes = validate_samples(extracted, n_rows=plan.table_rows.stop - plan.table_rows.start)
+        for k, ((sieving_df, metadata), sample_codes) in enumerate(zip(extracted, codes)):
+            if is_error(sample_codes):
+                errors.append({"file": storage.filename, "sample": k,
+                               "error": "; ".join(ISSUES[code][1] for code in sample_codes)})
+                continue
+            values = sieving_df.to_numpy(dtype=float)
+            porosity = metadata[3] if isinstance(metadata[3], (int, float)) else np.nan
+            sf = metadata[4] if isinstance(metadata[4], (int, float)) else DEFAULT_SF
+            file_id = hashlib.md5(content).hexdigest()
+            samples.append({"id": "{0}-{1}".format(file_id, k), "file": storage.filename, "sample": k,
+                            "sample name": metadata[0], "date": metadata[1], "lat": metadata[2][0],
+                            "lon": metadata[2][1], "grain_sizes": values[:, 0].tolist(),
+                            "weights": values[:, 1].tolist(), "porosity": porosity, "sf": sf,
+                            "warnings": sample_codes})
+    return samples, errors
+
+
+def create_api(batch_analyzer=None, cache=None):
+    """
+    Creates the blueprint of the analysis API with the endpoints:
+
+    + POST /analyze: JSON with "grain_sizes" and "weights" (and optionally "id", "porosity" and "sf") of a sample,
+        or a list of such samples under "samples"
+    + POST /analyze/files: sieving files uploaded as multipart/form-data under "files", optionally with the input
+        parameters (see config.get_input) as JSON under "inputs"
+    + GET /results/<sample id>: result of an analyzed sample
+
+    The results are returned as JSON or, with the query parameter format=arrow, as Arrow IPC stream with one row
+    per sample (rejected samples are left out). The results list the warning codes of their sample under
+    "warnings" (see validation.ISSUES), e.g., "few-sieves" for a kf estimated from less than three sieves. The
+    percentiles of the characteristic grain sizes can be given as a list under "percentiles" (JSON) or as a comma
+    separated query parameter.
+
+    Args:
+        batch_analyzer (BatchAnalyzer): analyzer coalescing the samples of concurrent requests
+        cache (ResultCache): cache of the analyzed samples (or a cache.SQLiteCache shared by worker processes)
+
+    Returns:
+        flask.Blueprint: blueprint to register on the Flask server
+    """
+    batch_analyzer = BatchAnalyzer() if batch_analyzer is None else batch_analyzer
+    cache = ResultCache(max_size=CACHE_SIZE) if cache is None else cache
+    api = Blueprint("api", __name__)
+
+    def get_percentiles(payload=None):
+        percentiles = (payload or {}).get("percentiles", request.args.get("percentiles"))
+        if percentiles is None:
+            return None
+        if isinstance(percentiles, str):
+            percentiles = percentiles.split(",")
+        return batch_statistics.characteristic_percentiles([float(p) for p in percentiles]).tolist()
+
+    def respond(samples=None, errors=None, percentiles=None):
+        arrow = request.args.get("format") == "arrow"
+        results = batch_analyzer.analyze(samples, percentiles=percentiles)
+        output = []
+        for sample, result in zip(samples, results):
+            entry = {key: value for key, value in sample.items()
+                     if key not in ["grain_sizes", "weights", "porosity", "sf", "index"]}
+            entry.update(result)
+            entry = to_json(entry)
+            cache.put(entry["id"], entry)
+            output.append(entry)
+        if arrow:
+            return arrow_response(results_table(output))
+        return jsonify({"results": output, "errors": to_json(errors)})
+
+    @api.route("/analyze", methods=["POST"])
+    def analyze():
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict):
+            return jsonify({"error": "expected a JSON object"}), 400
+        try:
+            percentiles = get_percentiles(payload)
+            samples, errors = parse_samples(payload)
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+        return respond(samples, errors, percentiles)
+
+    @api.route("/analyze/files", methods=["POST"])
+    def analyze_files():
+        files = request.files.getlist("files")
+        if not files:
+            return jsonify({"error": "no files uploaded under 'files'"}), 400
+        try:
+            percentiles = get_percentiles()
+            dic = get_input()
+            dic.update(json.loads(request.form.get("inputs", "{}")))
+            plan = ExtractionPlan(dic)
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+        samples, errors = parse_files(files, plan)
+        return respond(samples, errors, percentiles)
+
+    @api.route("/results/<key>", methods=["GET"])
+    def get_result(key):
+        result = cache.get(key)
+        if result is None:
+            return jsonify({"error": "unknown sample id {0}".format(key)}), 404
+        return jsonify(result)
+
+    return api
+
+
+def register_api(server=None, prefix="/api", **kwargs):
+    """
+    Registers the analysis API on a Flask server, e.g., the server of the Dash app (app.server).
+
+    Args:
+        server (flask.Flask): Flask server
+        prefix (str): URL prefix of the endpoints
+        kwargs: arguments of create_api
+
+    Returns:
+        flask.Blueprint: registered blueprint
+    """
+    api = create_api(**kwargs)
+    server.register_blueprint(api, url_prefix=prefix)
+    return api
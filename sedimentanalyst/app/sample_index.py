@@ -0,0 +1,132 @@
+""" Module designated for the class SampleDataset
+
+Author : Federica Scolari
+
+"""
+
+import threading
+from collections import OrderedDict
+
+from sedimentanalyst.app.appconfig import *
+
+# number of sample selections kept per dataset (the callbacks sharing the same sample_id value reuse them)
+SELECTION_CACHE_SIZE = 16
+
+
+class SampleDataset:
+    """
+    A class for selecting the rows of the global dataframe by sample name. The mapping from sample names (and from
+    the values of other columns) to row positions is built once, so that a selection of samples resolves into a
+    single integer take instead of comparing all sample names. The columns are loaded on demand (e.g., from the
+    stored columnar summary) and the selections are cached, thus they must not be modified by the caller.
+
+    Attributes:
+        names (np.array): sample name of each row
+        n_rows (int): number of rows
+
+    Methods:
+        rows (np.array): row positions of a selection of samples
+        rows_by (dict): row positions of each value of a column (e.g., groups or facies)
+        select (pandas.core.frame.DataFrame): selected rows and columns
+    """
+
+    def __init__(self, df=None, loader=None):
+        """
+        Args:
+            df (pandas.core.frame.DataFrame): global dataframe, or only its "sample name" column when the other
+                columns are read by the loader
+            loader (callable): function returning the given columns of the global dataframe (e.g., a partial of
+                web_application.load_summary), None if df contains all columns
+        """
+        self.__frame = df.reset_index(drop=True)
+        self.__loader = loader
+        self.names = self.__frame["sample name"].to_numpy()
+        self.n_rows = len(self.names)
+        self.__groups = {"sample name": self.__index(self.names)}
+        self.__rows_cache = OrderedDict()
+        self.__selection_cache = OrderedDict()
+        self.__lock = threading.RLock()
+
+    def __repr__(self):
+        return "SampleDataset({0} rows, {1} samples)".format(self.n_rows, len(self.__groups["sample name"]))
+
+    @staticmethod
+    def __index(values):
+        # positions of the rows of each value, in the order of the rows
+        codes, uniques = pd.factorize(pd.Series(values, dtype=object), sort=False)
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        return {value: order[bounds[k]:bounds[k + 1]] for k, value in enumerate(uniques)}
+
+    @staticmethod
+    def __remember(cache, key, value):
+        cache[key] = value
+        while len(cache) > SELECTION_CACHE_SIZE:
+            cache.popitem(last=False)
+        return value
+
+    def rows(self, samples=None):
+        """
+        Resolves a selection of samples into row positions.
+
+        Args:
+            samples (list): sample names (None: all samples); unknown names are ignored
+
+        Returns:
+            np.array: sorted row positions of the selected samples (all rows of repeated names)
+        """
+        if samples is None:
+            return np.arange(self.n_rows)
+        key = tuple(samples)
+        with self.__lock:
+            if key in self.__rows_cache:
+                self.__rows_cache.move_to_end(key)
+                return self.__rows_cache[key]
+            index = self.__groups["sample name"]
+            found = [index[name] for name in dict.fromkeys(samples) if name in index]
+            rows = np.sort(np.concatenate(found)) if found else np.array([], dtype=int)
+            return self.__remember(self.__rows_cache, key, rows)
+
+    def rows_by(self, column=None):
+        """
+        Maps the values of a column to their row positions (computed once per column).
+
+        Args:
+            column (str): column name, e.g., "date" or "facies"
+
+        Returns:
+            dict: row positions (np.array) of each value of the column
+        """
+        with self.__lock:
+            if column not in self.__groups:
+                self.__groups[column] = self.__index(self.__columns([column])[column].to_numpy())
+            return self.__groups[column]
+
+    def __columns(self, columns):
+        missing = [c for c in columns if c not in self.__frame.columns]
+        if missing:
+            if self.__loader is None:
+                raise KeyError("Columns {0} are not available in the dataset.".format(missing))
+            loaded = self.__loader(columns=missing).reset_index(drop=True)
+            self.__frame = pd.concat([self.__frame, loaded], axis=1)
+        return self.__frame[list(columns)]
+
+    def select(self, samples=None, columns=None):
+        """
+        Selects the rows of some samples and the given columns. The result is cached for the same selection.
+
+        Args:
+            samples (list): sample names (None: all samples)
+            columns (list): column names (None: all columns loaded so far)
+
+        Returns:
+            pandas.core.frame.DataFrame: selection with a new index (0 to number of selected rows)
+        """
+        with self.__lock:
+            columns = list(self.__frame.columns) if columns is None else list(columns)
+            key = (None if samples is None else tuple(samples), tuple(columns))
+            if key in self.__selection_cache:
+                self.__selection_cache.move_to_end(key)
+                return self.__selection_cache[key]
+            df = self.__columns(columns).take(self.rows(samples)).reset_index(drop=True)
+            return self.__remember(self.__selection_cache, key, df)
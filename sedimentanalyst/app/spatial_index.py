@@ -0,0 +1,177 @@
+""" Module designated for the class SpatialIndex
+
+Author : Federica Scolari
+
+"""
+
+from sedimentanalyst.app.appconfig import *
+
+# width of the map tiles of mapbox [pixels]
+TILE_SIZE = 512
+
+# half of the earth circumference in web mercator coordinates [m]
+MERCATOR_EXTENT = 20037508.342789244
+
+# largest latitude representable in web mercator [degrees]
+MAX_LATITUDE = 85.0511287798
+
+
+def to_mercator(lon, lat):
+    """
+    Projects coordinates in degrees (WGS 84) to web mercator (epsg:3857), i.e., the projection of the map tiles.
+
+    Args:
+        lon (np.array): longitudes [degrees]
+        lat (np.array): latitudes [degrees]
+
+    Returns:
+        tuple: x and y arrays [m]
+    """
+    lat = np.clip(np.asarray(lat, dtype=float), -MAX_LATITUDE, MAX_LATITUDE)
+    x = np.asarray(lon, dtype=float) * MERCATOR_EXTENT / 180
+    y = np.log(np.tan((90 + lat) * np.pi / 360)) * MERCATOR_EXTENT / np.pi
+    return x, y
+
+
+def pixel_size(zoom):
+    """
+    Size of one screen pixel of the map in web mercator meters.
+
+    Args:
+        zoom (float): zoom level of the map
+
+    Returns:
+        float: pixel size [m]
+    """
+    return 2 * MERCATOR_EXTENT / (TILE_SIZE * 2 ** zoom)
+
+
+class SpatialIndex:
+    """
+    A class for querying the samples inside a map viewport. The samples are sorted into the cells of a uniform grid
+    over their web mercator coordinates, so that a viewport query only visits the cells it overlaps. Samples that are
+    close on the screen can be aggregated into clusters for low zoom levels.
+
+    Attributes:
+        df (pandas.core.frame.DataFrame): samples with valid coordinates (lat and lon converted to degrees)
+        x (np.array): web mercator x coordinates of the samples [m]
+        y (np.array): web mercator y coordinates of the samples [m]
+        cell_size (float): side length of the grid cells [m]
+
+    Methods:
+        bounds (tuple): extent of the samples in degrees (west, south, east, north)
+        query (np.array): positions of the samples inside a viewport
+        aggregate (pandas.core.frame.DataFrame): clusters of samples for a zoom level
+    """
+
+    def __init__(self, df, projection='epsg:3857', points_per_cell=16):
+        """
+        Builds the index. The coordinates are converted from the input projection to degrees only once.
+
+        Args:
+            df (pandas.core.frame.DataFrame): global dataframe with the columns "lat" and "lon" (in the input
+                projection)
+            projection (str): Name of the input projection
+            points_per_cell (int): average number of samples per grid cell
+        """
+        northing = pd.to_numeric(df["lat"], errors="coerce").to_numpy(dtype=float)
+        easting = pd.to_numeric(df["lon"], errors="coerce").to_numpy(dtype=float)
+        valid = ~(np.isnan(northing) | np.isnan(easting))
+
+        lon, lat = Transformer.from_crs(projection, 'epsg:4326', always_xy=True).transform(easting[valid],
+                                                                                          northing[valid])
+        self.df = df[valid].reset_index(drop=True)
+        self.df["lat"] = lat
+        self.df["lon"] = lon
+        self.x, self.y = to_mercator(lon, lat)
+
+        # grid with about points_per_cell samples per cell (over the extent of the samples)
+        n = len(self.x)
+        self.__x0 = self.x.min() if n else 0.0
+        self.__y0 = self.y.min() if n else 0.0
+        span = max(np.ptp(self.x), np.ptp(self.y)) if n else 0.0
+        self.cell_size = span / max(1.0, np.sqrt(n / points_per_cell)) or 1.0
+        self.__nx = int((self.x.max() - self.__x0) // self.cell_size) + 1 if n else 0
+        self.__ny = int((self.y.max() - self.__y0) // self.cell_size) + 1 if n else 1
+
+        keys = self.__cell_keys(self.x, self.y)
+        self.__order = np.argsort(keys, kind="stable")
+        self.__keys = keys[self.__order]
+
+    def __repr__(self):
+        return "SpatialIndex({0} samples, cell size {1:.0f} m)".format(len(self.x), self.cell_size)
+
+    def __cells(self, x, y):
+        return (np.floor((x - self.__x0) / self.cell_size).astype(np.int64),
+                np.floor((y - self.__y0) / self.cell_size).astype(np.int64))
+
+    def __cell_keys(self, x, y):
+        ix, iy = self.__cells(x, y)
+        return ix * self.__ny + iy
+
+    def bounds(self):
+        """
+        Extent of the indexed samples.
+
+        Returns:
+            tuple: west, south, east and north limits [degrees]
+        """
+        if self.df.empty:
+            return None
+        return self.df["lon"].min(), self.df["lat"].min(), self.df["lon"].max(), self.df["lat"].max()
+
+    def query(self, bounds=None):
+        """
+        Finds the samples inside a viewport.
+
+        Args:
+            bounds (tuple): west, south, east and north limits of the viewport [degrees] (None: all samples)
+
+        Returns:
+            np.array: positions of the samples in df, in increasing order
+        """
+        if bounds is None:
+            return np.arange(len(self.x))
+        west, south, east, north = bounds
+        x_min, y_min = to_mercator(west, south)
+        x_max, y_max = to_mercator(east, north)
+
+        # only visit the grid columns overlapping the viewport; each column is a contiguous range of keys
+        ix_min, iy_min = self.__cells(x_min, y_min)
+        ix_max, iy_max = self.__cells(x_max, y_max)
+        ix_min, ix_max = max(ix_min, 0), min(ix_max, self.__nx - 1)
+        iy_min, iy_max = max(iy_min, 0), min(iy_max, self.__ny - 1)
+        if ix_min > ix_max or iy_min > iy_max:
+            return np.empty(0, dtype=np.intp)
+        columns = np.arange(ix_min, ix_max + 1) * self.__ny
+        starts = np.searchsorted(self.__keys, columns + iy_min, side="left")
+        ends = np.searchsorted(self.__keys, columns + iy_max, side="right")
+        candidates = np.concatenate([self.__order[s:e] for s, e in zip(starts, ends)])
+
+        # exact test for the samples of the border cells
+        inside = ((self.x[candidates] >= x_min) & (self.x[candidates] <= x_max)
+                  & (self.y[candidates] >= y_min) & (self.y[candidates] <= y_max))
+        return np.sort(candidates[inside])
+
+    def aggregate(self, positions=None, zoom=11, radius=40):
+        """
+        Groups samples that fall into the same square of radius x radius screen pixels at a given zoom level.
+
+        Args:
+            positions (np.array): positions of the samples to aggregate (e.g., from query)
+            zoom (float): zoom level of the map
+            radius (int): side length of the aggregation squares [pixels]
+
+        Returns:
+            pandas.core.frame.DataFrame: one row per cluster with the columns "lat", "lon" (mean position in
+                degrees) and "count"
+        """
+        positions = np.arange(len(self.x)) if positions is None else np.asarray(positions)
+        size = pixel_size(zoom) * radius
+        n_squares = int(np.ceil(2 * MERCATOR_EXTENT / size)) + 1
+        keys = (np.floor((self.x[positions] + MERCATOR_EXTENT) / size).astype(np.int64) * n_squares
+                + np.floor((self.y[positions] + MERCATOR_EXTENT) / size).astype(np.int64))
+        _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        lat = np.bincount(inverse, weights=self.df["lat"].to_numpy()[positions]) / counts
+        lon = np.bincount(inverse, weights=self.df["lon"].to_numpy()[positions]) / counts
+        return pd.DataFrame({"lat": lat, "lon": lon, "count": counts})
@@ -8,17 +8,68 @@ from sedimentanalyst.app import interac_plotter
 from sedimentanalyst.analyzer.utils import *
 from sedimentanalyst.app.accessories import *
 from sedimentanalyst.app.appconfig import *
+from sedimentanalyst.analyzer.similarity_index import SimilarityIndex
+from sedimentanalyst.analyzer.clustering import add_facies
+from sedimentanalyst.app.spatial_index import SpatialIndex
+from sedimentanalyst.app.sample_index import SampleDataset
+from sedimentanalyst.analyzer.gridding import interpolate_raster
+from sedimentanalyst.analyzer import batch_statistics, hydraulics, columnar
+from sedimentanalyst.analyzer.schema import SummarySchema
+from sedimentanalyst.app.rest_api import register_api
+from sedimentanalyst.app.cache import CACHE_DIR, ResultCache, SQLiteCache, content_key, private_directory
 
 external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 
 # Instantiates object app of the class Dash
 app = dash.Dash(__name__, external_stylesheets=external_stylesheets,
                 suppress_callback_exceptions=True, title='Sediment Analyst')
-# server = app.server  # method to serve the app, allows heroku to recognize the server
+# WSGI server object for serving the app with several worker processes, preloading the examples and references
+# before forking the workers (see gunicorn.conf.py):
+# gunicorn -c sedimentanalyst/app/gunicorn.conf.py sedimentanalyst.app.web_application:server
+server = app.server  # method to serve the app, allows heroku to recognize the server
+# serializes once at start-up: plotly imports its JSON engine lazily, which fails in concurrent server threads
+go.Figure().to_json()
+
+# analysis results shared by all worker processes of the host (see cache.py)
+shared_results = SQLiteCache(namespace="uploads")
+
+# keys of the rows in shared_results of each stored global dataframe, for rebuilding deleted summaries
+summary_sources = SQLiteCache(namespace="summaries")
+
+# JSON analysis API on the Flask server underneath the app (see rest_api.py)
+register_api(app.server, prefix="/api", cache=SQLiteCache(namespace="api"))
 
 # Instantiates to get accessories of the app from the class Accessories (accessories.py)
 acc = Accessories()
 
+# folder of the global dataframes stored as columnar files (the browser only keeps a reference, see store_summary)
+SUMMARY_DIR = os.path.join(CACHE_DIR, "summaries")
+
+# number of stored global dataframes kept in the SUMMARY_DIR (the least recently used ones are deleted)
+SUMMARY_FILES = 256
+
+# seconds a stored global dataframe is kept after its last use, even beyond SUMMARY_FILES
+SUMMARY_MIN_AGE = 24 * 3600
+
+# number of datasets whose indexes are kept in memory by each worker process (the sessions of concurrent users
+# working on different datasets do not evict each other)
+MEMORY_CACHE_SIZE = 8
+
+# sample datasets, similarity and spatial indexes already built, keyed by the content of the stored global dataframe
+datasets = ResultCache(max_size=MEMORY_CACHE_SIZE)
+similarity_indexes = ResultCache(max_size=MEMORY_CACHE_SIZE)
+spatial_indexes = ResultCache(max_size=MEMORY_CACHE_SIZE)
+rasters = ResultCache(max_size=4 * MEMORY_CACHE_SIZE)
+
+# example files of the app (see warm_up)
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "examples")
+
+# folders of reference datasets preloaded at start-up, separated by os.pathsep (overridden by --reference)
+REFERENCE_FOLDERS = [f for f in os.environ.get("SEDIMENTANALYST_REFERENCE", "").split(os.pathsep) if f]
+
+# stored global dataframes of the examples and reference folders, keyed by their files and input parameters
+preloaded = ResultCache(max_size=MEMORY_CACHE_SIZE)
+
 # save two examples of the tutorial to run as example inside the app
 # df_example = pd.read_csv()
 
@@ -75,6 +126,9 @@ app.layout = html.Div(
         html.Div(id='dropdown-sample_id'),
         html.Br(),
 
+        # dropdown with statistic to interpolate over the map
+        html.Div(id='div-raster-drop'),
+
         # map
         html.Div(id='div-map'),
         html.Br(),
@@ -87,6 +141,20 @@ app.layout = html.Div(
         html.Div(id='div-diameters'),
         html.Br(),
 
+        # dropdown with reference sample for the similarity search
+        html.Div(id='div-similar-drop'),
+
+        # curves of the samples most similar to the reference
+        html.Div(id='div-similar'),
+        html.Br(),
+
+        # number of facies and clustering method
+        html.Div(id='div-facies-drop'),
+
+        # samples colored by facies
+        html.Div(id='div-facies'),
+        html.Br(),
+
         # dropdown with type of statistics
         html.Div(id='div-stat-drop'),
 
@@ -118,6 +186,31 @@ def save_inputs(header, gs_clm, cw_clm, n_rows, porosity,
                 sf_porosity, index_lat, index_lon,
                 sample_name_index, sample_date_index,
                 projection, n_clicks):
+    return input_dictionary(header, gs_clm, cw_clm, n_rows, porosity, sf_porosity, index_lat, index_lon,
+                            sample_name_index, sample_date_index, projection)
+
+
+def input_dictionary(header, gs_clm, cw_clm, n_rows, porosity, sf_porosity, index_lat, index_lon,
+                     sample_name_index, sample_date_index, projection):
+    """
+    Builds the dictionary of input parameters necessary to read the files from the values of the input boxes.
+
+    Args:
+        header (int): row of the header of the sieving table
+        gs_clm (int): column of the grain sizes
+        cw_clm (int): column of the class weights
+        n_rows (int): number of sieves
+        porosity (float): index of the porosity as row.column
+        sf_porosity (float): index of the porosity's scale factor as row.column
+        index_lat (float): index of the latitude as row.column
+        index_lon (float): index of the longitude as row.column
+        sample_name_index (float): index of the sample name as row.column
+        sample_date_index (float): index of the sample date as row.column
+        projection (str): projection of the coordinates as epsg
+
+    Returns:
+        dict: input parameters (see get_input)
+    """
     # transform float values into list
     porosity_index = list(map(int, str(porosity).split("."))) if porosity is not None else None
     sf_porosity_index = list(map(int, str(sf_porosity).split("."))) if sf_porosity is not None else None
@@ -148,34 +241,29 @@ def save_inputs(header, gs_clm, cw_clm, n_rows, porosity,
 def parse_and_analyse(list_of_contents, list_of_names, list_of_dates, input_dict_in_layout, click_run,
                       click_run_example,
                       ):
-    df_global = pd.DataFrame()
     children = []
-    list_analyzers = []
 
     if list_of_contents is not None:
+        # compile the input indexes once for all files
+        plan = ExtractionPlan(input_dict_in_layout)
+        list_rows, keys = [], []
 
         # iterating through files and appending reading messages as well as
         # analysis objects (analyzers)
         for c, n, d in zip(list_of_contents, list_of_names, list_of_dates):
-            from_parsing = acc.parse_contents(c, n, d, input_dict_in_layout)
-            list_analyzers.append(from_parsing)
+            key = file_key(base64.b64decode(c.split(',')[1]), input_dict_in_layout)
+            rows = analyse_cached(key, contents=c, filename=n, date=d, input_dict_app=plan)
+            list_rows.append(rows)
+            keys.append(key)
+        data2 = store_rows(list_rows, keys=keys)
 
     elif click_run_example > 0:
-        file_list = glob.glob(str(Path(os.path.abspath(os.getcwd()) + "/examples")) + "/*.xlsx")
-        for file_name_example in file_list:
-            from_parsing = acc.parse_contents(input_dict_app=input_dict_in_layout, file_name_example=file_name_example)
-            list_analyzers.append(from_parsing)
-
-        print(file_list, click_run_example, str(Path(os.path.abspath(os.getcwd()) + "/examples")))
+        # examples analysed at start-up (see warm_up) are served without parsing them again
+        data2 = load_folder(EXAMPLES_DIR, input_dict_in_layout, patterns=("*.xlsx",))
 
-    # append all information from the list of analyzers into a global df
-    for inter_analyzer in list_analyzers:
-        df_global = append_global(obj=inter_analyzer,
-                                  df=df_global)
+    else:
+        data2 = store_rows([])
 
-    df_global = df_global.sort_values(by=['sample name'])
-    # return summary statistics
-    data2 = df_global.to_dict('split')
     children.append(html.Div([
         html.Button('Download Summary Statistics', id='btn_download', style={"background-color": "#4CAF50"}),
         dcc.Download(id='download-dataframe-csv'),
@@ -194,7 +282,7 @@ def parse_and_analyse(list_of_contents, list_of_names, list_of_dates, input_dict
     prevent_initial_call=True,
 )
 def download_summary_stats(data, n_clicks):
-    dataframe_global = pd.DataFrame(data=data['data'], columns=data['columns'])
+    dataframe_global = load_summary(data)
     return dcc.send_data_frame(dataframe_global.to_csv, 'overall_statistics.csv')
 
 
@@ -206,8 +294,7 @@ def download_summary_stats(data, n_clicks):
               # before the inputs (outputs of previous callbacks) are available
               )
 def update_sample_id(n_clicks, data):  # n_clicks is mandatory even if not used
-    df = pd.DataFrame(data=data['data'], columns=data['columns'])
-    samples = df['sample name'].tolist()
+    samples = get_dataset(data).names.tolist()
 
     return html.Div([dcc.Markdown('''##### Filter by sample: '''),
                      dcc.Dropdown(id='sample_id',
@@ -225,17 +312,75 @@ def update_sample_id(n_clicks, data):  # n_clicks is mandatory even if not used
     State('stored-data', 'data'),
     State('store_manual_inputs', 'data'),
     Input('sample_id', 'value'),
+    Input('raster_id', 'value'),
+    Input('raster_method', 'value'),
     prevent_initial_call=True
 )
-def update_map(data, dict_to_get_proj, samples):
-    df = pd.DataFrame(data=data['data'], columns=data['columns'])
-    df = df.sort_values(['sample name'])
-    int_plot = interac_plotter.InteractivePlotter(df)
-    fig = int_plot.create_map(df=df, samples=samples, projection=dict_to_get_proj['projection'])
+def update_map(data, dict_to_get_proj, samples, raster_column, raster_method):
+    index = get_spatial_index(data, dict_to_get_proj['projection'])
+    int_plot = interac_plotter.InteractivePlotter(index.df)
+    fig = int_plot.create_viewport_map(index=index, samples=samples)
+    raster = get_raster(data, dict_to_get_proj['projection'], raster_column, raster_method)
+    if raster is not None:
+        fig = int_plot.add_raster_overlay(fig=fig, raster=raster)
     fig.update_layout(transition_duration=500)
     return dcc.Graph(id='map', figure=fig)
 
 
+# Callback 5b: for redrawing the map with the samples inside the viewport after the user pans or zooms
+@app.callback(
+    Output('map', 'figure'),
+    Input('map', 'relayoutData'),
+    State('stored-data', 'data'),
+    State('store_manual_inputs', 'data'),
+    State('sample_id', 'value'),
+    State('raster_id', 'value'),
+    State('raster_method', 'value'),
+    prevent_initial_call=True
+)
+def update_map_viewport(relayout_data, data, dict_to_get_proj, samples, raster_column, raster_method):
+    view = viewport(relayout_data)
+    if view is None:
+        raise dash.exceptions.PreventUpdate
+    bounds, zoom = view
+    index = get_spatial_index(data, dict_to_get_proj['projection'])
+    int_plot = interac_plotter.InteractivePlotter(index.df)
+    fig = int_plot.create_viewport_map(index=index, bounds=bounds, zoom=zoom, samples=samples)
+    raster = get_raster(data, dict_to_get_proj['projection'], raster_column, raster_method)
+    if raster is not None:
+        fig = int_plot.add_raster_overlay(fig=fig, raster=raster)
+    return fig
+
+
+# Callback 5c: for dropdowns for the user to select a statistic to interpolate over the map
+@app.callback(Output('div-raster-drop', 'children'),
+              Input('btn_run', 'n_clicks'),
+              State('stored-data', 'data'),
+              prevent_initial_call=True,
+              )
+def update_raster_drop(n_clicks, data):
+    statistics = SummarySchema.of(data['columns']).columns('diameters', 'statistics', 'porosity', 'kf')
+
+    return html.Div([dcc.Markdown('''##### Interpolate over the map: '''),
+                     dcc.Dropdown(id='raster_id',
+                                  options=[{'label': x, 'value': x}
+                                           for x in statistics],
+                                  value=None,
+                                  placeholder="no interpolation",
+                                  multi=False,
+                                  style=acc.style_statistic
+                                  ),
+                     dcc.Dropdown(id='raster_method',
+                                  options=[{'label': 'inverse distance weighting', 'value': 'idw'},
+                                           {'label': 'ordinary kriging', 'value': 'kriging'}],
+                                  value='idw',
+                                  clearable=False,
+                                  multi=False,
+                                  style=acc.style_statistic
+                                  )
+                     ])
+
+
 # Callback 6: for dropdown for the user to select the desired statistic
 @app.callback(Output('div-stat-drop', 'children'),
               Input('btn_run', 'n_clicks'),
@@ -243,8 +388,7 @@ def update_map(data, dict_to_get_proj, samples):
               prevent_initial_call=True,
               )
 def update_stat_drop(n_clicks, data):
-    df = pd.DataFrame(data=data['data'], columns=data['columns'])
-    statistics = df.columns[4:27].tolist()
+    statistics = statistic_columns(data['columns'])
 
     return html.Div([dcc.Markdown('''##### Filter by statistic: '''),
                      dcc.Dropdown(id='statistics_id',
@@ -266,16 +410,11 @@ def update_stat_drop(n_clicks, data):
     prevent_initial_call=True
 )
 def update_barchart(data, stat_value, samples):
-    # save into dataframe
-    df = pd.DataFrame(data=data['data'], columns=data['columns'])
-
-    # filter samples given sample name
-    df = df[df['sample name'].isin(samples)]
+    # select the samples with their names and the statistics
+    df = get_dataset(data).select(samples, columns=['sample name'] + statistic_columns(data['columns']))
 
-    # filter samples given statistic
-    df = df.iloc[:, 4:27]
     i_plotter = interac_plotter.InteractivePlotter(df)
-    fig = i_plotter.plot_barchart(param=stat_value, samples=samples)
+    fig = i_plotter.plot_barchart(param=stat_value)
     # fig.update_layout(transition_duration=500)
     return dcc.Graph(id='output-barchart',
                      figure=fig,
@@ -291,14 +430,11 @@ def update_barchart(data, stat_value, samples):
     prevent_initial_call=True
 )
 def update_gsd(data, samples):
-    # save into dataframe
-    df = pd.DataFrame(data=data['data'], columns=data['columns'])
-
-    # filter samples given sample name
-    df = df[df['sample name'].isin(samples)]
+    # select the samples with their metadata and cumulative curves
+    df = get_dataset(data).select(samples, columns=SummarySchema.of(data['columns']).columns('metadata', 'curve'))
 
     i_plotter_2 = interac_plotter.InteractivePlotter(df)
-    fig = i_plotter_2.plot_gsd(samples)
+    fig = i_plotter_2.plot_gsd()
 
     return dcc.Graph(id='gsd',
                      figure=fig,
@@ -314,20 +450,426 @@ def update_gsd(data, samples):
     prevent_initial_call=True
 )
 def update_diameters(data, samples):
-    # save into dataframe
-    df = pd.DataFrame(data=data['data'], columns=data['columns'])
-
-    # filter samples given sample name
-    df = df[df['sample name'].isin(samples)]
+    # select the samples with their metadata and characteristic grain sizes
+    df = get_dataset(data).select(samples,
+                                  columns=SummarySchema.of(data['columns']).columns('metadata', 'diameters'))
 
     i_plotter_2 = interac_plotter.InteractivePlotter(df)
-    fig = i_plotter_2.plot_diameters(samples)
+    fig = i_plotter_2.plot_diameters()
 
     return dcc.Graph(id='diameters',
                      figure=fig,
                      style=acc.style_graph
                      )
 
+def file_key(content, input_dict):
+    """
+    Returns a key identifying the bytes of a file and the input parameters used for reading it, which is the same
+    whether the file is uploaded or read from a folder of the server (e.g., a preloaded reference archive).
+
+    Args:
+        content (bytes): content of the file
+        input_dict (dict): input parameters (see save_inputs)
+
+    Returns:
+        str: md5 hash of the content and parameters
+    """
+    return content_key(hashlib.md5(content).hexdigest(), input_dict)
+
+
+def analyse_cached(key, **kwargs):
+    """
+    Returns the global dataframe rows of one file, parsing and analyzing it only if no worker process did it before
+    with the same content and input parameters.
+
+    Args:
+        key (str): key of the file content and input parameters (see cache.content_key)
+        kwargs: arguments of Accessories.parse_contents
+
+    Returns:
+        pandas.core.frame.DataFrame: rows of the file (see utils.append_global)
+    """
+    return shared_results.get_or_compute(key, lambda: append_global(obj=acc.parse_contents(**kwargs),
+                                                                    df=pd.DataFrame()))
+
+
+def store_rows(list_rows, keys=None):
+    """
+    Appends the rows of all files into the global dataframe, sorted by sample name, and stores it (see
+    store_summary). The keys of the rows are kept in summary_sources, so that the summary can be rebuilt from the
+    shared cache after its file was deleted (see rebuild_summary).
+
+    Args:
+        list_rows (list): rows of each file (see analyse_cached)
+        keys (list): keys of the rows in shared_results (None: the summary cannot be rebuilt)
+
+    Returns:
+        dict: reference to the stored global dataframe
+    """
+    df_global = pd.concat(list_rows, ignore_index=True) if list_rows else pd.DataFrame(columns=['sample name'])
+    data = store_summary(df_global.sort_values(by=['sample name']))
+    if keys is not None:
+        summary_sources.put(data['key'], list(keys))
+    return data
+
+
+def load_folder(folder, input_dict, patterns=("*.xlsx", "*.ods", "*.csv", "*.tsv"), skip_invalid=False):
+    """
+    Analyses all files of a folder on the server (e.g., the examples or a reference archive) and stores their global
+    dataframe. The reference to the stored dataframe is kept in memory until a file of the folder changes, and the
+    rows of each file are kept in the shared cache, thus the folder is analysed only once.
+
+    Args:
+        folder (str): path of the folder (its subfolders are included)
+        input_dict (dict): input parameters (see save_inputs)
+        patterns (tuple): file name patterns to include
+        skip_invalid (bool): if True, files that cannot be analysed are logged and skipped instead of raising
+
+    Returns:
+        dict: reference to the stored global dataframe (see store_summary)
+    """
+    files = find_files(folder=folder, patterns=patterns)
+    stamps = [(f, os.stat(f).st_size, os.stat(f).st_mtime_ns) for f in files]
+    key = content_key(stamps, input_dict)
+    data = preloaded.get(key)
+    if data is not None and os.path.exists(os.path.join(SUMMARY_DIR, data['file'])):
+        return data
+
+    plan = ExtractionPlan(input_dict)
+    list_rows, keys = [], []
+    for f in files:
+        with open(f, "rb") as file:
+            content = file.read()
+        key = file_key(content, input_dict)
+        try:
+            rows = analyse_cached(key, input_dict_app=plan, file_name_example=f)
+            if rows.columns.has_duplicates:
+                raise ValueError("repeated columns (e.g., grain sizes) cannot be appended to the global dataframe")
+            list_rows.append(rows)
+            keys.append(key)
+        except Exception as e:
+            if not skip_invalid:
+                raise
+            logging.warning("Skipped {0}: {1}".format(f, e))
+    data = store_rows(list_rows, keys=keys)
+    preloaded.put(key, data)
+    return data
+
+
+def default_inputs():
+    """
+    Returns the input parameters of the default values of the input boxes (reading the template files).
+
+    Returns:
+        dict: input parameters (see save_inputs)
+    """
+    return input_dictionary(*[box.value for box in acc.input_boxes if isinstance(box, dcc.Input)])
+
+
+def warm_up(reference_folders=(), input_dict=None):
+    """
+    Analyses the examples and the reference archives once at start-up and builds the indexes of their datasets, so
+    that loading the example, and uploading files of a reference archive, do not pay the cost of parsing and
+    analysing them.
+
+    Args:
+        reference_folders (list): folders of reference datasets to preload (e.g., an archive of previous campaigns)
+        input_dict (dict): input parameters for reading the files (None: default values of the input boxes)
+
+    Returns:
+        dict: reference to the stored global dataframe of each folder (see store_summary)
+    """
+    input_dict = default_inputs() if input_dict is None else input_dict
+    preloaded_data = {}
+    for folder in [EXAMPLES_DIR] + list(reference_folders):
+        start = time.perf_counter()
+        patterns = ("*.xlsx",) if folder == EXAMPLES_DIR else ("*.xlsx", "*.ods", "*.csv", "*.tsv")
+        data = load_folder(folder, input_dict, patterns=patterns, skip_invalid=True)
+        get_dataset(data)
+        if data['n_rows']:
+            get_similarity_index(data)
+        preloaded_data[folder] = data
+        logging.info("Preloaded {0} samples of {1} in {2:.2f} s".format(data['n_rows'], folder,
+                                                                      time.perf_counter() - start))
+    return preloaded_data
+
+
+def store_summary(df):
+    """
+    Stores the global dataframe as columnar file (Arrow IPC) in the SUMMARY_DIR, so that the callbacks read it
+    memory-mapped and only for the columns they need instead of rebuilding it from JSON. The least recently used
+    summaries beyond SUMMARY_FILES are deleted, unless they were used within SUMMARY_MIN_AGE seconds.
+
+    Args:
+        df (pandas.core.frame.DataFrame): global dataframe
+
+    Returns:
+        dict: reference to the stored dataframe for the dcc.Store, with the keys "key" (md5 hash of the content),
+            "file" (name of the file), "columns" (column names) and "n_rows"
+    """
+    df = columnar.normalize_summary(df)
+    hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    key = hashlib.md5(hashes.tobytes() + json.dumps(df.columns.tolist()).encode()).hexdigest()
+    private_directory(SUMMARY_DIR)
+    path = columnar.write_summary(df, os.path.join(SUMMARY_DIR, key))
+    columnar.prune_summaries(SUMMARY_DIR, keep=SUMMARY_FILES, min_age=SUMMARY_MIN_AGE)
+    return {'key': key, 'file': os.path.basename(path), 'columns': df.columns.tolist(), 'n_rows': len(df)}
+
+
+def rebuild_summary(data):
+    """
+    Stores a deleted global dataframe again from the rows of its files in the shared cache (see store_rows).
+
+    Args:
+        data (dict): reference to the stored global dataframe (see store_summary)
+
+    Returns:
+        dict: reference to the stored global dataframe (the same file name, as the content is the same)
+
+    Raises:
+        dash.exceptions.PreventUpdate: if the rows are no longer cached (the analysis has to be run again)
+    """
+    keys = summary_sources.get(data['key'])
+    list_rows = None if keys is None else [shared_results.get(key) for key in keys]
+    if list_rows is None or any(rows is None for rows in list_rows):
+        logging.warning("The stored summary {0} was deleted and cannot be rebuilt".format(data['file']))
+        raise dash.exceptions.PreventUpdate("The results of this session expired, please re-run the analysis.")
+    return store_rows(list_rows, keys=keys)
+
+
+def load_summary(data, columns=None):
+    """
+    Reads the stored global dataframe, rebuilding it if it was deleted (see rebuild_summary).
+
+    Args:
+        data (dict): reference to the stored global dataframe (see store_summary)
+        columns (list): columns to read (None: all columns)
+
+    Returns:
+        pandas.core.frame.DataFrame: global dataframe
+    """
+    path = os.path.join(SUMMARY_DIR, os.path.basename(data['file']))
+    try:
+        # mark the summary as recently used (see columnar.prune_summaries)
+        os.utime(path)
+    except FileNotFoundError:
+        path = os.path.join(SUMMARY_DIR, rebuild_summary(data)['file'])
+    return columnar.read_summary(path, columns=columns)
+
+
+def dataset_key(data):
+    """
+    Returns a key identifying the content of the stored global dataframe.
+
+    Args:
+        data (dict): reference to the stored global dataframe (see store_summary)
+
+    Returns:
+        str: md5 hash of the data
+    """
+    return data['key']
+
+
+def get_dataset(data):
+    """
+    Returns the sample dataset of the stored global dataframe, indexing its sample names only once per dataset. Its
+    columns are read from the stored summary when a callback selects them for the first time.
+
+    Args:
+        data (dict): reference to the stored global dataframe (see store_summary)
+
+    Returns:
+        SampleDataset: dataset resolving selections of samples into row positions
+    """
+    key = dataset_key(data)
+    dataset = datasets.get(key)
+    if dataset is None:
+        dataset = SampleDataset(load_summary(data, columns=['sample name']),
+                                loader=functools.partial(load_summary, data))
+        datasets.put(key, dataset)
+    return dataset
+
+
+def get_similarity_index(data):
+    """
+    Returns the similarity index of the stored global dataframe, building it only once per dataset.
+
+    Args:
+        data (dict): reference to the stored global dataframe (see store_summary)
+
+    Returns:
+        SimilarityIndex: index over the resampled cumulative curves of the samples
+    """
+    key = dataset_key(data)
+    index = similarity_indexes.get(key)
+    if index is None:
+        index = SimilarityIndex(load_summary(data))
+        similarity_indexes.put(key, index)
+    return index
+
+
+def get_spatial_index(data, projection):
+    """
+    Returns the spatial index of the stored global dataframe, building it only once per dataset and projection.
+
+    Args:
+        data (dict): reference to the stored global dataframe (see store_summary)
+        projection (str): Name of the projection of the sample coordinates
+
+    Returns:
+        SpatialIndex: index over the sample coordinates
+    """
+    key = (dataset_key(data), projection)
+    index = spatial_indexes.get(key)
+    if index is None:
+        index = SpatialIndex(load_summary(data), projection=projection)
+        spatial_indexes.put(key, index)
+    return index
+
+
+def get_raster(data, projection, column, method):
+    """
+    Returns the raster of a statistic interpolated from the stored global dataframe, interpolating it only once per
+    dataset, projection, statistic and method.
+
+    Args:
+        data (dict): reference to the stored global dataframe (see store_summary)
+        projection (str): Name of the projection of the sample coordinates
+        column (str): statistic to interpolate (None: no raster)
+        method (str): "idw" or "kriging"
+
+    Returns:
+        gridding.Raster: interpolated grid, or None
+    """
+    if not column:
+        return None
+    key = (dataset_key(data), projection, column, method)
+    raster = rasters.get(key)
+    if raster is None:
+        raster = interpolate_raster(df=load_summary(data), column=column, projection=projection, method=method,
+                                    resolution=200)
+        rasters.put(key, raster)
+    return raster
+
+
+def statistic_columns(df):
+    """
+    Lists the statistics of the global dataframe selectable in the bar chart, looked up by column group (see
+    SummarySchema): characteristic grain sizes, the other statistics of the samples and the porosity estimators from
+    the literature.
+
+    Args:
+        df (pandas.core.frame.DataFrame or list): global dataframe or its column names
+
+    Returns:
+        list: column names
+    """
+    porosity = ["{} [Porosity]".format(name) for name in hydraulics.POROSITY_AUTHORS]
+    schema = SummarySchema.of(df)
+    return schema.columns('diameters', 'statistics') + [c for c in schema.columns('porosity') if c in porosity]
+
+
+def viewport(relayout_data):
+    """
+    Extracts the viewport of the map from the relayout data of the mapbox figure.
+
+    Args:
+        relayout_data (dict): relayoutData property of the map graph
+
+    Returns:
+        tuple: bounds (west, south, east, north) [degrees] and zoom level, or None if the map was not moved
+    """
+    if not relayout_data or 'mapbox._derived' not in relayout_data:
+        return None
+    lons, lats = zip(*relayout_data['mapbox._derived']['coordinates'])
+    return (min(lons), min(lats), max(lons), max(lats)), relayout_data.get('mapbox.zoom', 11)
+
+
+# Callback 10: for dropdown for the user to select the reference sample of the similarity search
+@app.callback(Output('div-similar-drop', 'children'),
+              Input('btn_run', 'n_clicks'),
+              State('stored-data', 'data'),
+              prevent_initial_call=True,
+              )
+def update_similar_drop(n_clicks, data):
+    samples = get_similarity_index(data).names.tolist()
+
+    return html.Div([dcc.Markdown('''##### Similar samples to: '''),
+                     dcc.Dropdown(id='similar_id',
+                                  options=[{'label': x, 'value': x}
+                                           for x in dict.fromkeys(samples)],
+                                  value=samples[0] if samples else None,
+                                  multi=False,
+                                  style=acc.style_statistic
+                                  ),
+                     dcc.Input(id='similar_k', type='number', min=1, step=1, value=5,
+                               placeholder="number of similar samples")
+                     ])
+
+
+# Callback 11: for plotting the samples most similar to the reference sample
+@app.callback(
+    Output('div-similar', 'children'),
+    State('stored-data', 'data'),
+    Input('similar_id', 'value'),
+    Input('similar_k', 'value'),
+    prevent_initial_call=True
+)
+def update_similar(data, reference, k):
+    if reference is None:
+        raise dash.exceptions.PreventUpdate
+    index = get_similarity_index(data)
+    i_plotter = interac_plotter.InteractivePlotter(None)
+    fig = i_plotter.plot_similar(index=index, reference=reference, k=k or 5)
+
+    return dcc.Graph(id='similar',
+                     figure=fig,
+                     style=acc.style_graph
+                     )
+
+
+# Callback 12: for the user to select the number of facies and the clustering method
+@app.callback(Output('div-facies-drop', 'children'),
+              Input('btn_run', 'n_clicks'),
+              State('stored-data', 'data'),
+              prevent_initial_call=True,
+              )
+def update_facies_drop(n_clicks, data):
+    return html.Div([dcc.Markdown('''##### Classify into facies: '''),
+                     dcc.Input(id='n_facies', type='number', min=1, step=1, value=3,
+                               placeholder="number of facies"),
+                     dcc.Dropdown(id='facies_method',
+                                  options=[{'label': 'k-means', 'value': 'kmeans'},
+                                           {'label': 'hierarchical', 'value': 'hierarchical'}],
+                                  value='kmeans',
+                                  multi=False,
+                                  style=acc.style_statistic
+                                  )
+                     ])
+
+
+# Callback 13: for plotting the samples colored by their facies
+@app.callback(
+    Output('div-facies', 'children'),
+    State('stored-data', 'data'),
+    Input('n_facies', 'value'),
+    Input('facies_method', 'value'),
+    prevent_initial_call=True
+)
+def update_facies(data, n_facies, method):
+    if not n_facies:
+        raise dash.exceptions.PreventUpdate
+    df = load_summary(data)
+    df = add_facies(df=df, n_facies=int(n_facies), method=method, seed=0)
+    i_plotter = interac_plotter.InteractivePlotter(df)
+    fig = i_plotter.plot_facies()
+
+    return dcc.Graph(id='facies',
+                     figure=fig,
+                     style=acc.style_graph
+                     )
+
+
 # way to fire a button with other
 # @app.callback(Output('btn_run','n_clicks'),
 #               Input('stored-data', 'data'),
@@ -338,4 +880,21 @@ def update_diameters(data, samples):
 #     raise dash.exceptions.PreventUpdate
 
 if __name__ == '__main__':
-    app.run_server(debug=False)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the Sediment Analyst web application.")
+    parser.add_argument("--host", default="127.0.0.1", help="host address of the server")
+    parser.add_argument("--port", type=int, default=8050, help="port of the server")
+    parser.add_argument("--reference", nargs="*", default=REFERENCE_FOLDERS,
+                        help="folders of reference datasets to preload at start-up")
+    parser.add_argument("--no-warm-up", action="store_true", help="do not preload the examples and references")
+    args = parser.parse_args()
+
+    # analyse the examples and references before serving (gunicorn.conf.py does the same for gunicorn)
+    if not args.no_warm_up:
+        logging.basicConfig(level=logging.INFO)
+        warm_up(reference_folders=args.reference)
+
+    # multi-threaded development server; for several worker processes, serve the WSGI object server (see above)
+    # with gunicorn or similar (the development server would fork a new process without caches for every request)
+    app.run_server(debug=False, host=args.host, port=args.port, threaded=True)
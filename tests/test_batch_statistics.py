@@ -0,0 +1,48 @@
+""" Tests of the batched statistics, porosity and kf against the StatisticalAnalyzer of single samples
+
+Author: Beatriz Negreiros
+
+"""
+import glob
+import os
+
+import numpy as np
+import pytest
+
+from sedimentanalyst.analyzer import batch_statistics
+from sedimentanalyst.analyzer.config import get_input
+from sedimentanalyst.analyzer.parsing import ExtractionPlan
+from sedimentanalyst.analyzer.statistical_analyzer import StatisticalAnalyzer
+
+# example files of the app (template layout, as read with the default inputs)
+EXAMPLE_FILES = sorted(glob.glob(os.path.join(os.path.dirname(__file__), os.pardir, "sedimentanalyst", "app",
+                                              "examples", "*.xlsx")))
+
+
+@pytest.mark.parametrize("file", EXAMPLE_FILES, ids=os.path.basename)
+def test_batch_matches_statistical_analyzer(file):
+    sieving_df, metadata = ExtractionPlan(get_input()).extract(file)
+    analyzer = StatisticalAnalyzer(sieving_df=sieving_df, metadata=metadata)
+
+    grain_sizes = sieving_df["Grain Sizes [mm]"].to_numpy(dtype=float)
+    weights = sieving_df["Fraction Mass [g]"].to_numpy(dtype=float)[np.newaxis, :]
+    user_porosity = metadata[3] if isinstance(metadata[3], (int, float)) else np.nan
+    statistics = batch_statistics.compute_statistics(grain_sizes=grain_sizes, weights=weights)
+    conductivity = batch_statistics.compute_porosity_conductivity(grain_sizes=grain_sizes, statistics=statistics,
+                                                                  user_porosity=np.array([user_porosity]),
+                                                                  sf=metadata[4])
+
+    for name, value in zip(analyzer.statistics_df["Name"], analyzer.statistics_df["Value"]):
+        np.testing.assert_allclose(statistics[name][0], value, rtol=1e-9, equal_nan=True, err_msg=name)
+    np.testing.assert_allclose(statistics["cumulative"][0], analyzer.cumulative_df["Cumulative Percentage [%]"],
+                               rtol=1e-9)
+    for name, porosity, kf in analyzer.porosity_conductivity_df[["Name", "Porosity",
+                                                                 "Corresponding kf [m/s]"]].itertuples(index=False):
+        np.testing.assert_allclose(conductivity["{} [Porosity]".format(name)][0], porosity, rtol=1e-9,
+                                   equal_nan=True, err_msg=name)
+        np.testing.assert_allclose(conductivity["{} [Estimated kf]".format(name)][0], kf, rtol=1e-9,
+                                   equal_nan=True, err_msg=name)
+
+
+def test_examples_are_found():
+    assert len(EXAMPLE_FILES) == 2
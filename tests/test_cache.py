@@ -0,0 +1,42 @@
+""" Tests of the caches of the web application
+
+Author: Beatriz Negreiros
+
+"""
+import os
+import stat
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sedimentanalyst.app.cache import SQLiteCache, private_directory
+
+
+def test_shared_cache_round_trip(tmp_path):
+    cache = SQLiteCache(tmp_path / "cache" / "cache.sqlite", namespace="test")
+    rows = pd.DataFrame({"sample name": ["A"], "date": ["2020-03-01"], "d50": [2.5], 31.5: [99.0]})
+    cache.put("rows", rows)
+    cache.put("entry", {"id": "a", "statistics": {"d50": 2.5, "d90": None}})
+
+    pd.testing.assert_frame_equal(cache.get("rows"), rows)
+    assert cache.get("entry") == {"id": "a", "statistics": {"d50": 2.5, "d90": None}}
+    assert cache.get("missing") is None
+    assert stat.S_IMODE(os.stat(tmp_path / "cache").st_mode) == 0o700
+
+
+def test_shared_cache_stores_only_data(tmp_path):
+    cache = SQLiteCache(tmp_path / "cache" / "cache.sqlite")
+    with pytest.raises(TypeError):
+        cache.put("object", np.random.default_rng(0))
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="permissions of POSIX systems")
+def test_directories_writable_by_others_are_rejected(tmp_path):
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    os.chmod(shared, 0o777)
+    with pytest.raises(PermissionError):
+        private_directory(shared)
+    with pytest.raises(PermissionError):
+        SQLiteCache(shared / "cache.sqlite")
@@ -0,0 +1,43 @@
+""" Tests of the columnar storage of the global summary
+
+Author: Beatriz Negreiros
+
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from sedimentanalyst.analyzer import columnar
+
+
+def make_summary():
+    return pd.DataFrame({"sample name": ["A", "B"], "date": ["2020-03-01", None], "d50": [1.5, 2.5],
+                         31.5: [100.0, 98.0], 0.063: [1.0, np.nan]})
+
+
+def test_summary_round_trip(tmp_path):
+    df = make_summary()
+    for file_format in columnar.FORMATS:
+        path = columnar.write_summary(df, tmp_path / "summary", file_format=file_format)
+        pd.testing.assert_frame_equal(columnar.read_summary(path), columnar.normalize_summary(df))
+        selected = columnar.read_summary(path, columns=["sample name", 31.5])
+        assert selected.columns.tolist() == ["sample name", 31.5]
+
+
+def test_prune_keeps_the_most_recent_summaries(tmp_path):
+    paths = [columnar.write_summary(make_summary(), tmp_path / str(k)) for k in range(5)]
+    for k, path in enumerate(paths):
+        os.utime(path, ns=(k * 10 ** 9, k * 10 ** 9))
+
+    assert columnar.prune_summaries(tmp_path, keep=2) == 3
+    assert sorted(os.listdir(tmp_path)) == ["3.arrow", "4.arrow"]
+
+
+def test_prune_keeps_recently_used_summaries(tmp_path):
+    paths = [columnar.write_summary(make_summary(), tmp_path / str(k)) for k in range(3)]
+    os.utime(paths[0], ns=(0, 0))
+
+    # only the summary unused for more than an hour is deleted
+    assert columnar.prune_summaries(tmp_path, keep=0, min_age=3600) == 1
+    assert sorted(os.listdir(tmp_path)) == ["1.arrow", "2.arrow"]
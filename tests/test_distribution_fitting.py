@@ -0,0 +1,63 @@
+""" Tests of the batched fitting of parametric grain size distributions
+
+Author: Beatriz Negreiros
+
+"""
+import glob
+import os
+
+import numpy as np
+import pytest
+from scipy.optimize import curve_fit
+from scipy.special import ndtr
+
+from sedimentanalyst.analyzer.config import get_input
+from sedimentanalyst.analyzer.distribution_fitting import MODELS, fit_curves
+from sedimentanalyst.analyzer.parsing import ExtractionPlan
+from sedimentanalyst.analyzer.statistical_analyzer import StatisticalAnalyzer
+
+# example files of the app (template layout, as read with the default inputs)
+EXAMPLE_FILES = sorted(glob.glob(os.path.join(os.path.dirname(__file__), os.pardir, "sedimentanalyst", "app",
+                                              "examples", "*.xlsx")))
+
+# physical models of the scalar reference fits, F(d) with d in mm
+REFERENCE_MODELS = {"lognormal": lambda d, dg, sigma: ndtr(np.log(d / dg) / sigma),
+                    "rosin-rammler": lambda d, d63, n: 1 - np.exp(-(d / d63) ** n)}
+
+
+def example_curves():
+    curves = []
+    for file in EXAMPLE_FILES:
+        sieving_df, metadata = ExtractionPlan(get_input()).extract(file)
+        analyzer = StatisticalAnalyzer(sieving_df=sieving_df, metadata=metadata)
+        curves.append((analyzer.cumulative_df["Grain Sizes [mm]"].to_numpy(dtype=float),
+                       analyzer.cumulative_df["Cumulative Percentage [%]"].to_numpy(dtype=float)))
+    return curves
+
+
+@pytest.mark.parametrize("name", sorted(REFERENCE_MODELS))
+def test_fit_matches_scipy_curve_fit(name):
+    for grain_sizes, cumulative in example_curves():
+        result = fit_curves(grain_sizes=grain_sizes, cumulative=cumulative[np.newaxis, :], models=[name])[name]
+        valid = grain_sizes > 0
+        d, y = grain_sizes[valid], cumulative[valid] / 100
+        reference, _ = curve_fit(REFERENCE_MODELS[name], d, y, p0=result["parameters"][0] * 1.2, maxfev=10000)
+
+        np.testing.assert_allclose(result["parameters"][0], reference, rtol=1e-3)
+        reference_rmse = 100 * np.sqrt(np.mean((REFERENCE_MODELS[name](d, *reference) - y) ** 2))
+        assert result["rmse"][0] <= reference_rmse * (1 + 1e-6)
+        assert not result["at_bound"][0]
+
+
+def test_fits_on_parameter_limits_are_not_reported():
+    # a unimodal curve fitted from a bimodal start without weight on the coarse mode, which stays on the limit
+    grain_sizes = np.array([63.0, 31.5, 16.0, 8.0, 4.0, 2.0, 1.0, 0.5, 0.25, 0.125, 0.063])
+    cumulative = 100 * ndtr(np.log(grain_sizes / 4.0) / 1.0)
+    bimodal = MODELS["bimodal"]
+    theta = np.array([[np.log(4.0), 0.0, np.log(30.0), np.log(0.5), bimodal.bounds[0][4]]])
+    result = fit_curves(grain_sizes=grain_sizes, cumulative=cumulative[np.newaxis, :], models=["bimodal"],
+                        initial={"bimodal": theta})["bimodal"]
+
+    assert result["at_bound"][0]
+    assert np.isnan(result["parameters"][0]).all()
+    assert np.isnan(result["r2"][0]) and np.isnan(result["rmse"][0])
@@ -0,0 +1,106 @@
+""" Tests of the ingestion service on a temporary drop folder
+
+Author: Beatriz Negreiros
+
+"""
+import asyncio
+import glob
+import os
+import shutil
+
+import pandas as pd
+
+from sedimentanalyst.analyzer import ingestion
+from sedimentanalyst.analyzer.config import get_input
+
+# example files of the app (template layout, as read with the default inputs)
+EXAMPLE_FILES = sorted(glob.glob(os.path.join(os.path.dirname(__file__), os.pardir, "sedimentanalyst", "app",
+                                              "examples", "*.xlsx")))
+
+
+def make_service(tmp_path):
+    folder = tmp_path / "drop"
+    folder.mkdir(exist_ok=True)
+    return folder, ingestion.IngestionService(folder=folder, store_path=tmp_path / "store.jsonl", dic=get_input(),
+                                              poll_interval=0.02, settle_time=0.05, n_workers=2,
+                                              use_processes=False)
+
+
+def test_service_ingests_dropped_files(tmp_path):
+    folder, service = make_service(tmp_path)
+    for file in EXAMPLE_FILES:
+        shutil.copy(file, folder)
+    metrics = asyncio.run(service.run(duration=1.0))
+
+    df = service.store.load()
+    assert metrics["files ingested"] == len(EXAMPLE_FILES)
+    assert len(df) == len(EXAMPLE_FILES)
+
+    # a restarted service resumes from its state and does not analyze the files again
+    _, restarted = make_service(tmp_path)
+    assert asyncio.run(restarted.run(duration=0.5))["files ingested"] == 0
+
+
+def test_store_tombstone_replaces_previous_rows(tmp_path):
+    store = ingestion.SummaryStore(tmp_path / "store.jsonl")
+    store.append(df=pd.DataFrame({"sample name": ["A", "B"], "d50": [1.0, 2.0]}), file="a.xlsx")
+    store.append(df=pd.DataFrame({"sample name": ["C"], "d50": [3.0]}), file="c.xlsx")
+    assert len(store.load()) == 3
+
+    # all samples of a.xlsx are quarantined after it was dropped again
+    assert store.append(df=pd.DataFrame(), file="a.xlsx") == 0
+    assert store.load()["sample name"].tolist() == ["C"]
+
+
+def test_failed_files_are_not_retried_until_changed(tmp_path, monkeypatch):
+    calls = []
+
+    def failing(path, dic):
+        calls.append(path)
+        raise RuntimeError("analysis failed")
+
+    monkeypatch.setattr(ingestion, "analyze_file", failing)
+    folder, service = make_service(tmp_path)
+    shutil.copy(EXAMPLE_FILES[0], folder / "sample.xlsx")
+    metrics = asyncio.run(service.run(duration=0.6))
+    assert len(calls) == 1
+    assert metrics["failures"] == 1
+
+    # a new version of the file is analyzed again
+    with open(folder / "sample.xlsx", "ab") as f:
+        f.write(b"\0")
+    asyncio.run(service.run(duration=0.6))
+    assert len(calls) == 2
+
+
+def test_deleted_files_are_removed_from_the_store(tmp_path):
+    folder, service = make_service(tmp_path)
+    for file in EXAMPLE_FILES:
+        shutil.copy(file, folder)
+    asyncio.run(service.run(duration=0.6))
+    assert len(service.store.load()) == len(EXAMPLE_FILES)
+
+    os.remove(folder / os.path.basename(EXAMPLE_FILES[0]))
+    asyncio.run(service.run(duration=0.3))
+    assert service.store.load()["sample name"].tolist() == ["sample_two"]
+
+    # the file is ingested again when it is dropped again
+    shutil.copy(EXAMPLE_FILES[0], folder)
+    assert asyncio.run(service.run(duration=0.6))["files ingested"] == len(EXAMPLE_FILES) + 1
+    assert len(service.store.load()) == len(EXAMPLE_FILES)
+
+
+def test_storage_errors_do_not_stop_the_workers(tmp_path, monkeypatch):
+    folder, service = make_service(tmp_path)
+
+    def failing(df=None, file=None, samples=None):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(service.store, "append", failing)
+    for file in EXAMPLE_FILES:
+        shutil.copy(file, folder)
+    # more files than workers: the run ends although every storage fails
+    shutil.copy(EXAMPLE_FILES[0], folder / "copy.xlsx")
+    metrics = asyncio.run(asyncio.wait_for(service.run(duration=0.6), timeout=10))
+    assert metrics["failures"] == len(EXAMPLE_FILES) + 1
+    assert metrics["files ingested"] == 0
@@ -0,0 +1,54 @@
+""" Tests of the combination of layer samples into mixtures
+
+Author: Beatriz Negreiros
+
+"""
+import numpy as np
+import pandas as pd
+
+from sedimentanalyst.analyzer.mixtures import combine_samples, group_codes
+from sedimentanalyst.analyzer.statistical_analyzer import StatisticalAnalyzer
+
+# sieve diameters [mm] of the synthetic samples, from the largest to the smallest sieve
+GRAIN_SIZES = [63.0, 31.5, 16.0, 8.0, 4.0, 2.0, 1.0, 0.5, 0.25, 0.125, 0.063]
+
+
+def make_analyzer(name=None, weights=None):
+    sieving_df = pd.DataFrame({"Grain Sizes [mm]": GRAIN_SIZES, "Fraction Mass [g]": weights})
+    return StatisticalAnalyzer(sieving_df=sieving_df, metadata=[name, "2020-03-01", (48.0, 11.0), np.nan, 6.1])
+
+
+def test_layers_of_different_campaigns_are_never_combined():
+    names = ["MS3 SP1 OS", "MS3 SP1 US", "MS3 SP1 OS", "MS3 SP1 US", "MS3_FC1-1"]
+    campaigns = ["post-flush", "pre-flush", "pre-flush", "post-flush", None]
+    keys, codes = group_codes(names, campaigns=campaigns)
+
+    assert len(keys) == 3
+    for k in range(len(keys)):
+        members = np.flatnonzero(codes == k)
+        assert len({campaigns[m] for m in members}) == 1
+        assert keys[k][0] == campaigns[members[0]]
+    assert codes[0] == codes[3] and codes[1] == codes[2] and codes[0] != codes[1]
+
+
+def test_repeated_layers_are_kept_in_separate_mixtures():
+    names = ["MS2_FC1", "MS2_FC1", "MS3_FC2-1", "MS3_FC2-2", "MS3_FC2-2"]
+    keys, codes = group_codes(names, campaigns=["post-flush"] * len(names))
+
+    assert codes[0] != codes[1]
+    assert codes[2] == codes[3] and codes[3] != codes[4]
+    assert keys == [("post-flush", "MS2_FC1", 0), ("post-flush", "MS2_FC1", 1), ("post-flush", "MS3_FC2", 0),
+                    ("post-flush", "MS3_FC2", 1)]
+
+
+def test_combine_samples_sums_the_layers_of_each_campaign():
+    upper = [0, 10, 20, 30, 20, 10, 5, 3, 1, 1, 0]
+    lower = [0, 0, 5, 10, 20, 30, 20, 10, 3, 1, 1]
+    analyzers = [make_analyzer("MS1 SP1 OS", upper), make_analyzer("MS1 SP1 US", lower),
+                 make_analyzer("MS1 SP1 OS", lower), make_analyzer("MS1 SP1 US", upper)]
+    df = combine_samples(analyzers=analyzers, campaigns=["pre-flush", "pre-flush", "post-flush", "post-flush"])
+
+    assert df["campaign"].tolist() == ["post-flush", "pre-flush"]
+    assert df["sample name"].tolist() == ["MS1 SP1", "MS1 SP1"]
+    assert df["n samples"].tolist() == [2, 2]
+    np.testing.assert_allclose(df["total mass [g]"], [sum(upper) + sum(lower)] * 2)
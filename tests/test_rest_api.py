@@ -0,0 +1,70 @@
+""" Tests of the JSON analysis API
+
+Author: Beatriz Negreiros
+
+"""
+import pyarrow as pa
+import pytest
+from flask import Flask
+
+from sedimentanalyst.app.rest_api import register_api
+
+# sieve diameters [mm] and class weights [g] of a valid sample
+SAMPLE = {"grain_sizes": [63.0, 31.5, 16.0, 8.0, 4.0, 2.0, 1.0, 0.5, 0.25, 0.125, 0.063],
+          "weights": [0.0, 10.0, 20.0, 30.0, 20.0, 10.0, 5.0, 3.0, 1.0, 1.0, 0.0]}
+
+
+@pytest.fixture
+def client():
+    server = Flask(__name__)
+    register_api(server, prefix="/api")
+    return server.test_client()
+
+
+def test_analyze_sample(client):
+    response = client.post("/api/analyze", json=dict(SAMPLE, id="a"))
+    assert response.status_code == 200
+    assert response.get_json()["results"][0]["id"] == "a"
+
+
+@pytest.mark.parametrize("fields", [{"porosity": "abc"}, {"sf": [1]}, {"porosity": {"value": 0.3}},
+                                    {"grain_sizes": [], "weights": []}, {"grain_sizes": [2.0], "weights": [1.0]},
+                                    {"weights": SAMPLE["weights"][:-1] + ["inf"]}],
+                         ids=["porosity-text", "sf-list", "porosity-object", "empty", "one-sieve", "inf-weight"])
+def test_invalid_porosity_or_sf_is_a_sample_error(client, fields):
+    response = client.post("/api/analyze", json={"samples": [dict(SAMPLE, id="valid"),
+                                                             dict(SAMPLE, id="invalid", **fields)]})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [result["id"] for result in body["results"]] == ["valid"]
+    assert [error["id"] for error in body["errors"]] == ["invalid"]
+
+
+@pytest.mark.parametrize("samples", [5, "abc", {"grain_sizes": [1.0]}])
+def test_samples_must_be_a_list(client, samples):
+    response = client.post("/api/analyze", json={"samples": samples})
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_empty_sample_is_a_sample_error(client):
+    response = client.post("/api/analyze", json={"grain_sizes": [], "weights": []})
+    assert response.status_code == 200
+    assert response.get_json()["results"] == [] and len(response.get_json()["errors"]) == 1
+
+
+def test_warnings_are_returned(client):
+    response = client.post("/api/analyze", json={"samples": [
+        dict(SAMPLE, id="valid"), {"id": "two sieves", "grain_sizes": [2.0, 1.0], "weights": [1.0, 1.0]}]})
+    assert response.status_code == 200
+    warnings = {result["id"]: result["warnings"] for result in response.get_json()["results"]}
+    assert warnings == {"valid": [], "two sieves": ["few-sieves", "incomplete-curve"]}
+    # the warnings are kept with the stored result
+    assert client.get("/api/results/two sieves").get_json()["warnings"] == ["few-sieves", "incomplete-curve"]
+
+
+def test_warnings_in_arrow_response(client):
+    response = client.post("/api/analyze?format=arrow",
+                           json={"grain_sizes": [2.0, 1.0], "weights": [1.0, 1.0], "id": "two sieves"})
+    table = pa.ipc.open_stream(response.data).read_all()
+    assert table.column("warnings").to_pylist() == ["few-sieves, incomplete-curve"]
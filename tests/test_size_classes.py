@@ -0,0 +1,49 @@
+""" Tests of the grain size class percentages and of the class boxes of the static plots
+
+Author: Beatriz Negreiros
+
+"""
+import glob
+import os
+
+import matplotlib
+import numpy as np
+
+from sedimentanalyst.analyzer import size_classes
+from sedimentanalyst.analyzer.config import get_input
+from sedimentanalyst.analyzer.parsing import ExtractionPlan
+from sedimentanalyst.analyzer.static_plotter import StaticPlotter
+from sedimentanalyst.analyzer.statistical_analyzer import StatisticalAnalyzer
+
+# example files of the app (template layout, as read with the default inputs)
+EXAMPLE_FILES = sorted(glob.glob(os.path.join(os.path.dirname(__file__), os.pardir, "sedimentanalyst", "app",
+                                              "examples", "*.xlsx")))
+
+
+def test_classes_outside_of_the_sieves_are_nan():
+    grain_sizes = np.array([20.0, 6.3, 2.0, 0.63, 0.2, 0.063])
+    percentages = size_classes.class_percentages(grain_sizes=grain_sizes,
+                                                 cumulative=[[100.0, 80.0, 50.0, 30.0, 10.0, 4.76]])[0]
+    names = [name for name, _, _, _ in size_classes.ISO_CLASSES]
+    # the 4.76 % finer than 0.063 mm cannot be split into clay and silt
+    assert np.isnan(percentages[names.index("Clay")]) and np.isnan(percentages[names.index("Silt")])
+    np.testing.assert_allclose(percentages[names.index("Fine sand"):], [5.24, 20, 20, 30, 20, 0, 0, 0])
+
+
+def test_empty_classes_outside_of_the_sieves():
+    grain_sizes = np.array([20.0, 6.3, 2.0, 0.63, 0.2, 0.063])
+    percentages = size_classes.class_percentages(grain_sizes=grain_sizes,
+                                                 cumulative=[[90.0, 80.0, 50.0, 30.0, 10.0, 0.0]])[0]
+    np.testing.assert_allclose(percentages[:7], [0, 0, 10, 20, 20, 30, 10])
+    # 10 % coarser than the largest sieve
+    assert np.isnan(percentages[7:]).all()
+
+
+def test_static_plot_boxes_follow_the_scale(tmp_path):
+    matplotlib.use("Agg")
+    sieving_df, metadata = ExtractionPlan(get_input()).extract(EXAMPLE_FILES[0])
+    analyzer = StatisticalAnalyzer(sieving_df=sieving_df, metadata=metadata, scale="wentworth")
+    plotter = StaticPlotter(analyzer, scale="wentworth")
+    assert plotter.classes == size_classes.WENTWORTH_CLASSES
+    plotter.cum_plotter(str(tmp_path / "curve.png"))
+    assert (tmp_path / "curve.png").exists()
@@ -0,0 +1,70 @@
+""" Tests of the batched transport calculators against scalar implementations of the formulas
+
+Author: Beatriz Negreiros
+
+"""
+import math
+
+import numpy as np
+
+from sedimentanalyst.analyzer import transport
+
+# sieve diameters [mm] of the synthetic samples, from the largest to the smallest sieve
+GRAIN_SIZES = np.array([250, 125, 63, 31.5, 16, 8, 4, 2, 1, 0.5, 0.25, 0.125, 0.063, 0.031, 0.0039, 0.00006])
+
+
+def wilcock_crowe_reference(tau, grain_sizes, fractions, rho_s=transport.RHO_SEDIMENT, rho_w=transport.RHO_WATER):
+    """
+    Wilcock and Crowe (2003) for one sample and one shear stress, written class by class as in the paper.
+
+    """
+    total = sum(fractions)
+    fractions = [f / total for f in fractions]
+    s = rho_s / rho_w
+    sizes, upper_sizes = [], []
+    for k, d in enumerate(grain_sizes):
+        upper = grain_sizes[k - 1] if k > 0 else d
+        sizes.append(math.sqrt(d * upper))
+        upper_sizes.append(upper)
+
+    sand = sum(f for f, upper in zip(fractions, upper_sizes) if upper <= transport.SAND_LIMIT)
+    d_sm = math.exp(sum(f * math.log(d) for f, d in zip(fractions, sizes) if d > 0))
+    tau_rm = (0.021 + 0.015 * math.exp(-20 * sand)) * (rho_s - rho_w) * transport.GRAVITY * d_sm / 1000
+
+    rate = 0.0
+    for f, d in zip(fractions, sizes):
+        if f <= 0 or d <= 0:
+            continue
+        b = 0.67 / (1 + math.exp(1.5 - d / d_sm))
+        phi = tau / (tau_rm * (d / d_sm) ** b)
+        w_star = 0.002 * phi ** 7.5 if phi < 1.35 else 14 * (1 - 0.894 / phi ** 0.5) ** 4.5
+        rate += w_star * f
+    return rate * (tau / rho_w) ** 1.5 / ((s - 1) * transport.GRAVITY)
+
+
+def test_wilcock_crowe_matches_scalar_reference():
+    rng = np.random.default_rng(0)
+    fractions = rng.dirichlet(np.ones(GRAIN_SIZES.size), size=40)
+    # samples without boulders, without fines, and a single class, so that the chunks skip different classes
+    fractions[:10, :3] = 0
+    fractions[10:20, -5:] = 0
+    fractions[20] = np.eye(GRAIN_SIZES.size)[6]
+    tau = np.array([0.5, 2.0, 10.0, 35.0, 120.0])
+
+    # a small chunk size evaluates the samples in several chunks
+    rates = transport.wilcock_crowe(tau=tau, grain_sizes=GRAIN_SIZES, fractions=fractions, chunk_size=200)
+    reference = np.array([[wilcock_crowe_reference(t, GRAIN_SIZES, f) for t in tau] for f in fractions])
+
+    np.testing.assert_allclose(rates, reference, rtol=1e-12, atol=0)
+
+
+def test_meyer_peter_mueller_matches_scalar_reference():
+    d50 = np.array([0.5, 4.0, 32.0])
+    tau = np.array([1.0, 10.0, 50.0])
+    rates = transport.meyer_peter_mueller(tau=tau, d=d50)
+    s = transport.RHO_SEDIMENT / transport.RHO_WATER
+    for i, d in enumerate(d50):
+        for j, t in enumerate(tau):
+            theta = t / ((transport.RHO_SEDIMENT - transport.RHO_WATER) * transport.GRAVITY * d / 1000)
+            expected = 8.0 * max(theta - 0.047, 0) ** 1.5 * math.sqrt((s - 1) * transport.GRAVITY * (d / 1000) ** 3)
+            assert math.isclose(rates[i, j], expected, rel_tol=1e-12, abs_tol=0)
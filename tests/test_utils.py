@@ -0,0 +1,19 @@
+""" Tests of the helper functions of the analyzer.
+
+Author: Beatriz Negreiros
+
+"""
+import os
+
+from sedimentanalyst.analyzer.utils import output_name
+
+
+def test_output_name_keeps_subfolders_apart():
+    folder = os.path.join("datasets", "FC")
+    names = [output_name(os.path.join(folder, sub, "x.xlsx"), folder=folder) for sub in ("vorspü", "nachspü")]
+    assert names == ["vorspü_x", "nachspü_x"]
+
+
+def test_output_name_outside_folder():
+    assert output_name(os.path.join("other", "KB08 FC 2.xlsx"), folder="datasets") == "KB08_FC_2"
+    assert output_name(os.path.join("datasets", "x.csv")) == "x"
@@ -0,0 +1,95 @@
+""" Tests of the quality assurance of sieving data: one case per issue code of validation.ISSUES
+
+Author: Beatriz Negreiros
+
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from sedimentanalyst.analyzer import validation
+from sedimentanalyst.analyzer.config import get_input
+from sedimentanalyst.analyzer.utils import compile_plan
+
+# valid sieving table (grain sizes [mm] and class weights [g] from the largest to the smallest sieve)
+SIZES = [63.0, 20.0, 6.3, 2.0, 0.63, 0.2, 0.063]
+WEIGHTS = [0.0, 50.0, 40.0, 30.0, 20.0, 10.0, 5.0]
+
+# sieving tables with exactly one issue of validation.TABLE_CHECKS
+TABLES = {"missing-values": (SIZES, WEIGHTS[:-1] + [np.nan]),
+          "non-positive-size": (SIZES[:-1] + [0.0], WEIGHTS),
+          "unsorted-sieves": ([20.0, 63.0] + SIZES[2:], WEIGHTS),
+          "negative-weights": (SIZES, WEIGHTS[:-1] + [-1.0]),
+          "zero-mass": (SIZES, [0.0] * len(SIZES)),
+          "few-sieves": (SIZES, [0.0] * 5 + [10.0, 1.0]),
+          "incomplete-curve": (SIZES, WEIGHTS[:-1] + [100.0]),
+          }
+
+
+def issues_of(grain_sizes=None, weights=None):
+    return validation.check_tables(grain_sizes, weights, min_percentile=10).iloc[0]
+
+
+def test_valid_table_has_no_issues():
+    assert not issues_of(SIZES, WEIGHTS).any()
+
+
+@pytest.mark.parametrize("code", validation.TABLE_CHECKS)
+def test_table_checks(code):
+    issues = issues_of(*TABLES[code])
+    if code == "zero-mass":
+        # an empty sample retains no mass on any sieve either
+        assert issues[issues].index.tolist() == ["zero-mass", "few-sieves"]
+    else:
+        assert issues[issues].index.tolist() == [code]
+
+
+@pytest.mark.parametrize("sizes, weights", [(SIZES[:-1] + [np.inf], WEIGHTS), (SIZES, WEIGHTS[:-1] + [np.inf]),
+                                            ([-np.inf] + SIZES[1:], WEIGHTS), (SIZES, [-np.inf] + WEIGHTS[1:])],
+                         ids=["inf-size", "inf-weight", "-inf-size", "-inf-weight"])
+def test_infinite_values_are_missing(sizes, weights):
+    assert issues_of(sizes, weights)["missing-values"]
+
+
+@pytest.mark.parametrize("shape", [(1, 0), (3, 0)])
+def test_zero_width_tables(shape):
+    issues = validation.check_tables(np.empty(shape), np.empty(shape))
+    assert len(issues) == shape[0]
+    assert issues["missing-values"].all() and issues["zero-mass"].all()
+    assert validation.is_error(validation.TABLE_CHECKS) and not issues["unsorted-sieves"].any()
+
+
+def test_validate_samples():
+    samples = [(pd.DataFrame({"Grain Sizes [mm]": sizes, "Fraction Mass [g]": weights}), ["sample"])
+               for sizes, weights in [(SIZES, WEIGHTS), TABLES["few-sieves"], TABLES["negative-weights"]]]
+    codes = validation.validate_samples(samples)
+    assert codes == [[], ["few-sieves"], ["negative-weights"]]
+    assert [validation.is_error(sample_codes) for sample_codes in codes] == [False, False, True]
+
+
+def test_collect_samples_reports_file_issues(tmp_path):
+    # the sieving table fills rows 10 to 25 of the second and third column (see config.get_input)
+    table = pd.DataFrame(np.full((25, 6), np.nan), dtype=object)
+    table.iloc[9:, 1] = 125.0 / 2.0 ** np.arange(16)
+    table.iloc[9:, 2] = 10.0
+    table.to_csv(tmp_path / "valid.csv", header=False, index=False)
+    table.iloc[10, 2] = "ten"
+    table.to_csv(tmp_path / "text.csv", header=False, index=False)
+    (tmp_path / "broken.xlsx").write_text("not a workbook")
+
+    valid, report = validation.collect_samples(files=[tmp_path / name for name in ["valid.csv", "text.csv",
+                                                                                    "broken.xlsx"]],
+                                               plan=compile_plan(get_input()))
+    assert [file for file, _, _, _ in valid] == [str(tmp_path / "valid.csv")]
+    issues = dict(zip(report["file"].str.rsplit("/", n=1).str[-1], report["issues"]))
+    assert issues["text.csv"] == "non-numeric"
+    assert issues["broken.xlsx"] == "unreadable"
+
+
+def test_collect_samples_without_samples(tmp_path):
+    # side by side blocks are detected until the grain size column is empty
+    pd.DataFrame(np.full((25, 6), np.nan)).to_csv(tmp_path / "empty.csv", header=False, index=False)
+    dic = dict(get_input(), block_offset=4)
+    valid, report = validation.collect_samples(files=[tmp_path / "empty.csv"], plan=compile_plan(dic))
+    assert valid == [] and report["issues"].tolist() == ["no-samples"]
+    assert report["status"].tolist() == ["quarantined"]
@@ -0,0 +1,53 @@
+""" Tests of the stored global dataframes of the web application sessions
+
+Author: Beatriz Negreiros
+
+"""
+import os
+
+import dash
+import pytest
+
+from sedimentanalyst.app import web_application
+from sedimentanalyst.app.cache import ResultCache
+
+
+@pytest.fixture
+def data(monkeypatch):
+    # fresh in-memory indexes, so that the callbacks read the stored summary
+    for name in ["datasets", "similarity_indexes", "spatial_indexes", "rasters", "preloaded"]:
+        monkeypatch.setattr(web_application, name, ResultCache(max_size=8))
+    return web_application.load_folder(web_application.EXAMPLES_DIR, web_application.default_inputs(),
+                                       patterns=("*.xlsx",))
+
+
+def call(callback, *args):
+    # the callbacks without the dash context (see dash.callback)
+    return callback.__wrapped__(*args)
+
+
+def summary_path(data):
+    return os.path.join(web_application.SUMMARY_DIR, data["file"])
+
+
+def test_deleted_summary_is_rebuilt(data):
+    samples = call(web_application.update_sample_id, 1, data).children[1].value
+    os.remove(summary_path(data))
+
+    for callback in [web_application.update_gsd, web_application.update_diameters]:
+        assert call(callback, data, samples).figure is not None
+    assert call(web_application.update_barchart, data, "d50", samples).figure is not None
+    assert os.path.exists(summary_path(data))
+
+
+def test_expired_summary_prevents_update(data, monkeypatch):
+    monkeypatch.setattr(web_application, "summary_sources", ResultCache(max_size=8))
+    os.remove(summary_path(data))
+    with pytest.raises(dash.exceptions.PreventUpdate):
+        call(web_application.update_gsd, data, None)
+
+
+def test_recently_used_summaries_are_kept(data, monkeypatch):
+    monkeypatch.setattr(web_application, "SUMMARY_FILES", 0)
+    web_application.store_rows([])
+    assert os.path.exists(summary_path(data))